@@ -0,0 +1,45 @@
+"""
+Add image pre-pull tracking columns to challenges
+"""
+
+from sqlalchemy import text, create_engine, inspect
+from app.core.config import settings
+
+# Column -> DDL; image_status holds ChallengeImageStatus names (non-native enum)
+COLUMNS = {
+    "image_status": "VARCHAR(20)",
+    "image_digest": "VARCHAR(100)",
+    "image_pull_progress": "INTEGER NOT NULL DEFAULT 0",
+    "image_pulled_at": "TIMESTAMP",
+    "image_error": "TEXT",
+}
+
+
+def add_columns():
+    """Add the image tracking columns that do not exist yet"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        with engine.connect() as conn:
+            inspector = inspect(engine)
+            cols = {c["name"] for c in inspector.get_columns("challenges")}
+            
+            for name, ddl in COLUMNS.items():
+                if name in cols:
+                    print(f"✅ Column '{name}' already exists in challenges table")
+                    continue
+                if name == "image_pulled_at" and engine.dialect.name == "postgresql":
+                    ddl = "TIMESTAMP WITH TIME ZONE"
+                print(f"Adding {name} column to challenges table...")
+                conn.execute(text(f"ALTER TABLE challenges ADD COLUMN {name} {ddl}"))
+                conn.commit()
+                print(f"✅ Added {name} column")
+            
+            # Existing challenges stay untracked (NULL); the image warmer checks active ones on startup
+            
+    except Exception as e:
+        print(f"❌ Error adding columns: {e}")
+        raise
+
+if __name__ == "__main__":
+    add_columns()
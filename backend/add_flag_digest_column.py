@@ -0,0 +1,61 @@
+"""
+Add flag_digest column to challenges and backfill it from the stored flags
+"""
+
+from sqlalchemy import text, create_engine, inspect
+from app.core.config import settings
+from app.core.security import decrypt_flag, compute_flag_digest, encrypt_flag, rotate_flag
+
+# Every Fernet token starts with the version byte 0x80, which base64-encodes to this
+FERNET_PREFIX = "gAAAAA"
+
+def add_column():
+    """Add flag_digest column to challenges table and backfill digests"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        with engine.connect() as conn:
+            inspector = inspect(engine)
+            cols = [c["name"] for c in inspector.get_columns("challenges")]
+            
+            if "flag_digest" in cols:
+                print("✅ Column 'flag_digest' already exists in challenges table")
+            else:
+                print("Adding flag_digest column to challenges table...")
+                conn.execute(text("ALTER TABLE challenges ADD COLUMN flag_digest VARCHAR(64)"))
+                conn.commit()
+                print("✅ Added flag_digest column")
+            
+            # Backfill digests and re-encrypt with the current primary key; plaintext flags get encrypted
+            rows = conn.execute(text("SELECT id, flag FROM challenges WHERE flag_digest IS NULL")).fetchall()
+            updated, encrypted, skipped = 0, 0, []
+            for challenge_id, stored_flag in rows:
+                try:
+                    plain_flag = decrypt_flag(stored_flag)
+                    new_flag = rotate_flag(stored_flag)
+                except Exception:
+                    if stored_flag.startswith(FERNET_PREFIX):
+                        skipped.append(challenge_id)  # Encrypted with a key that is no longer configured
+                        continue
+                    plain_flag = stored_flag.strip()
+                    new_flag = encrypt_flag(plain_flag)
+                    encrypted += 1
+                conn.execute(
+                    text("UPDATE challenges SET flag = :flag, flag_digest = :digest WHERE id = :id"),
+                    {"flag": new_flag, "digest": compute_flag_digest(plain_flag), "id": challenge_id}
+                )
+                updated += 1
+            conn.commit()
+            
+            print(f"✅ Backfilled flag_digest for {updated} challenge(s) ({encrypted} plaintext flag(s) encrypted)")
+            if skipped:
+                print(f"⚠️ Could not decrypt flags for challenge IDs {skipped}.")
+                print("   They were encrypted with a key missing from FLAG_ENCRYPTION_KEYS; add the key back")
+                print("   and re-run, or set the flag again from the admin panel.")
+            
+    except Exception as e:
+        print(f"❌ Error adding column: {e}")
+        raise
+
+if __name__ == "__main__":
+    add_column()
@@ -0,0 +1,35 @@
+"""
+Add the node column to instances (Docker node an instance's container runs on)
+"""
+
+from sqlalchemy import text, create_engine, inspect
+from app.core.config import settings
+
+def add_column():
+    """Add instances.node and its index"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        with engine.connect() as conn:
+            inspector = inspect(engine)
+            cols = [c["name"] for c in inspector.get_columns("instances")]
+            
+            if "node" in cols:
+                print("✅ Column 'node' already exists in instances table")
+            else:
+                print("Adding node column to instances table...")
+                conn.execute(text("ALTER TABLE instances ADD COLUMN node VARCHAR(64)"))
+                conn.commit()
+                print("✅ Added node column")
+            
+            # Existing instances stay NULL, which means the default node
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_instances_node ON instances (node)"))
+            conn.commit()
+            print("✅ Index ix_instances_node is in place")
+            
+    except Exception as e:
+        print(f"❌ Error adding column: {e}")
+        raise
+
+if __name__ == "__main__":
+    add_column()
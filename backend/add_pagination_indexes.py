@@ -0,0 +1,57 @@
+"""
+Add the composite indexes used by keyset (cursor) pagination on list endpoints
+"""
+
+from sqlalchemy import text, create_engine, inspect
+from app.core.config import settings
+
+# name -> (table, columns); a B-tree index serves both ASC and DESC scans
+INDEXES = {
+    "ix_submissions_user_submitted_id": ("submissions", "user_id, submitted_at, id"),
+    "ix_submissions_challenge_submitted_id": ("submissions", "challenge_id, submitted_at, id"),
+    "ix_submissions_submitted_id": ("submissions", "submitted_at, id"),
+    "ix_logs_created_id": ("logs", "created_at, id"),
+    "ix_logs_user_created_id": ("logs", "user_id, created_at, id"),
+    "ix_member_requests_created_id": ("member_requests", "created_at, id"),
+    "ix_member_requests_status_created_id": ("member_requests", "status, created_at, id"),
+}
+
+# SQLite sorts datetime keys by this expression (app/utils/pagination.py), which the plain indexes cannot serve
+SQLITE_DATETIME = "strftime('%Y-%m-%d %H:%M:%f', {})"
+SQLITE_INDEXES = {
+    "ix_submissions_user_submitted_id_sqlite": ("submissions", f"user_id, {SQLITE_DATETIME.format('submitted_at')}, id"),
+    "ix_submissions_challenge_submitted_id_sqlite": ("submissions", f"challenge_id, {SQLITE_DATETIME.format('submitted_at')}, id"),
+    "ix_submissions_submitted_id_sqlite": ("submissions", f"{SQLITE_DATETIME.format('submitted_at')}, id"),
+    "ix_logs_created_id_sqlite": ("logs", f"{SQLITE_DATETIME.format('created_at')}, id"),
+    "ix_logs_user_created_id_sqlite": ("logs", f"user_id, {SQLITE_DATETIME.format('created_at')}, id"),
+    "ix_member_requests_created_id_sqlite": ("member_requests", f"{SQLITE_DATETIME.format('created_at')}, id"),
+    "ix_member_requests_status_created_id_sqlite": ("member_requests", f"status, {SQLITE_DATETIME.format('created_at')}, id"),
+}
+
+
+def add_indexes():
+    """Create the pagination indexes that do not exist yet"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        tables = set(inspect(engine).get_table_names())
+        indexes = dict(INDEXES)
+        if engine.dialect.name == "sqlite":
+            indexes.update(SQLITE_INDEXES)
+        
+        with engine.connect() as conn:
+            for name, (table, columns) in indexes.items():
+                if table not in tables:
+                    print(f"⏭️  Table '{table}' does not exist, skipping {name}")
+                    continue
+                print(f"Creating {name} on {table} ({columns})...")
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+                conn.commit()
+            
+            print("✅ Pagination indexes are in place")
+            
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
+        raise
+
+if __name__ == "__main__":
+    add_indexes()
@@ -0,0 +1,53 @@
+"""
+Add per-challenge resource profile columns, per-instance capacity reservations
+and the QUEUED instance status used by admission control
+"""
+
+from sqlalchemy import text, create_engine, inspect
+from app.core.config import settings
+
+# table -> [(column, DDL)]
+COLUMNS = {
+    "challenges": [
+        ("cpu_millicores", "INTEGER"),
+        ("memory_limit_mb", "INTEGER"),
+        ("pids_limit", "INTEGER"),
+    ],
+    "instances": [
+        ("reserved_cpu_millicores", "INTEGER NOT NULL DEFAULT 0"),
+        ("reserved_memory_mb", "INTEGER NOT NULL DEFAULT 0"),
+    ],
+}
+
+
+def add_columns():
+    """Add the missing columns and the QUEUED enum value"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        inspector = inspect(engine)
+        
+        with engine.connect() as conn:
+            for table, columns in COLUMNS.items():
+                existing = {c["name"] for c in inspector.get_columns(table)}
+                for name, ddl in columns:
+                    if name in existing:
+                        print(f"✅ Column '{name}' already exists in {table} table")
+                        continue
+                    print(f"Adding {name} column to {table} table...")
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                    conn.commit()
+                    print(f"✅ Added {name} column")
+            
+            # Enum columns store member names; SQLite keeps them as plain VARCHAR
+            if engine.dialect.name == "postgresql":
+                print("Adding QUEUED to instancestatus enum...")
+                conn.execute(text("ALTER TYPE instancestatus ADD VALUE IF NOT EXISTS 'QUEUED'"))
+                conn.commit()
+                print("✅ instancestatus includes QUEUED")
+            
+    except Exception as e:
+        print(f"❌ Error adding columns: {e}")
+        raise
+
+if __name__ == "__main__":
+    add_columns()
@@ -0,0 +1,49 @@
+"""
+Add the unique partial index that allows one correct submission per user and challenge
+"""
+
+from sqlalchemy import text, create_engine
+from app.core.config import settings
+
+INDEX_NAME = "uq_submissions_user_challenge_correct"
+
+
+def add_index():
+    """Create uq_submissions_user_challenge_correct on submissions"""
+    try:
+        engine = create_engine(settings.DATABASE_URL)
+        
+        with engine.connect() as conn:
+            # Existing duplicate solves would make the index creation fail
+            duplicates_query = text("""
+                SELECT user_id, challenge_id, COUNT(*) AS solves
+                FROM submissions
+                WHERE status = 'CORRECT'
+                GROUP BY user_id, challenge_id
+                HAVING COUNT(*) > 1
+            """)
+            duplicates = conn.execute(duplicates_query).fetchall()
+            
+            if duplicates:
+                print(f"❌ Found {len(duplicates)} user/challenge pairs with more than one correct submission:")
+                for user_id, challenge_id, solves in duplicates:
+                    print(f"   user_id={user_id} challenge_id={challenge_id} solves={solves}")
+                print("Resolve these rows before creating the index.")
+                return
+            
+            print(f"Creating {INDEX_NAME} on submissions...")
+            conn.execute(text(f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS {INDEX_NAME}
+                ON submissions (user_id, challenge_id)
+                WHERE status = 'CORRECT'
+            """))
+            conn.commit()
+            
+            print(f"✅ Index {INDEX_NAME} is in place")
+            
+    except Exception as e:
+        print(f"❌ Error creating index: {e}")
+        raise
+
+if __name__ == "__main__":
+    add_index()
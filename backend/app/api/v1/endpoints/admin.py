@@ -2,21 +2,33 @@
 XploitRUM CTF Platform - Admin Endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 
-from app.core.database import get_db
-from app.core.auth import get_current_admin_user
+from app.core.database import get_db, get_async_db
+from app.core.auth import get_current_admin_user, get_current_admin_principal
+from app.core.principal_cache import Principal, principal_cache
 from app.models.user import User, UserStatus
-from app.models.challenge import Challenge, ChallengeStatus
-from app.models.instance import Instance, InstanceStatus
-from app.models.submission import Submission, SubmissionStatus
+from app.models.challenge import Challenge
+from app.models.submission import Submission
 from app.models.log import Log, LogLevel, LogEventType
 from app.core.exceptions import NotFoundError, ValidationError
+from app.services.scoreboard_service import scoreboard_service
+from app.services.orchestrator_service import instance_orchestrator
+from app.services.container_state_service import container_states
+from app.services.metrics_collector_service import container_metrics
+from app.services.admission_service import admission_controller
+from app.services.image_warmer_service import image_warmer
+from app.services.admin_service import admin_service
+from app.services.password_service import password_service
+from app.services.counter_service import platform_counters
+from app.services.runtime_settings_service import runtime_settings
+from app.utils.pagination import paginate_keyset, split_page, set_next_cursor
 
 router = APIRouter()
 
@@ -30,6 +42,9 @@ class DashboardStats(BaseModel):
     running_instances: int
     total_submissions: int
     correct_submissions: int
+    instance_cpu_percent: int = 0
+    instance_memory_mb: int = 0
+    top_resource_instances: List[Dict[str, Any]] = []
 
 
 class UserManagement(BaseModel):
@@ -53,45 +68,25 @@ class SystemLog(BaseModel):
 
 
 @router.get("/dashboard", response_model=DashboardStats)
-async def get_dashboard_stats(
-    current_user: User = Depends(get_current_admin_user),
+def get_dashboard_stats(
+    current_user: Principal = Depends(get_current_admin_principal),
     db: Session = Depends(get_db)
 ):
     """Get admin dashboard statistics"""
     try:
-        # User statistics
-        total_users = await db.execute(select(func.count(User.id)))
-        active_users = await db.execute(
-            select(func.count(User.id)).where(User.status == UserStatus.ACTIVE)
-        )
-        
-        # Challenge statistics
-        total_challenges = await db.execute(select(func.count(Challenge.id)))
-        active_challenges = await db.execute(
-            select(func.count(Challenge.id)).where(Challenge.status == ChallengeStatus.ACTIVE)
-        )
-        
-        # Instance statistics
-        total_instances = await db.execute(select(func.count(Instance.id)))
-        running_instances = await db.execute(
-            select(func.count(Instance.id)).where(Instance.status == InstanceStatus.RUNNING)
-        )
-        
-        # Submission statistics
-        total_submissions = await db.execute(select(func.count(Submission.id)))
-        correct_submissions = await db.execute(
-            select(func.count(Submission.id)).where(Submission.status == SubmissionStatus.CORRECT)
-        )
-        
+        stats = admin_service.get_dashboard_stats(db)
         return DashboardStats(
-            total_users=total_users.scalar(),
-            active_users=active_users.scalar(),
-            total_challenges=total_challenges.scalar(),
-            active_challenges=active_challenges.scalar(),
-            total_instances=total_instances.scalar(),
-            running_instances=running_instances.scalar(),
-            total_submissions=total_submissions.scalar(),
-            correct_submissions=correct_submissions.scalar()
+            total_users=stats["users"]["total"],
+            active_users=stats["users"]["active"],
+            total_challenges=stats["challenges"]["total"],
+            active_challenges=stats["challenges"]["active"],
+            total_instances=stats["instances"]["total"],
+            running_instances=stats["instances"]["running"],
+            total_submissions=stats["submissions"]["total"],
+            correct_submissions=stats["submissions"]["correct"],
+            instance_cpu_percent=stats["instances"]["cpu_percent"],
+            instance_memory_mb=stats["instances"]["memory_mb"],
+            top_resource_instances=stats["top_resource_instances"]
         )
         
     except Exception as e:
@@ -152,6 +147,7 @@ def create_user(
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
+        scoreboard_service.upsert(new_user)
         
         return UserManagement(
             id=new_user.id,
@@ -166,6 +162,8 @@ def create_user(
         
     except ValidationError:
         raise
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -226,6 +224,68 @@ def get_all_users(
             detail="Failed to get users"
         )
 
+@router.get("/challenges")
+def get_challenge_management(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: Session = Depends(get_db)
+):
+    """Challenges with attempts, solve rate and running instances (admin only).
+    Sort by created_at, solve_rate or active_instances; pass next_cursor back as cursor for the next page."""
+    return admin_service.get_challenge_management_data(
+        db, limit=limit, cursor=cursor, sort=sort, descending=order == "desc"
+    )
+
+
+@router.get("/challenges/images")
+def get_challenge_images(
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: Session = Depends(get_db)
+):
+    """Pre-pull state of every challenge image and the image warmer's counters (admin only)"""
+    challenges = db.query(Challenge).filter(Challenge.docker_image.isnot(None)).order_by(Challenge.id).all()
+    return {
+        "warmer": image_warmer.get_stats(db),
+        "challenges": [
+            {
+                "id": challenge.id,
+                "title": challenge.title,
+                "status": challenge.status.value,
+                "docker_image": challenge.docker_image,
+                "image_status": challenge.image_status.value if challenge.image_status else None,
+                "image_pull_progress": challenge.image_pull_progress,
+                "image_digest": challenge.image_digest,
+                "image_pulled_at": challenge.image_pulled_at.isoformat() if challenge.image_pulled_at else None,
+                "image_error": challenge.image_error,
+            }
+            for challenge in challenges
+        ],
+    }
+
+
+@router.post("/challenges/{challenge_id}/image/pull")
+def pull_challenge_image(
+    challenge_id: int,
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: Session = Depends(get_db)
+):
+    """Pull (or re-pull) a challenge's image in the background now (admin only)"""
+    challenge = db.get(Challenge, challenge_id)
+    if not challenge:
+        raise NotFoundError("Challenge not found")
+    if not image_warmer.request_pull(db, challenge):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Nothing to pull: the challenge has no image or the image warmer is disabled"
+        )
+    db.commit()
+    image_warmer.wake()
+    return {"message": "Image pull requested", "image_status": challenge.image_status.value}
+
+
 @router.put("/users/{user_id}/status")
 def update_user_status(
     user_id: int,
@@ -252,6 +312,8 @@ def update_user_status(
         user.status = status_enum
         db.commit()
         db.refresh(user)
+        scoreboard_service.upsert(user)
+        principal_cache.invalidate_user(user.id)
         
         return {"message": f"User status updated to {status_data.status}"}
         
@@ -292,6 +354,8 @@ def update_user_role(
         user.role = UserRole(role_data.role)
         db.commit()
         db.refresh(user)
+        scoreboard_service.upsert(user)
+        principal_cache.invalidate_user(user.id)
         
         return {"message": f"User role updated to {role_data.role}"}
         
@@ -323,6 +387,8 @@ def delete_user(
         # Delete the user (cascade will handle related records)
         db.delete(user)
         db.commit()
+        scoreboard_service.remove(user_id)
+        principal_cache.invalidate_user(user_id)
         
         return {"message": f"User {user.username} has been deleted successfully"}
         
@@ -338,15 +404,17 @@ def delete_user(
 
 @router.get("/logs", response_model=List[SystemLog])
 async def get_system_logs(
-    limit: int = 100,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     level: Optional[LogLevel] = None,
     event_type: Optional[LogEventType] = None,
     user_id: Optional[int] = None,
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get system logs (admin only)"""
+    """Get system logs, newest first (admin only). The next page's cursor is in the X-Next-Cursor header."""
     try:
         query = select(Log)
         
@@ -362,10 +430,11 @@ async def get_system_logs(
         if filters:
             query = query.where(and_(*filters))
         
-        query = query.order_by(Log.created_at.desc()).offset(offset).limit(limit)
+        query = paginate_keyset(query, (Log.created_at, Log.id), limit, cursor, offset=offset)
         
         result = await db.execute(query)
-        logs = result.scalars().all()
+        logs, next_cursor = split_page(result.scalars().all(), limit, lambda log: [log.created_at, log.id])
+        set_next_cursor(response, next_cursor)
         
         return [
             SystemLog(
@@ -379,6 +448,8 @@ async def get_system_logs(
             for log in logs
         ]
         
+    except ValidationError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -387,67 +458,78 @@ async def get_system_logs(
 
 
 @router.post("/instances/cleanup")
-async def cleanup_expired_instances(
+def cleanup_expired_instances(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Cleanup expired instances (admin only)"""
+    """Queue teardown of expired instances now (admin only); the expiry scheduler does this automatically"""
     try:
-        from app.services.docker_service import DockerService
-        
-        # Get expired instances
-        expired_instances = await db.execute(
-            select(Instance).where(
-                and_(
-                    Instance.status.in_([InstanceStatus.RUNNING, InstanceStatus.STARTING]),
-                    Instance.expires_at < datetime.utcnow()
-                )
-            )
-        )
-        instances = expired_instances.scalars().all()
-        
-        docker_service = DockerService()
-        cleaned_count = 0
-        
-        for instance in instances:
-            try:
-                # Stop Docker container
-                if instance.container_id:
-                    await docker_service.stop_container(instance.container_id)
-                
-                # Update instance status
-                instance.status = InstanceStatus.EXPIRED
-                instance.stopped_at = datetime.utcnow()
-                cleaned_count += 1
-                
-            except Exception as e:
-                # Log error but continue with other instances
-                pass
-        
-        await db.commit()
-        
-        return {
-            "message": f"Cleaned up {cleaned_count} expired instances",
-            "cleaned_count": cleaned_count
-        }
-        
+        return admin_service.cleanup_expired_instances(db)
     except Exception as e:
-        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to cleanup instances"
         )
 
 
+@router.get("/instances/metrics")
+def get_instance_orchestration_metrics(
+    current_user: Principal = Depends(get_current_admin_principal)
+):
+    """Deploy queue depth, warm pool hit rate / claim latency, container state cache and metrics collector (admin only)"""
+    stats = instance_orchestrator.get_stats()
+    stats["container_states"] = container_states.get_metrics()
+    stats["resource_metrics"] = container_metrics.get_metrics()
+    return stats
+
+
+@router.get("/instances/capacity")
+def get_instance_capacity(
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: Session = Depends(get_db)
+):
+    """Host capacity, committed reservations and admission queue (admin only)"""
+    return admission_controller.get_stats(db)
+
+
+@router.post("/instances/queue/drain")
+def drain_instance_queue(
+    current_user: Principal = Depends(get_current_admin_principal)
+):
+    """Admit queued deploys that fit now instead of waiting for the next poll (admin only)"""
+    return {"admitted": admission_controller.drain_queue()}
+
+
+@router.get("/password-hashing/metrics")
+def get_password_hashing_metrics(
+    current_user: Principal = Depends(get_current_admin_principal)
+):
+    """bcrypt pool queue depth and timings (admin only)"""
+    return password_service.get_metrics()
+
+
+@router.post("/counters/reconcile")
+def reconcile_platform_counters(
+    current_user: Principal = Depends(get_current_admin_principal)
+):
+    """Rebuild platform counters from the source tables now (admin only); also runs periodically"""
+    try:
+        return platform_counters.reconcile()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reconcile counters"
+        )
+
+
 @router.get("/analytics")
 async def get_analytics_data(
     days: int = 30,
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get analytics data (admin only)"""
     try:
-        from datetime import datetime, timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
         # User registrations over time
@@ -494,62 +576,13 @@ class RegistrationSetting(BaseModel):
     enabled: bool
 
 
-def _get_settings_path():
-    """Get the path to settings.json file"""
-    from pathlib import Path
-    # Path from backend/app/api/v1/endpoints/admin.py to backend/settings.json
-    # __file__ = backend/app/api/v1/endpoints/admin.py
-    # We need to go up 5 levels: endpoints -> v1 -> api -> app -> backend -> settings.json
-    return Path(__file__).parent.parent.parent.parent.parent / "settings.json"
-
-
-def _read_registration_setting() -> bool:
-    """Read registration setting from settings.json"""
-    import json
-    settings_path = _get_settings_path()
-    
-    if settings_path.exists():
-        try:
-            with open(settings_path, 'r') as f:
-                settings = json.load(f)
-            return settings.get("registration_enabled", True)
-        except (json.JSONDecodeError, IOError):
-            return True  # Default to enabled if file is corrupted
-    else:
-        return True  # Default to enabled if file doesn't exist
-
-
-def _write_registration_setting(enabled: bool) -> None:
-    """Write registration setting to settings.json"""
-    import json
-    settings_path = _get_settings_path()
-    
-    # Read existing settings or create new dict
-    if settings_path.exists():
-        try:
-            with open(settings_path, 'r') as f:
-                settings = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            settings = {}
-    else:
-        settings = {}
-    
-    # Update registration setting
-    settings["registration_enabled"] = enabled
-    
-    # Write back to file
-    with open(settings_path, 'w') as f:
-        json.dump(settings, f, indent=2)
-
-
 @router.get("/settings/registration", response_model=RegistrationSetting)
 def get_registration_setting(
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_admin_principal)
 ):
     """Get registration setting (admin only)"""
     try:
-        enabled = _read_registration_setting()
+        enabled = runtime_settings.get("registration_enabled")
         return RegistrationSetting(enabled=enabled)
     except Exception as e:
         raise HTTPException(
@@ -563,13 +596,12 @@ def get_registration_setting(
 @router.put("/settings/registration", response_model=RegistrationSetting)
 def update_registration_setting(
     setting_data: RegistrationSetting,
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_admin_principal)
 ):
     """Update registration setting (admin only)"""
     try:
-        _write_registration_setting(setting_data.enabled)
-        return RegistrationSetting(enabled=setting_data.enabled)
+        values = runtime_settings.update(registration_enabled=setting_data.enabled)
+        return RegistrationSetting(enabled=values["registration_enabled"])
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
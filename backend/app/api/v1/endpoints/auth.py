@@ -24,7 +24,10 @@ from app.core.auth import (
 from app.models.user import User
 from app.models.session import Session
 from app.core.config import settings
+from app.core.session_activity import session_activity
+from app.core.principal_cache import principal_cache
 from app.core.exceptions import AuthenticationError, ValidationError
+from app.services.scoreboard_service import scoreboard_service
 from sqlalchemy import select, delete
 import uuid
 
@@ -112,6 +115,8 @@ def login(
     except AuthenticationError as e:
         print(f"AuthenticationError: {e}")  # Debug
         raise
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Login exception: {e}")  # Debug
         import traceback
@@ -152,6 +157,7 @@ def register(
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
+        scoreboard_service.upsert(new_user)
         
         return {
             "message": "User registered successfully",
@@ -161,6 +167,8 @@ def register(
         
     except ValidationError:
         raise
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -188,14 +196,13 @@ def refresh_token(
         if not session:
             raise AuthenticationError("Session expired")
         if _session_expired(session):
+            session_activity.forget(session_id)
+            principal_cache.invalidate_session(session_id)
             db.execute(delete(Session).where(Session.id == session_id))
             db.commit()
             raise AuthenticationError("Session expired")
 
-        from app.core.auth import _utc_now
-        now = _utc_now()
-        session.last_activity_at = now.replace(tzinfo=None) if now.tzinfo else now
-        db.commit()
+        session_activity.touch(session_id, session.last_activity_at)
 
         user = db.get(User, int(user_id))
         if not user or not user.is_active:
@@ -233,6 +240,8 @@ def logout(
             payload = verify_token(token)
             session_id = payload.get("session_id")
             if session_id:
+                session_activity.forget(session_id)
+                principal_cache.invalidate_session(session_id)
                 db.execute(delete(Session).where(Session.id == session_id))
                 db.commit()
         except Exception:
@@ -242,7 +251,8 @@ def logout(
 
 @router.get("/me")
 def get_current_user_info(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Get current user information and session timeout hints for client-side warning."""
     return {
@@ -252,7 +262,7 @@ def get_current_user_info(
         "full_name": current_user.full_name,
         "role": current_user.role.value,
         "score": current_user.score,
-        "rank": current_user.rank,
+        "rank": scoreboard_service.get_rank(db, current_user.id),
         "created_at": current_user.created_at.isoformat() if current_user.created_at else None,
         "must_change_password": current_user.must_change_password if hasattr(current_user, 'must_change_password') else False,
         "idle_timeout_seconds": settings.SESSION_IDLE_TIMEOUT_MINUTES * 60,
@@ -337,7 +347,7 @@ def update_profile(
             "full_name": current_user.full_name,
             "role": current_user.role.value,
             "score": current_user.score,
-            "rank": current_user.rank,
+            "rank": scoreboard_service.get_rank(db, current_user.id),
             "created_at": current_user.created_at.isoformat() if current_user.created_at else None,
             "must_change_password": current_user.must_change_password if hasattr(current_user, 'must_change_password') else False
         }
@@ -381,11 +391,14 @@ def change_password(
         
         db.commit()
         db.refresh(current_user)
+        principal_cache.invalidate_user(current_user.id)
         
         return {"message": "Password changed successfully"}
         
     except ValidationError:
         raise
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -14,6 +14,7 @@ from app.core.auth import get_current_user, get_current_admin_user
 from app.models.user import User
 from app.models.challenge import Challenge, ChallengeCategory, ChallengeDifficulty, ChallengeStatus
 from app.core.exceptions import NotFoundError, ValidationError
+from app.services.image_warmer_service import image_warmer
 
 router = APIRouter()
 
@@ -51,6 +52,9 @@ class ChallengeCreate(BaseModel):
     docker_volumes: Optional[List[dict]] = None
     max_instances: int = 10
     instance_timeout: int = 3600
+    cpu_millicores: Optional[int] = None  # None = platform default
+    memory_limit_mb: Optional[int] = None
+    pids_limit: Optional[int] = None
     max_solves: Optional[int] = None
     hints: Optional[List[dict]] = None
     tags: Optional[List[str]] = None
@@ -71,6 +75,9 @@ class ChallengeUpdate(BaseModel):
     docker_volumes: Optional[List[dict]] = None
     max_instances: Optional[int] = None
     instance_timeout: Optional[int] = None
+    cpu_millicores: Optional[int] = None
+    memory_limit_mb: Optional[int] = None
+    pids_limit: Optional[int] = None
     max_solves: Optional[int] = None
     hints: Optional[List[dict]] = None
     tags: Optional[List[str]] = None
@@ -246,7 +253,7 @@ def create_challenge(
     """Create new challenge (admin only)"""
     try:
         # Encrypt flag
-        from app.core.security import encrypt_flag
+        from app.core.security import encrypt_flag, compute_flag_digest
         encrypted_flag = encrypt_flag(challenge_data.flag)
         
         new_challenge = Challenge(
@@ -256,6 +263,7 @@ def create_challenge(
             difficulty=challenge_data.difficulty,
             points=challenge_data.points,
             flag=encrypted_flag,
+            flag_digest=compute_flag_digest(challenge_data.flag),
             author=challenge_data.author,
             docker_image=challenge_data.docker_image,
             docker_compose_file=challenge_data.docker_compose_file,
@@ -264,6 +272,9 @@ def create_challenge(
             docker_volumes=challenge_data.docker_volumes,
             max_instances=challenge_data.max_instances,
             instance_timeout=challenge_data.instance_timeout,
+            cpu_millicores=challenge_data.cpu_millicores,
+            memory_limit_mb=challenge_data.memory_limit_mb,
+            pids_limit=challenge_data.pids_limit,
             max_solves=challenge_data.max_solves,
             hints=challenge_data.hints,
             tags=challenge_data.tags,
@@ -271,10 +282,13 @@ def create_challenge(
             is_premium=challenge_data.is_premium,
             status=ChallengeStatus.ACTIVE
         )
+        pull = image_warmer.request_pull(db, new_challenge)
         
         db.add(new_challenge)
         db.commit()
         db.refresh(new_challenge)
+        if pull:
+            image_warmer.wake()
         
         return ChallengeResponse(
             id=new_challenge.id,
@@ -316,11 +330,19 @@ def update_challenge(
             raise NotFoundError("Challenge not found")
         
         # Update fields
+        was = (challenge.status, challenge.docker_image)
         for field, value in challenge_update.dict(exclude_unset=True).items():
             setattr(challenge, field, value)
         
+        # (Re)activated or new image: pre-pull it
+        pull = False
+        if challenge.status == ChallengeStatus.ACTIVE and (challenge.status, challenge.docker_image) != was:
+            pull = image_warmer.request_pull(db, challenge)
+        
         db.commit()
         db.refresh(challenge)
+        if pull:
+            image_warmer.wake()
         
         return ChallengeResponse(
             id=challenge.id,
@@ -371,9 +393,15 @@ def update_challenge_status(
                 detail="Invalid status. Must be ACTIVE, INACTIVE, or DRAFT"
             )
         
+        was_active = challenge.status == ChallengeStatus.ACTIVE
         challenge.status = new_status
+        pull = False
+        if new_status == "ACTIVE" and not was_active:
+            pull = image_warmer.request_pull(db, challenge)
         db.commit()
         db.refresh(challenge)
+        if pull:
+            image_warmer.wake()
         
         return ChallengeResponse(
             id=challenge.id,
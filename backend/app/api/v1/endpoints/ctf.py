@@ -10,7 +10,11 @@ from pydantic import BaseModel
 
 from app.core.database import get_db
 from app.services.ctf_service import ctf_service
-from app.core.auth import get_current_active_user, get_current_user_optional
+from app.services.scoreboard_service import scoreboard_service
+from app.services.orchestrator_service import instance_orchestrator
+from app.services.admission_service import admission_controller
+from app.core.auth import get_current_active_user, get_current_active_principal, get_current_user_optional
+from app.core.principal_cache import Principal
 from app.models.user import User
 from app.models.challenge import Challenge, ChallengeCategory, ChallengeDifficulty
 from app.models.submission import Submission
@@ -51,6 +55,8 @@ class InstanceResponse(BaseModel):
     instance_url: Optional[str] = None
     time_remaining: Optional[int] = None
     status_details: Optional[str] = None
+    queue_position: Optional[int] = None  # Place in the admission queue while QUEUED
+    host: Optional[str] = None  # Docker node publishing the ports; None = the platform host
 
 class FlagSubmission(BaseModel):
     challenge_id: int
@@ -67,11 +73,11 @@ class LeaderboardEntry(BaseModel):
     avatar_url: Optional[str]
 
 @router.get("/challenges", response_model=List[ChallengeResponse])
-async def get_challenges(
+def get_challenges(
     category: Optional[ChallengeCategory] = Query(None, description="Filter by category"),
     difficulty: Optional[ChallengeDifficulty] = Query(None, description="Filter by difficulty"),
     solved_only: Optional[bool] = Query(None, description="Show only solved challenges"),
-    current_user: User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_principal),
     db: Session = Depends(get_db)
 ):
     """Get all available challenges"""
@@ -93,9 +99,9 @@ async def get_challenges(
     return challenges
 
 @router.get("/challenges/{challenge_id}", response_model=ChallengeResponse)
-async def get_challenge(
+def get_challenge(
     challenge_id: int,
-    current_user: User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_principal),
     db: Session = Depends(get_db)
 ):
     """Get specific challenge details"""
@@ -106,18 +112,13 @@ async def get_challenge(
             detail="Challenge not found"
         )
     
-    # Add solve status
-    existing_submission = db.query(Submission).filter(
-        Submission.user_id == current_user.id,
-        Submission.challenge_id == challenge_id,
-        Submission.status == "correct"
-    ).first()
-    challenge.is_solved = existing_submission is not None
+    # Add solve and instance status
+    ctf_service.annotate_solve_state(db, current_user, [challenge])
     
     return challenge
 
 @router.post("/challenges/{challenge_id}/deploy")
-async def deploy_challenge(
+def deploy_challenge(
     challenge_id: int,
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
@@ -166,7 +167,7 @@ async def deploy_challenge(
     return ctf_service.deploy_challenge_instance(db, current_user, challenge_id)
 
 @router.post("/challenges/{challenge_id}/stop")
-async def stop_challenge_instance(
+def stop_challenge_instance(
     challenge_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -176,7 +177,7 @@ async def stop_challenge_instance(
     instance = db.query(Instance).filter(
         Instance.user_id == current_user.id,
         Instance.challenge_id == challenge_id,
-        Instance.status == InstanceStatus.RUNNING
+        Instance.status.in_([InstanceStatus.QUEUED, InstanceStatus.RUNNING])
     ).first()
     
     if not instance:
@@ -188,7 +189,7 @@ async def stop_challenge_instance(
     return ctf_service.stop_challenge_instance(db, current_user, instance.id)
 
 @router.post("/challenges/{challenge_id}/submit")
-async def submit_flag(
+def submit_flag(
     challenge_id: int,
     flag_submission: FlagSubmission,
     current_user: User = Depends(get_current_active_user),
@@ -198,15 +199,15 @@ async def submit_flag(
     return ctf_service.submit_flag(db, current_user, challenge_id, flag_submission.flag)
 
 @router.get("/instances", response_model=List[InstanceResponse])
-async def get_user_instances(
-    current_user: User = Depends(get_current_active_user),
+def get_user_instances(
+    current_user: Principal = Depends(get_current_active_principal),
     db: Session = Depends(get_db)
 ):
     """Get user's challenge instances"""
     return ctf_service.get_user_instances(db, current_user)
 
 @router.get("/instances/{instance_id}", response_model=InstanceResponse)
-async def get_instance(
+def get_instance(
     instance_id: int,
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
@@ -261,11 +262,13 @@ async def get_instance(
         ports=instance.container_ports,
         ip_address=instance.container_ip,
         instance_url=instance.instance_url,
-        time_remaining=time_remaining
+        time_remaining=time_remaining,
+        queue_position=admission_controller.queue_position(db, instance.id),
+        host=instance_orchestrator.docker_service.cluster.public_host(instance.node)
     )
 
 @router.post("/instances/{instance_id}/stop")
-async def stop_instance_by_id(
+def stop_instance_by_id(
     instance_id: int,
     current_user: Optional[User] = Depends(get_current_user_optional),
     db: Session = Depends(get_db)
@@ -283,22 +286,20 @@ async def stop_instance_by_id(
     if current_user:
         return ctf_service.stop_challenge_instance(db, current_user, instance_id)
     else:
-        # For anonymous users, just stop the container
-        from app.services.docker_service import DockerService
-        docker_service = DockerService()
-        if instance.container_id and docker_service.is_available:
-            await docker_service.stop_container(instance.container_id)
-        
-        # Update instance status
-        instance.status = InstanceStatus.STOPPED
-        from datetime import datetime
-        instance.stopped_at = datetime.utcnow()
-        db.commit()
+        # For anonymous users, queue the container removal directly
+        if instance.status == InstanceStatus.QUEUED and admission_controller.cancel(db, instance):
+            return {"message": "Queued deploy cancelled", "instance_id": instance.id, "status": InstanceStatus.STOPPED.value}
+        if instance.status not in [InstanceStatus.STARTING, InstanceStatus.RUNNING]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Instance is not running"
+            )
+        instance_orchestrator.enqueue_stop(instance.id)
         
-        return {"message": "Instance stopped successfully"}
+        return {"message": "Instance stop requested", "instance_id": instance.id, "status": "stopping"}
 
 @router.delete("/instances/{instance_id}")
-async def stop_instance(
+def stop_instance(
     instance_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -307,15 +308,24 @@ async def stop_instance(
     return ctf_service.stop_challenge_instance(db, current_user, instance_id)
 
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(
+def get_leaderboard(
     limit: int = Query(100, ge=1, le=1000, description="Number of entries to return"),
     db: Session = Depends(get_db)
 ):
     """Get leaderboard"""
     return ctf_service.get_leaderboard(db, limit)
 
+@router.get("/leaderboard/around-me", response_model=List[LeaderboardEntry])
+def get_leaderboard_around_me(
+    radius: int = Query(5, ge=0, le=50, description="Entries to show above and below you"),
+    current_user: Principal = Depends(get_current_active_principal),
+    db: Session = Depends(get_db)
+):
+    """Get the leaderboard slice around the current user"""
+    return scoreboard_service.get_around(db, current_user.id, radius)
+
 @router.get("/stats")
-async def get_user_stats(
+def get_user_stats(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -324,7 +334,7 @@ async def get_user_stats(
         "total_score": current_user.score,
         "total_solves": current_user.total_solves,
         "total_attempts": current_user.total_attempts,
-        "rank": current_user.rank,
+        "rank": scoreboard_service.get_rank(db, current_user.id),
         "solve_rate": 0,
         "challenges_by_category": {},
         "challenges_by_difficulty": {}
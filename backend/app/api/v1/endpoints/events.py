@@ -89,7 +89,7 @@ class EventRegistrationData(BaseModel):
     year_of_study: str
 
 @router.get("", response_model=List[EventResponse])
-async def get_events(
+def get_events(
     event_type: Optional[EventType] = Query(None, description="Filter by event type"),
     status: Optional[EventStatus] = Query(None, description="Filter by status"),
     featured_only: Optional[bool] = Query(None, description="Show only featured events"),
@@ -156,7 +156,7 @@ async def get_events(
     ]
 
 @router.get("/{event_identifier}", response_model=EventResponse)
-async def get_event(
+def get_event(
     event_identifier: str,
     db: Session = Depends(get_db)
 ):
@@ -198,7 +198,7 @@ async def get_event(
     }
 
 @router.post("")
-async def create_event(
+def create_event(
     event_data: EventCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -242,7 +242,7 @@ async def create_event(
         )
 
 @router.put("/{event_id}", response_model=EventResponse)
-async def update_event(
+def update_event(
     event_id: int,
     event_data: EventUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -283,7 +283,7 @@ async def update_event(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.delete("/{event_id}")
-async def delete_event(
+def delete_event(
     event_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -301,7 +301,7 @@ async def delete_event(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.post("/{event_id}/register")
-async def register_for_event(
+def register_for_event(
     event_id: int,
     registration_data: EventRegistrationData,
     db: Session = Depends(get_db)
@@ -348,7 +348,7 @@ async def register_for_event(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.delete("/{event_id}/unregister")
-async def unregister_from_event(
+def unregister_from_event(
     event_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -364,7 +364,7 @@ async def unregister_from_event(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.get("/{event_id}/registrations")
-async def get_event_registrations(
+def get_event_registrations(
     event_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -405,7 +405,7 @@ async def get_event_registrations(
     ]
 
 @router.get("/user/registrations")
-async def get_user_registrations(
+def get_user_registrations(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -425,7 +425,7 @@ async def get_user_registrations(
     ]
 
 @router.get("/statistics")
-async def get_event_statistics(
+def get_event_statistics(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
@@ -433,7 +433,7 @@ async def get_event_statistics(
     return event_service.get_event_statistics(db)
 
 @router.post("/update-statuses")
-async def update_event_statuses(
+def update_event_statuses(
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
@@ -3,19 +3,20 @@ XploitRUM CTF Platform - Instance Endpoints
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_, func
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timedelta
 
-from app.core.database import get_db
-from app.core.auth import get_current_user
-from app.models.user import User
+from app.core.database import get_async_db
+from app.core.auth import get_current_active_principal
+from app.core.principal_cache import Principal
 from app.models.challenge import Challenge
 from app.models.instance import Instance, InstanceStatus
 from app.core.exceptions import NotFoundError, ValidationError, InstanceError
 from app.services.docker_service import DockerService
+from app.utils.resources import ResourceProfile
 
 router = APIRouter()
 
@@ -38,8 +39,8 @@ class InstanceCreate(BaseModel):
 
 @router.get("/", response_model=List[InstanceResponse])
 async def get_user_instances(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current user's instances"""
     try:
@@ -78,8 +79,8 @@ async def get_user_instances(
 @router.post("/", response_model=InstanceResponse)
 async def create_instance(
     instance_data: InstanceCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new challenge instance"""
     try:
@@ -93,27 +94,27 @@ async def create_instance(
         
         # Check if user already has an instance of this challenge
         existing_instance = await db.execute(
-            select(Instance).where(
+            select(Instance.id).where(
                 and_(
                     Instance.user_id == current_user.id,
                     Instance.challenge_id == instance_data.challenge_id,
                     Instance.status.in_([InstanceStatus.STARTING, InstanceStatus.RUNNING])
                 )
-            )
+            ).limit(1)
         )
         if existing_instance.scalar_one_or_none():
             raise ValidationError("You already have an active instance of this challenge")
         
         # Check challenge instance limits
         active_instances = await db.execute(
-            select(Instance).where(
+            select(func.count(Instance.id)).where(
                 and_(
                     Instance.challenge_id == instance_data.challenge_id,
                     Instance.status.in_([InstanceStatus.STARTING, InstanceStatus.RUNNING])
                 )
             )
         )
-        if len(active_instances.scalars().all()) >= challenge.max_instances:
+        if active_instances.scalar_one() >= challenge.max_instances:
             raise ValidationError("Maximum number of instances for this challenge reached")
         
         # Create instance record
@@ -134,7 +135,8 @@ async def create_instance(
             container_info = await docker_service.deploy_challenge(
                 challenge_id=challenge.id,
                 instance_id=new_instance.id,
-                user_id=current_user.id
+                user_id=current_user.id,
+                resources=ResourceProfile.for_challenge(challenge)
             )
             
             # Update instance with container info
@@ -178,8 +180,8 @@ async def create_instance(
 @router.delete("/{instance_id}")
 async def stop_instance(
     instance_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Stop challenge instance"""
     try:
@@ -198,7 +200,7 @@ async def stop_instance(
         if instance.container_id:
             try:
                 docker_service = DockerService()
-                await docker_service.stop_container(instance.container_id)
+                await docker_service.stop_container(instance.container_id, node=instance.node)
             except Exception as e:
                 # Log error but don't fail the request
                 pass
@@ -224,8 +226,8 @@ async def stop_instance(
 @router.get("/{instance_id}", response_model=InstanceResponse)
 async def get_instance(
     instance_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get instance details"""
     try:
@@ -2,7 +2,7 @@
 XploitRUM CTF Platform - Member Requests Endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import select
@@ -20,8 +20,10 @@ from app.core.auth import get_current_admin_user
 from app.models.member_request import MemberRequest, MemberRequestStatus
 from app.models.user import User, UserRole
 from app.core.exceptions import ValidationError, NotFoundError
-from app.core.auth import get_password_hash
+from app.services.password_service import password_service
 from app.core.config import settings
+from app.services.scoreboard_service import scoreboard_service
+from app.utils.pagination import paginate_keyset, split_page, set_next_cursor
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from fastapi import BackgroundTasks
 
@@ -284,7 +286,7 @@ class UserCreate(BaseModel):
 
 
 @router.post("/submit", response_model=dict)
-async def submit_member_request(
+def submit_member_request(
     request_data: MemberRequestCreate,
     db: Session = Depends(get_db)
 ):
@@ -327,7 +329,7 @@ async def submit_member_request(
                     existing_request.last_name = request_data.last_name
                     existing_request.phone = request_data.phone
                     existing_request.student_number = request_data.student_number
-                    existing_request.password_hash = get_password_hash(request_data.password)
+                    existing_request.password_hash = password_service.hash(request_data.password)
                     existing_request.notes = None
                     existing_request.reviewed_by = None
                     existing_request.reviewed_at = None
@@ -352,7 +354,7 @@ async def submit_member_request(
             email=request_data.email,
             phone=request_data.phone,
             student_number=request_data.student_number,
-            password_hash=get_password_hash(request_data.password),
+            password_hash=password_service.hash(request_data.password),
             status=MemberRequestStatus.PENDING
         )
         
@@ -379,20 +381,25 @@ async def submit_member_request(
 
 
 @router.get("/", response_model=List[MemberRequestResponse])
-async def get_member_requests(
+def get_member_requests(
+    response: Response,
     status_filter: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get all member requests (admin only)"""
+    """Get member requests, newest first (admin only). The next page's cursor is in the X-Next-Cursor header."""
     try:
         query = select(MemberRequest)
         
         if status_filter:
             query = query.where(MemberRequest.status == status_filter)
         
-        result = db.execute(query.order_by(MemberRequest.created_at.desc()))
-        requests = result.scalars().all()
+        query = paginate_keyset(query, (MemberRequest.created_at, MemberRequest.id), limit, cursor)
+        result = db.execute(query)
+        requests, next_cursor = split_page(result.scalars().all(), limit, lambda req: [req.created_at, req.id])
+        set_next_cursor(response, next_cursor)
         
         return [
             MemberRequestResponse(
@@ -411,6 +418,8 @@ async def get_member_requests(
             for req in requests
         ]
         
+    except ValidationError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -419,7 +428,7 @@ async def get_member_requests(
 
 
 @router.put("/{request_id}/accept", response_model=dict)
-async def accept_member_request(
+def accept_member_request(
     request_id: str,
     background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_admin_user),
@@ -453,7 +462,7 @@ async def accept_member_request(
             must_change_password = False
         else:
             temp_password = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(16))
-            hashed_password = get_password_hash(temp_password)
+            hashed_password = password_service.hash(temp_password)
             must_change_password = True
 
         # Create username from email
@@ -488,6 +497,7 @@ async def accept_member_request(
         db.commit()
         db.refresh(new_user)
         db.refresh(request)
+        scoreboard_service.upsert(new_user)
 
         # Send email notification in background (non-blocking)
         if use_chosen_password:
@@ -528,7 +538,7 @@ async def accept_member_request(
 
 
 @router.put("/{request_id}/decline", response_model=dict)
-async def decline_member_request(
+def decline_member_request(
     request_id: str,
     background_tasks: BackgroundTasks,
     notes: Optional[str] = None,
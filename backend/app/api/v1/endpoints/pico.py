@@ -2,34 +2,18 @@
 picoCTF-style challenges: static flags, +1 point per correct, public scoreboard.
 """
 
-import re
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from pydantic import BaseModel
 
 from app.core.database import get_db
-from app.models.user import User, UserStatus, UserRole
+from app.models.user import User
 from app.models.pico_challenge import PicoChallenge, PicoSubmission, PicoCategory, PicoDifficulty
-from app.core.auth import get_current_active_user, get_current_admin_user
-
-
-def _flag_pattern_to_regex(pattern: str) -> re.Pattern:
-    """Convert flag pattern with * (alphanumeric) to regex. Case-sensitive match."""
-    escaped = re.escape(pattern)
-    regex_str = escaped.replace(r"\*", r"[a-zA-Z0-9]+")
-    return re.compile("^" + regex_str + "$")
-
-
-def _check_flag(submitted: str, pattern: str) -> bool:
-    submitted = (submitted or "").strip()
-    if not submitted:
-        return False
-    try:
-        return _flag_pattern_to_regex(pattern).match(submitted) is not None
-    except Exception:
-        return False
+from app.core.auth import get_current_active_user, get_current_active_principal, get_current_admin_user
+from app.core.principal_cache import Principal
+from app.services.scoreboard_service import scoreboard_service
+from app.services.pico_service import pico_registry
 
 
 router = APIRouter()
@@ -90,23 +74,16 @@ def get_scoreboard(
     db: Session = Depends(get_db),
 ):
     """Public scoreboard: rank, username, score, total_solves (pico + existing). Excludes admin."""
-    # Score is on User; exclude admin (they don't solve challenges); rank by score desc
-    rows = (
-        db.query(User)
-        .filter(User.status == UserStatus.ACTIVE, User.role != UserRole.ADMIN)
-        .order_by(desc(User.score), desc(User.total_solves))
-        .limit(limit)
-        .all()
-    )
+    # Served from the in-memory scoreboard index (excludes admin, ranked by score desc)
     return [
         ScoreboardEntry(
-            rank=i + 1,
-            username=u.username,
-            full_name=u.full_name,
-            score=u.score,
-            total_solves=u.total_solves,
+            rank=entry["rank"],
+            username=entry["username"],
+            full_name=entry["full_name"],
+            score=entry["score"],
+            total_solves=entry["total_solves"],
         )
-        for i, u in enumerate(rows)
+        for entry in scoreboard_service.get_top(db, limit=limit)
     ]
 
 
@@ -115,48 +92,36 @@ def get_scoreboard(
 def list_challenges(
     category: Optional[str] = Query(None),
     difficulty: Optional[str] = Query(None),
-    current_user: User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_principal),
     db: Session = Depends(get_db),
 ):
     """List all pico challenges. Optional filters: category, difficulty."""
-    q = db.query(PicoChallenge).order_by(PicoChallenge.display_order, PicoChallenge.id)
+    cat_enum = None
     if category:
         try:
             cat_enum = PicoCategory(category)
-            q = q.filter(PicoChallenge.category == cat_enum)
         except ValueError:
             pass
+    diff_enum = None
     if difficulty:
         try:
             diff_enum = PicoDifficulty(difficulty)
-            q = q.filter(PicoChallenge.difficulty == diff_enum)
         except ValueError:
             pass
-    challenges = q.all()
+    challenges = pico_registry.list_challenges(db, cat_enum, diff_enum)
     # Mark solved for this user
-    out = []
-    for c in challenges:
-        solved = (
-            db.query(PicoSubmission)
-            .filter(
-                PicoSubmission.user_id == current_user.id,
-                PicoSubmission.pico_challenge_id == c.id,
-                PicoSubmission.correct == 1,
-            )
-            .first()
-            is not None
-        )
-        out.append(
-            PicoChallengeOut(
-                id=c.id,
-                title=c.title,
-                category=c.category.value,
-                difficulty=c.difficulty.value,
-                points=c.points,
-                is_solved=solved,
-            )
+    solved_ids = pico_registry.get_solved_ids(db, current_user.id)
+    return [
+        PicoChallengeOut(
+            id=c.id,
+            title=c.title,
+            category=c.category.value,
+            difficulty=c.difficulty.value,
+            points=c.points,
+            is_solved=c.id in solved_ids,
         )
-    return out
+        for c in challenges
+    ]
 
 
 # --- Member: submit flag ---
@@ -168,7 +133,7 @@ def submit_flag(
     db: Session = Depends(get_db),
 ):
     """Submit a flag for a pico challenge. +1 point and +1 total_solves on correct (first solve per challenge)."""
-    challenge = db.query(PicoChallenge).filter(PicoChallenge.id == challenge_id).first()
+    challenge = pico_registry.get_challenge(db, challenge_id)
     if not challenge:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
 
@@ -184,7 +149,7 @@ def submit_flag(
     if already_solved:
         return PicoSubmitOut(correct=True, message="Already solved", new_score=current_user.score)
 
-    correct = _check_flag(body.flag, challenge.flag_pattern)
+    correct = challenge.check_flag(body.flag)
     # Record submission
     sub = PicoSubmission(
         user_id=current_user.id,
@@ -199,6 +164,7 @@ def submit_flag(
         current_user.total_solves = (current_user.total_solves or 0) + 1
         db.commit()
         db.refresh(current_user)
+        scoreboard_service.upsert(current_user)
         return PicoSubmitOut(
             correct=True,
             message="Correct! +%d point(s)." % challenge.points,
@@ -259,6 +225,7 @@ def admin_create_challenge(
     db.add(c)
     db.commit()
     db.refresh(c)
+    pico_registry.invalidate()
     return {
         "id": c.id,
         "title": c.title,
@@ -301,6 +268,7 @@ def admin_update_challenge(
         c.display_order = body.display_order
     db.commit()
     db.refresh(c)
+    pico_registry.invalidate()
     return {
         "id": c.id,
         "title": c.title,
@@ -324,6 +292,7 @@ def admin_delete_challenge(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
     db.delete(c)
     db.commit()
+    pico_registry.invalidate()
     return {"message": "Deleted"}
 
 
@@ -8,6 +8,8 @@ import csv
 import io
 from datetime import datetime
 
+from app.services.runtime_settings_service import runtime_settings
+
 router = APIRouter()
 
 class StudentRegistration(BaseModel):
@@ -23,24 +25,6 @@ class StudentRegistration(BaseModel):
     studentNumber: str
     phoneNumber: str
 
-def _read_registration_setting() -> bool:
-    """Read registration setting from settings.json"""
-    import json
-    from pathlib import Path
-    # Path from backend/app/api/v1/endpoints/registration.py to backend/settings.json
-    settings_path = Path(__file__).parent.parent.parent.parent.parent / "settings.json"
-    
-    if settings_path.exists():
-        try:
-            with open(settings_path, 'r') as f:
-                settings = json.load(f)
-            return settings.get("registration_enabled", True)
-        except (json.JSONDecodeError, IOError):
-            return True  # Default to enabled if file is corrupted
-    else:
-        return True  # Default to enabled if file doesn't exist
-
-
 @router.post("/register")
 async def register_student(registration: StudentRegistration):
     """
@@ -48,7 +32,7 @@ async def register_student(registration: StudentRegistration):
     Sends email to admin with registration details and CSV attachment
     """
     # Check if registration is enabled globally
-    if not _read_registration_setting():
+    if not runtime_settings.get("registration_enabled"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Registration is currently closed. Please contact the administrator."
@@ -2,23 +2,32 @@
 XploitRUM CTF Platform - Submission Endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from app.core.database import get_db
-from app.core.auth import get_current_user, get_current_admin_user
+from app.core.database import get_async_db
+from app.core.auth import get_current_active_principal, get_current_admin_principal
+from app.core.principal_cache import Principal
 from app.models.user import User
 from app.models.challenge import Challenge
 from app.models.submission import Submission, SubmissionStatus
 from app.core.exceptions import NotFoundError, ValidationError
-from app.core.security import verify_flag
+from app.services.ctf_service import ctf_service
+from app.utils.pagination import paginate_keyset, split_page, set_next_cursor
 
 router = APIRouter()
 
+# Newest first, id breaks ties; backed by the (…, submitted_at, id) indexes on submissions
+SUBMISSION_SORT_KEYS = (Submission.submitted_at, Submission.id)
+
+
+def _submission_cursor_key(row):
+    return [row[0].submitted_at, row[0].id]
+
 
 class SubmissionResponse(BaseModel):
     id: int
@@ -34,11 +43,22 @@ class SubmissionCreate(BaseModel):
     flag: str
 
 
+def _duplicate_response(challenge_id: int, challenge_title: str) -> SubmissionResponse:
+    return SubmissionResponse(
+        id=0,
+        challenge_id=challenge_id,
+        challenge_title=challenge_title,
+        status=SubmissionStatus.DUPLICATE,
+        points_awarded=0,
+        submitted_at=datetime.utcnow().isoformat()
+    )
+
+
 @router.post("/", response_model=SubmissionResponse)
 async def submit_flag(
     submission_data: SubmissionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Submit flag for challenge"""
     try:
@@ -46,70 +66,26 @@ async def submit_flag(
         challenge = await db.get(Challenge, submission_data.challenge_id)
         if not challenge:
             raise NotFoundError("Challenge not found")
+        # Plain values: a rollback below expires the instance and async sessions cannot lazy load
+        challenge_id, challenge_title = challenge.id, challenge.title
         
-        # Check if user already solved this challenge
-        existing_submission = await db.execute(
-            select(Submission).where(
-                and_(
-                    Submission.user_id == current_user.id,
-                    Submission.challenge_id == submission_data.challenge_id,
-                    Submission.status == SubmissionStatus.CORRECT
-                )
-            )
+        # Same transaction as /ctf/challenges/{id}/submit, run on this session's connection
+        new_submission = await db.run_sync(
+            ctf_service.record_submission, current_user.id, challenge, submission_data.flag
         )
-        if existing_submission.scalar_one_or_none():
-            return SubmissionResponse(
-                id=0,
-                challenge_id=challenge.id,
-                challenge_title=challenge.title,
-                status=SubmissionStatus.DUPLICATE,
-                points_awarded=0,
-                submitted_at=datetime.utcnow().isoformat()
-            )
-        
-        # Verify flag
-        is_correct = verify_flag(submission_data.flag, challenge.flag)
-        
-        # Create submission
-        submission_status = SubmissionStatus.CORRECT if is_correct else SubmissionStatus.INCORRECT
-        points_awarded = challenge.points if is_correct else 0
-        
-        new_submission = Submission(
-            user_id=current_user.id,
-            challenge_id=submission_data.challenge_id,
-            flag=submission_data.flag,
-            status=submission_status,
-            points_awarded=points_awarded
-        )
-        
-        db.add(new_submission)
-        
-        # Update user score and challenge statistics if correct
-        if is_correct:
-            current_user.score += points_awarded
-            current_user.total_solves += 1
-            challenge.total_solves += 1
-        
-        # Update attempt statistics
-        current_user.total_attempts += 1
-        challenge.total_attempts += 1
-        
-        # Update solve percentage
-        challenge.solve_percentage = challenge.get_solve_rate()
-        
-        await db.commit()
-        await db.refresh(new_submission)
+        if new_submission is None:
+            return _duplicate_response(challenge_id, challenge_title)
         
         return SubmissionResponse(
             id=new_submission.id,
             challenge_id=new_submission.challenge_id,
-            challenge_title=challenge.title,
+            challenge_title=challenge_title,
             status=new_submission.status,
             points_awarded=new_submission.points_awarded,
             submitted_at=new_submission.submitted_at.isoformat()
         )
         
-    except (NotFoundError, ValidationError):
+    except (NotFoundError, ValidationError, HTTPException):
         raise
     except Exception as e:
         await db.rollback()
@@ -121,21 +97,25 @@ async def submit_flag(
 
 @router.get("/", response_model=List[SubmissionResponse])
 async def get_user_submissions(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
     offset: int = 0,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get current user's submissions"""
+    """Get current user's submissions, newest first. The next page's cursor is in the X-Next-Cursor header."""
     try:
         stmt = select(Submission, Challenge).join(
             Challenge, Submission.challenge_id == Challenge.id
         ).where(
             Submission.user_id == current_user.id
-        ).order_by(Submission.submitted_at.desc()).offset(offset).limit(limit)
+        )
+        stmt = paginate_keyset(stmt, SUBMISSION_SORT_KEYS, limit, cursor, offset=offset)
         
         result = await db.execute(stmt)
-        submissions_data = result.all()
+        submissions_data, next_cursor = split_page(result.all(), limit, _submission_cursor_key)
+        set_next_cursor(response, next_cursor)
         
         submissions = []
         for submission, challenge in submissions_data:
@@ -150,6 +130,8 @@ async def get_user_submissions(
         
         return submissions
         
+    except ValidationError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -159,51 +141,38 @@ async def get_user_submissions(
 
 @router.get("/stats")
 async def get_submission_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user submission statistics"""
     try:
-        # Get total submissions
-        total_submissions = await db.execute(
-            select(func.count(Submission.id)).where(Submission.user_id == current_user.id)
-        )
-        total_count = total_submissions.scalar()
+        week_ago = datetime.utcnow() - timedelta(days=7)
         
-        # Get correct submissions
-        correct_submissions = await db.execute(
-            select(func.count(Submission.id)).where(
-                and_(
-                    Submission.user_id == current_user.id,
-                    Submission.status == SubmissionStatus.CORRECT
-                )
-            )
+        # Total, correct and last-7-days submissions in one pass over the user's rows
+        counts = await db.execute(
+            select(
+                func.count(Submission.id),
+                func.count(Submission.id).filter(Submission.status == SubmissionStatus.CORRECT),
+                func.count(Submission.id).filter(Submission.submitted_at >= week_ago)
+            ).where(Submission.user_id == current_user.id)
         )
-        correct_count = correct_submissions.scalar()
+        total_count, correct_count, recent_count = counts.one()
         
         # Get accuracy percentage
         accuracy = (correct_count / total_count * 100) if total_count > 0 else 0
         
-        # Get recent submissions (last 7 days)
-        from datetime import datetime, timedelta
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_submissions = await db.execute(
-            select(func.count(Submission.id)).where(
-                and_(
-                    Submission.user_id == current_user.id,
-                    Submission.submitted_at >= week_ago
-                )
-            )
+        user_totals = await db.execute(
+            select(User.score, User.total_solves).where(User.id == current_user.id)
         )
-        recent_count = recent_submissions.scalar()
+        total_score, total_solves = user_totals.one()
         
         return {
             "total_submissions": total_count,
             "correct_submissions": correct_count,
             "accuracy_percentage": round(accuracy, 2),
             "recent_submissions": recent_count,
-            "total_score": current_user.score,
-            "total_solves": current_user.total_solves
+            "total_score": total_score,
+            "total_solves": total_solves
         }
         
     except Exception as e:
@@ -216,15 +185,17 @@ async def get_submission_stats(
 # Admin endpoints
 @router.get("/admin/all", response_model=List[SubmissionResponse])
 async def get_all_submissions(
-    limit: int = 100,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     challenge_id: Optional[int] = None,
     user_id: Optional[int] = None,
     status: Optional[SubmissionStatus] = None,
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all submissions (admin only)"""
+    """Get all submissions, newest first (admin only). The next page's cursor is in the X-Next-Cursor header."""
     try:
         query = select(Submission, Challenge).join(
             Challenge, Submission.challenge_id == Challenge.id
@@ -242,10 +213,11 @@ async def get_all_submissions(
         if filters:
             query = query.where(and_(*filters))
         
-        query = query.order_by(Submission.submitted_at.desc()).offset(offset).limit(limit)
+        query = paginate_keyset(query, SUBMISSION_SORT_KEYS, limit, cursor, offset=offset)
         
         result = await db.execute(query)
-        submissions_data = result.all()
+        submissions_data, next_cursor = split_page(result.all(), limit, _submission_cursor_key)
+        set_next_cursor(response, next_cursor)
         
         submissions = []
         for submission, challenge in submissions_data:
@@ -260,6 +232,8 @@ async def get_all_submissions(
         
         return submissions
         
+    except ValidationError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -2,16 +2,20 @@
 XploitRUM CTF Platform - User Endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 
-from app.core.database import get_db
-from app.core.auth import get_current_user, get_current_admin_user
-from app.models.user import User, UserRole, UserStatus
+from app.core.database import get_db, get_async_db
+from app.core.auth import get_current_active_principal, get_current_admin_principal
+from app.core.principal_cache import Principal
+from app.models.user import User, UserRole
 from app.core.exceptions import NotFoundError, ValidationError
+from app.services.scoreboard_service import scoreboard_service
+from app.utils.pagination import encode_cursor, decode_cursor, set_next_cursor
 
 router = APIRouter()
 
@@ -64,9 +68,13 @@ class LeaderboardEntry(BaseModel):
 
 @router.get("/profile", response_model=UserProfile)
 async def get_user_profile(
-    current_user: User = Depends(get_current_user)
+    principal: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current user's profile"""
+    current_user = await db.get(User, principal.id)
+    if not current_user:
+        raise NotFoundError("User not found")
     return UserProfile(
         id=current_user.id,
         username=current_user.username,
@@ -80,7 +88,7 @@ async def get_user_profile(
         linkedin_url=current_user.linkedin_url,
         website_url=current_user.website_url,
         score=current_user.score,
-        rank=current_user.rank,
+        rank=scoreboard_service.get_rank(None, current_user.id),
         total_solves=current_user.total_solves,
         total_attempts=current_user.total_attempts,
         created_at=current_user.created_at.isoformat(),
@@ -91,11 +99,15 @@ async def get_user_profile(
 @router.put("/profile", response_model=UserProfile)
 async def update_user_profile(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    principal: Principal = Depends(get_current_active_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user's profile"""
     try:
+        current_user = await db.get(User, principal.id)
+        if not current_user:
+            raise NotFoundError("User not found")
+        
         # Update user fields
         for field, value in user_update.dict(exclude_unset=True).items():
             setattr(current_user, field, value)
@@ -116,13 +128,15 @@ async def update_user_profile(
             linkedin_url=current_user.linkedin_url,
             website_url=current_user.website_url,
             score=current_user.score,
-            rank=current_user.rank,
+            rank=scoreboard_service.get_rank(None, current_user.id),
             total_solves=current_user.total_solves,
             total_attempts=current_user.total_attempts,
             created_at=current_user.created_at.isoformat(),
             last_login=current_user.last_login.isoformat() if current_user.last_login else None
         )
         
+    except NotFoundError:
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -132,37 +146,35 @@ async def update_user_profile(
 
 
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(
-    limit: int = 100,
+def get_leaderboard(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get user leaderboard (excludes admin)."""
+    """Get user leaderboard (excludes admin). The next page's cursor is in the X-Next-Cursor header."""
     try:
-        stmt = select(User).where(
-            User.status == UserStatus.ACTIVE,
-            User.role != UserRole.ADMIN
-        ).order_by(
-            User.score.desc(),
-            User.total_solves.desc(),
-            User.created_at.asc()
-        ).offset(offset).limit(limit)
-        
-        result = await db.execute(stmt)
-        users = result.scalars().all()
-        
-        leaderboard = []
-        for i, user in enumerate(users):
-            leaderboard.append(LeaderboardEntry(
-                rank=offset + i + 1,
-                username=user.username,
-                score=user.score,
-                total_solves=user.total_solves,
-                country=user.country
-            ))
-        
-        return leaderboard
+        after = None
+        if cursor:
+            after = decode_cursor(cursor, 4)
+            if not all(isinstance(value, (int, float)) for value in after):
+                raise ValidationError("Invalid cursor")
+        entries, next_key = scoreboard_service.get_page(db, limit=limit, after=after, offset=offset)
+        set_next_cursor(response, encode_cursor(next_key) if next_key else None)
+        return [
+            LeaderboardEntry(
+                rank=entry["rank"],
+                username=entry["username"],
+                score=entry["score"],
+                total_solves=entry["total_solves"],
+                country=entry["country"]
+            )
+            for entry in entries
+        ]
         
+    except ValidationError:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -173,7 +185,7 @@ async def get_leaderboard(
 @router.get("/{user_id}", response_model=UserProfile)
 async def get_user_by_id(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user by ID (public profile)"""
     try:
@@ -194,7 +206,7 @@ async def get_user_by_id(
             linkedin_url=user.linkedin_url,
             website_url=user.website_url,
             score=user.score,
-            rank=user.rank,
+            rank=scoreboard_service.get_rank(None, user.id),
             total_solves=user.total_solves,
             total_attempts=user.total_attempts,
             created_at=user.created_at.isoformat(),
@@ -214,25 +226,25 @@ async def get_user_by_id(
 @router.post("/", response_model=UserProfile)
 async def create_user(
     user_data: UserCreate,
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_admin_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new user (admin only)"""
     try:
         # Check if user already exists
-        stmt = select(User).where(
+        stmt = select(User.id).where(
             (User.username == user_data.username) | (User.email == user_data.email)
-        )
+        ).limit(1)
         result = await db.execute(stmt)
         if result.scalar_one_or_none():
             raise ValidationError("Username or email already exists")
         
         # Create new user
-        from app.core.auth import get_password_hash
+        from app.services.password_service import password_service
         new_user = User(
             username=user_data.username,
             email=user_data.email,
-            password_hash=get_password_hash(user_data.password),
+            password_hash=await password_service.hash_async(user_data.password),
             full_name=user_data.full_name,
             role=user_data.role
         )
@@ -240,6 +252,7 @@ async def create_user(
         db.add(new_user)
         await db.commit()
         await db.refresh(new_user)
+        scoreboard_service.upsert(new_user)
         
         return UserProfile(
             id=new_user.id,
@@ -254,7 +267,7 @@ async def create_user(
             linkedin_url=new_user.linkedin_url,
             website_url=new_user.website_url,
             score=new_user.score,
-            rank=new_user.rank,
+            rank=scoreboard_service.get_rank(None, new_user.id),
             total_solves=new_user.total_solves,
             total_attempts=new_user.total_attempts,
             created_at=new_user.created_at.isoformat(),
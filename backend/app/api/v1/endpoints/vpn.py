@@ -4,12 +4,10 @@ XploitRUM CTF Platform - VPN Endpoints
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import FileResponse, Response
-from sqlalchemy.orm import Session
 from typing import Optional
 import os
 import tempfile
 
-from app.core.database import get_db
 from app.core.auth import get_current_user_optional
 from app.models.user import User
 
@@ -17,8 +15,7 @@ router = APIRouter()
 
 @router.get("/download")
 async def download_openvpn_config(
-    current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    current_user: Optional[User] = Depends(get_current_user_optional)
 ):
     """
     Download OpenVPN configuration file
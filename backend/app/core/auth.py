@@ -5,7 +5,6 @@ XploitRUM CTF Platform - Authentication Utilities
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Union
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session as DBSession
@@ -16,9 +15,9 @@ from app.core.database import get_db
 from app.models.user import User
 from app.models.session import Session
 from app.core.exceptions import AuthenticationError
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.session_activity import session_activity
+from app.core.principal_cache import Principal, principal_cache
+from app.services.password_service import password_service
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
@@ -26,13 +25,13 @@ oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", aut
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verify a password against its hash (runs on the password hashing pool)"""
+    return password_service.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Generate password hash"""
-    return pwd_context.hash(password)
+    """Generate password hash (runs on the password hashing pool)"""
+    return password_service.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -121,7 +120,7 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         
         print(f"[AUTH] User found: {user.username}, checking password...")  # Debug
         
-        password_valid = verify_password(password, user.password_hash)
+        password_valid, upgraded_hash = password_service.verify_and_update(password, user.password_hash)
         print(f"[AUTH] Password valid: {password_valid}")  # Debug
         
         if not password_valid:
@@ -138,6 +137,10 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         
         print(f"[AUTH] Password verified successfully for: {username}")  # Debug
         
+        # Rehash with the configured cost if BCRYPT_ROUNDS changed since this hash was made
+        if upgraded_hash:
+            user.password_hash = upgraded_hash
+        
         # Reset failed login attempts on successful login
         if user.failed_login_attempts > 0:
             user.failed_login_attempts = 0
@@ -150,6 +153,10 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         print(f"[AUTH] User authenticated successfully: {username}")  # Debug
         return user
         
+    except HTTPException:
+        # e.g. 503 from the password hashing pool when its queue is full
+        db.rollback()
+        raise
     except Exception as e:
         print(f"[AUTH] Exception during authentication: {e}")  # Debug
         import traceback
@@ -175,7 +182,8 @@ def _naive_utc(dt):
 def cleanup_expired_sessions(db: DBSession) -> int:
     """Delete sessions that have exceeded idle or absolute timeout. Returns count deleted."""
     now = _utc_now()
-    idle_limit = now - timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES)
+    # Stored activity may trail real activity by the tracker's write lag
+    idle_limit = now - timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES) - session_activity.write_lag
     absolute_limit = now - timedelta(minutes=settings.SESSION_ABSOLUTE_TIMEOUT_MINUTES)
     # Compare with naive UTC for SQLite (stored without tz)
     idle_naive = idle_limit.replace(tzinfo=None) if idle_limit.tzinfo else idle_limit
@@ -190,13 +198,14 @@ def cleanup_expired_sessions(db: DBSession) -> int:
     return count
 
 
-def _session_expired(session: Session) -> bool:
-    """True if session has exceeded idle or absolute timeout."""
+def _session_times_expired(session_id: str, created_at, last_activity_at) -> bool:
+    """True if a session with these timestamps has exceeded idle or absolute timeout."""
     now = _utc_now()
     idle_limit = now - timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES)
     absolute_limit = now - timedelta(minutes=settings.SESSION_ABSOLUTE_TIMEOUT_MINUTES)
-    last_activity = _naive_utc(session.last_activity_at)
-    created = _naive_utc(session.created_at)
+    # In-memory activity is newer than the coalesced last_activity_at column
+    last_activity = session_activity.last_activity(session_id, last_activity_at)
+    created = _naive_utc(created_at)
     if last_activity is not None and last_activity < idle_limit:
         return True
     if created is not None and created < absolute_limit:
@@ -204,42 +213,68 @@ def _session_expired(session: Session) -> bool:
     return False
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: DBSession = Depends(get_db)
-) -> User:
-    """Get current authenticated user; validates server-side session (idle + absolute timeout) when session_id present."""
-    try:
-        payload = verify_token(token)
-        user_id = payload.get("sub")
-        session_id = payload.get("session_id")
-        if user_id is None:
-            raise AuthenticationError("Invalid token")
-
-        # When token has session_id: enforce server-side session (idle + absolute timeout)
-        if session_id:
-            session = db.get(Session, session_id)
-            if session is None:
-                raise AuthenticationError("Session invalid or expired")
-            if _session_expired(session):
-                db.execute(delete(Session).where(Session.id == session_id))
-                db.commit()
-                raise AuthenticationError("Session expired due to inactivity or max time")
-
-            # Update last activity (extends idle timeout)
-            now = _utc_now()
-            session.last_activity_at = now.replace(tzinfo=None) if now.tzinfo else now
+def _session_expired(session: Session) -> bool:
+    """True if session has exceeded idle or absolute timeout."""
+    return _session_times_expired(session.id, session.created_at, session.last_activity_at)
+
+
+def _resolve_principal(token: str, db: DBSession, touch: bool = True) -> Principal:
+    """Validate the token and server-side session; the user snapshot comes from the principal cache when fresh."""
+    payload = verify_token(token)
+    user_id = payload.get("sub")
+    session_id = payload.get("session_id")
+    if user_id is None:
+        raise AuthenticationError("Invalid token")
+    user_id = int(user_id)
+
+    cache_key = principal_cache.key(user_id, session_id)
+    cached = principal_cache.get(cache_key)
+    if cached is not None and cached.principal.id == user_id:
+        if session_id and _session_times_expired(session_id, cached.session_created_at, cached.session_last_activity_at):
+            # Re-check against the database below before deleting anything
+            principal_cache.invalidate_session(session_id)
+        else:
+            if session_id and touch:
+                session_activity.touch(session_id, cached.session_last_activity_at)
+            return cached.principal
+
+    # When token has session_id: enforce server-side session (idle + absolute timeout)
+    session_times = (None, None)
+    if session_id:
+        session = db.get(Session, session_id)
+        if session is None:
+            raise AuthenticationError("Session invalid or expired")
+        if _session_expired(session):
+            session_activity.forget(session_id)
+            db.execute(delete(Session).where(Session.id == session_id))
             db.commit()
+            raise AuthenticationError("Session expired due to inactivity or max time")
+        session_times = (session.created_at, session.last_activity_at)
+
+        # Record activity (extends idle timeout); written to the sessions table in batches
+        if touch:
+            session_activity.touch(session_id, session.last_activity_at)
+
+    # Load user by sub (works for both session-backed and legacy tokens)
+    user = db.get(User, user_id)
+    if user is None:
+        raise AuthenticationError("User not found")
+    if not user.is_active:
+        raise AuthenticationError("User account is inactive")
 
-        # Load user by sub (works for both session-backed and legacy tokens)
-        user = db.get(User, int(user_id))
-        if user is None:
-            raise AuthenticationError("User not found")
-        if not user.is_active:
-            raise AuthenticationError("User account is inactive")
-        return user
+    principal = Principal.from_user(user, session_id)
+    principal_cache.put(cache_key, principal, session_times)
+    return principal
 
-    except AuthenticationError as e:
+
+def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: DBSession = Depends(get_db)
+) -> Principal:
+    """Get the authenticated principal (cached snapshot); use for routes that only need id/role/status/score."""
+    try:
+        return _resolve_principal(token, db)
+    except AuthenticationError:
         raise
     except Exception as e:
         import traceback
@@ -247,6 +282,41 @@ def get_current_user(
         raise AuthenticationError("Authentication failed")
 
 
+def get_current_active_principal(
+    principal: Principal = Depends(get_current_principal)
+) -> Principal:
+    """Get current active principal"""
+    if not principal.is_active:
+        raise AuthenticationError("User account is inactive")
+    
+    return principal
+
+
+def get_current_admin_principal(
+    principal: Principal = Depends(get_current_principal)
+) -> Principal:
+    """Get current admin principal"""
+    if not principal.is_admin:
+        raise AuthenticationError("Admin access required")
+    
+    return principal
+
+
+def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    db: DBSession = Depends(get_db)
+) -> User:
+    """Get current authenticated user as a live ORM object (loaded after the principal is validated)."""
+    user = db.get(User, principal.id)
+    if user is None:
+        principal_cache.invalidate_user(principal.id)
+        raise AuthenticationError("User not found")
+    if not user.is_active:
+        principal_cache.invalidate_user(principal.id)
+        raise AuthenticationError("User account is inactive")
+    return user
+
+
 def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -275,16 +345,8 @@ def get_current_user_optional(
     if not token:
         return None
     try:
-        payload = verify_token(token)
-        user_id = payload.get("sub")
-        session_id = payload.get("session_id")
-        if not user_id:
-            return None
-        if session_id:
-            session = db.get(Session, session_id)
-            if session is None or _session_expired(session):
-                return None
-        user = db.get(User, int(user_id))
+        principal = _resolve_principal(token, db, touch=False)
+        user = db.get(User, principal.id)
         if user is None or not user.is_active:
             return None
         return user
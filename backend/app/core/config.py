@@ -23,10 +23,18 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     JWT_REFRESH_TOKEN_EXPIRE_DAYS: int = 7
-    BCRYPT_ROUNDS: int = 12
+    BCRYPT_ROUNDS: int = 12  # Changing this rehashes passwords on their next successful login
+    PASSWORD_HASH_WORKERS: int = 4  # Concurrent bcrypt hashes/verifies
+    PASSWORD_HASH_MAX_QUEUE: int = 256  # Waiting hash jobs before requests get 503 (0 = unbounded)
     # Server-side session timeouts (enforced on every request)
     SESSION_IDLE_TIMEOUT_MINUTES: int = 30   # Log out after this much inactivity
     SESSION_ABSOLUTE_TIMEOUT_MINUTES: int = 480  # Max session lifetime (e.g. 8 hours)
+    SESSION_ACTIVITY_WRITE_THRESHOLD_SECONDS: int = 60  # Only persist last activity once it is this stale
+    SESSION_ACTIVITY_FLUSH_INTERVAL: int = 15  # Seconds between batched session activity writes
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 5.0  # How long an authenticated user snapshot is reused (0 disables)
+    # Flag encryption: comma-separated Fernet keys, newest first (older keys still decrypt)
+    FLAG_ENCRYPTION_KEYS: str = ""
+    FLAG_HMAC_KEY: Optional[str] = None  # Defaults to a key derived from SECRET_KEY
     
     # Database
     DATABASE_URL: str = "sqlite:///./xploitrum.db"
@@ -36,6 +44,20 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379"
     REDIS_PASSWORD: Optional[str] = None
     
+    # Public stats snapshot
+    STATS_CACHE_TTL_SECONDS: float = 10.0  # Snapshot age served without recomputing
+    STATS_CACHE_STALE_SECONDS: float = 60.0  # Extra age served while a background refresh runs
+    STATS_CACHE_SHARED: bool = True  # Share the snapshot between workers through Redis
+    COUNTER_FOLD_INTERVAL: float = 5.0  # Seconds between folds of pending counter deltas into platform_counters
+    COUNTER_RECONCILE_INTERVAL: int = 3600  # Seconds between rebuilds of platform counters from source tables
+    ADMIN_DASHBOARD_CACHE_SECONDS: float = 10.0  # How long the admin dashboard aggregates are reused
+    SCOREBOARD_SYNC_SECONDS: float = 2.0  # How often each worker's scoreboard index picks up changes made by other workers
+    SCOREBOARD_REBUILD_SECONDS: int = 600  # Full rebuild of the scoreboard index from the users table
+    
+    # Runtime settings (admin toggles such as registration), shared by all workers through one JSON file
+    RUNTIME_SETTINGS_FILE: Optional[str] = None  # Defaults to backend/settings.json
+    RUNTIME_SETTINGS_CHECK_SECONDS: float = 1.0  # How often the file's mtime is checked for changes by other workers
+    
     # CORS
     CORS_ORIGINS: str = "http://localhost:3000,http://127.0.0.1:3000,https://www.xploitrum.org,https://xploitrum.org,https://ctf.xploitrum.org,https://api.xploitrum.org"
     ALLOWED_HOSTS: str = "localhost,127.0.0.1,www.xploitrum.org,xploitrum.org,ctf.xploitrum.org,api.xploitrum.org"
@@ -60,8 +82,35 @@ class Settings(BaseSettings):
     
     # Docker
     DOCKER_HOST: str = "unix:///var/run/docker.sock"
+    DOCKER_NODES: str = ""  # Comma-separated name=url Docker daemons to schedule on; empty = DOCKER_HOST only
+    DOCKER_NODE_TIMEOUT: int = 60  # Docker API timeout per call, seconds
+    DOCKER_NODE_HEALTH_INTERVAL: int = 15
+    DOCKER_NODE_FAILURE_THRESHOLD: int = 3  # Failed health checks in a row before a node gets no new instances
+    DOCKER_PLACEMENT_STRATEGY: str = "binpack"  # binpack (fill nodes) or spread (balance load)
     CHALLENGE_NETWORK: str = "xploitrum_challenges"
     CHALLENGE_SUBNET: str = "172.20.0.0/16"
+    CHALLENGE_PORT_RANGE: str = "10000-20000"  # Host ports handed out to challenge containers (inclusive)
+    PORT_RECONCILE_GRACE_SECONDS: int = 300  # Startup reconcile never releases reservations younger than this
+    ORCHESTRATOR_WORKERS: int = 4  # Concurrent container deploy/stop jobs
+    CONTAINER_READY_TIMEOUT: int = 60  # Seconds to wait for a container to reach "running"
+    ORCHESTRATOR_RECOVERY_GRACE_SECONDS: int = 600  # STARTING this long with no deploy job = re-enqueued
+    WARM_POOL_ENABLED: bool = True  # Keep pre-started containers per active challenge
+    WARM_POOL_FRACTION: float = 0.2  # Pool size as a fraction of Challenge.max_instances
+    WARM_POOL_MAX_PER_CHALLENGE: int = 3
+    WARM_POOL_REFRESH_INTERVAL: int = 30  # Seconds between pool replenishment passes
+    WARM_POOL_OWNER_TIMEOUT: int = 300  # Warm containers of a pool without a heartbeat this long are reaped
+    IMAGE_WARMER_ENABLED: bool = True  # Pre-pull challenge images when a challenge is activated
+    IMAGE_WARMER_WORKERS: int = 2  # Concurrent image pulls
+    IMAGE_WARMER_POLL_SECONDS: int = 10  # How often requested pulls made on other workers are picked up
+    IMAGE_WARMER_RESYNC_INTERVAL: int = 600  # Re-check images on all nodes, retry failed pulls, collect garbage
+    IMAGE_GC_ENABLED: bool = True  # Remove images of challenges that are no longer active
+    IMAGE_GC_GRACE_HOURS: int = 24  # Keep images of deactivated challenges this long
+    CONTAINER_EVENTS_ENABLED: bool = True  # Track container state from the Docker events stream
+    CONTAINER_DEATH_GRACE_SECONDS: float = 30.0  # Wait before marking an instance whose container died ERROR
+    CONTAINER_METRICS_ENABLED: bool = True  # Sample CPU/memory/network of running instances into the Instance row
+    CONTAINER_METRICS_INTERVAL: int = 15  # Seconds between samples
+    CONTAINER_METRICS_WORKERS: int = 8  # Concurrent samples when falling back to the Docker stats API
+    CONTAINER_METRICS_CGROUP_ROOT: str = "/sys/fs/cgroup"  # Host cgroup v2 mount (read directly when visible)
     
     # OpenVPN
     OPENVPN_SERVER_NAME: str = "xploitrum"
@@ -74,7 +123,21 @@ class Settings(BaseSettings):
     # CTF Configuration
     MAX_CONCURRENT_CHALLENGES: int = 50
     CHALLENGE_TIMEOUT_HOURS: int = 24
-    AUTO_CLEANUP_INTERVAL: int = 3600
+    AUTO_CLEANUP_INTERVAL: int = 3600  # Full resync of instance deadlines by the expiry scheduler
+    EXPIRY_POLL_INTERVAL: int = 30  # How often the expiry scheduler picks up newly created instances
+    
+    # Instance resource limits (challenges may override) and host admission control
+    CHALLENGE_DEFAULT_CPU_MILLICORES: int = 500  # 1000 = one CPU
+    CHALLENGE_DEFAULT_MEMORY_MB: int = 512
+    CHALLENGE_DEFAULT_PIDS_LIMIT: int = 256
+    HOST_CPU_CAPACITY_MILLICORES: int = 0  # 0 = detect from the Docker host
+    HOST_MEMORY_CAPACITY_MB: int = 0  # 0 = detect from the Docker host
+    HOST_MEMORY_RESERVED_MB: int = 1024  # Kept free for the platform itself
+    HOST_CPU_OVERCOMMIT: float = 1.0  # CPU limits are throttled, not fatal, so >1 is safe-ish
+    ADMISSION_QUEUE_ENABLED: bool = True  # Queue deploys that do not fit instead of rejecting them
+    ADMISSION_QUEUE_MAX: int = 200
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: int = 900  # Queued deploys older than this are dropped
+    ADMISSION_QUEUE_POLL_SECONDS: int = 5
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
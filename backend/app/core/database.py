@@ -3,6 +3,7 @@ XploitRUM CTF Platform - Database Configuration
 """
 
 from sqlalchemy import create_engine, MetaData
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 import logging
@@ -40,6 +41,46 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+
+def _async_database_url(url: str) -> str:
+    """Same database through an asyncio driver: aiosqlite for SQLite, asyncpg for PostgreSQL"""
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+# Async engine for async def route handlers, alongside the sync one
+if is_sqlite:
+    async_engine = create_async_engine(
+        _async_database_url(settings.DATABASE_URL),
+        echo=settings.DEBUG
+    )
+else:
+    async_engine = create_async_engine(
+        _async_database_url(settings.DATABASE_URL),
+        echo=settings.DEBUG,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=10,
+        max_overflow=20
+    )
+
+
+class AsyncBackedSession(Session):
+    """Sync session behind every AsyncSession; session event listeners attach to this class"""
+
+
+# Create async session factory (objects stay usable after commit: no implicit lazy reloads)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    sync_session_class=AsyncBackedSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 # Create declarative base
 Base = declarative_base()
 
@@ -60,11 +101,22 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency to get an async database session (for async def handlers)"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Database session error: {e}")
+            await db.rollback()
+            raise
+
+
 def init_db():
     """Initialize database tables"""
     try:
         # Import all models here to ensure they are registered
-        from app.models import user, session, challenge, instance, submission, log, event, member_request, pico_challenge
+        from app.models import user, session, challenge, instance, port_reservation, warm_pool_owner, submission, log, event, platform_stats, member_request, pico_challenge
         
         # Create all tables
         Base.metadata.create_all(bind=engine)
@@ -78,3 +130,8 @@ def close_db():
     """Close database connections"""
     engine.dispose()
     logger.info("Database connections closed")
+
+
+async def close_async_db():
+    """Close async database connections"""
+    await async_engine.dispose()
@@ -3,10 +3,20 @@ XploitRUM CTF Platform - Application Events
 """
 
 from loguru import logger
-from app.core.database import init_db, close_db, SessionLocal
+from app.core.database import init_db, close_db, close_async_db, SessionLocal
 from app.core.config import settings
 from app.core.seed_pico import seed_pico_challenges
 from app.core.auth import cleanup_expired_sessions
+from app.core.session_activity import session_activity
+from app.services.password_service import password_service
+from app.services.scoreboard_service import scoreboard_service
+from app.services.orchestrator_service import instance_orchestrator
+from app.services.expiry_service import expiry_scheduler
+from app.services.counter_service import platform_counters
+from app.services.container_state_service import container_states
+from app.services.metrics_collector_service import container_metrics
+from app.services.admission_service import admission_controller
+from app.services.image_warmer_service import image_warmer
 
 
 async def startup_event():
@@ -28,13 +38,29 @@ async def startup_event():
         # Seed picoCTF challenges if empty
         seed_pico_challenges()
         logger.info("Pico challenges seed checked")
+        # Build the in-memory scoreboard index
+        db = SessionLocal()
+        try:
+            scoreboard_service.rebuild(db)
+        finally:
+            db.close()
         
         # Initialize Redis connection
         # (Redis connection will be handled by individual services)
         logger.info("Redis connection configured")
         
         # Start background tasks
-        # (Background tasks will be started here)
+        scoreboard_service.start()
+        instance_orchestrator.reconcile_ports()
+        instance_orchestrator.start_node_health()
+        container_states.start()
+        container_metrics.start()
+        admission_controller.start()
+        image_warmer.start()
+        instance_orchestrator.start_warm_pool()
+        expiry_scheduler.start()
+        session_activity.start()
+        platform_counters.start()
         logger.info("Background tasks started")
         
         logger.info("XploitRUM CTF Platform started successfully")
@@ -49,7 +75,20 @@ async def shutdown_event():
     logger.info("Shutting down XploitRUM CTF Platform...")
     
     try:
-        # Close database connections (synchronous for SQLite)
+        # Stop the expiry scheduler, orchestration workers and warm pool before the database goes away
+        await expiry_scheduler.stop()
+        await scoreboard_service.stop()
+        await session_activity.stop()
+        await platform_counters.stop()
+        await container_metrics.stop()
+        await admission_controller.stop()
+        await image_warmer.stop()
+        password_service.shutdown()
+        container_states.stop()
+        instance_orchestrator.shutdown(wait=False)
+        
+        # Close database connections
+        await close_async_db()
         close_db()
         logger.info("Database connections closed")
         
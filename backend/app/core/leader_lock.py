@@ -0,0 +1,89 @@
+"""
+XploitRUM CTF Platform - Leader Lock
+
+Process-lifetime advisory lock used to elect the one worker that runs a
+background job: pg_try_advisory_lock on PostgreSQL, an flock next to the
+database file on SQLite.
+"""
+
+import os
+from typing import Optional
+from sqlalchemy import text
+
+from app.core.database import engine, is_sqlite
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, a single process is assumed
+    fcntl = None
+
+
+class LeaderLock:
+    """Non-blocking, process-lifetime database advisory lock"""
+
+    def __init__(self, key: int):
+        self.key = key
+        self._conn = None
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None or self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self.held:
+            return True
+        if is_sqlite:
+            return self._try_flock()
+        conn = engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if acquired:
+            self._conn = conn
+        else:
+            conn.close()
+        return bool(acquired)
+
+    def _try_flock(self) -> bool:
+        if fcntl is None:
+            self._fd = -1
+            return True
+        database = engine.url.database or "xploitrum.db"
+        fd = os.open(f"{database}.{self.key:x}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def check(self) -> bool:
+        """Verify a PostgreSQL lock is still held (the session dies with the connection)"""
+        if self._conn is None:
+            return self.held
+        try:
+            self._conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            self.release()
+            return False
+
+    def release(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            except Exception:
+                pass
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+        if self._fd is not None:
+            if self._fd >= 0:
+                os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,132 @@
+"""
+XploitRUM CTF Platform - Authenticated Principal Cache
+
+Protected routes used to run a Session lookup and a db.get(User) before every
+handler. The cache keeps a compact, immutable snapshot of the authenticated
+user per session for PRINCIPAL_CACHE_TTL_SECONDS, along with the session
+timestamps needed to keep enforcing idle and absolute timeouts.
+
+Entries are dropped explicitly on logout, password change and admin
+status/role changes. The cache is per worker process, so another worker sees
+such a change once its own entry expires (a few seconds).
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.models.user import User, UserRole, UserStatus
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Immutable snapshot of the user behind a request"""
+    id: int
+    username: str
+    role: UserRole
+    status: UserStatus
+    score: int
+    session_id: Optional[str] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status == UserStatus.ACTIVE
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == UserRole.ADMIN
+
+    @classmethod
+    def from_user(cls, user: User, session_id: Optional[str] = None) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=user.role,
+            status=user.status,
+            score=user.score or 0,
+            session_id=session_id,
+        )
+
+
+@dataclass(frozen=True)
+class CachedPrincipal:
+    principal: Principal
+    session_created_at: Optional[datetime]
+    session_last_activity_at: Optional[datetime]
+    expires_at: float
+
+
+class PrincipalCache:
+    """TTL cache of principals keyed by session id (or user id for session-less tokens)"""
+
+    # Expired entries are swept when the cache grows past this
+    MAX_ENTRIES = 10000
+
+    def __init__(self, ttl_seconds: float = settings.PRINCIPAL_CACHE_TTL_SECONDS):
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CachedPrincipal] = {}
+        self._by_user: Dict[int, Set[str]] = {}
+
+    @staticmethod
+    def key(user_id: int, session_id: Optional[str]) -> str:
+        return f"s:{session_id}" if session_id else f"u:{user_id}"
+
+    def get(self, key: str) -> Optional[CachedPrincipal]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._drop(key)
+                return None
+            return entry
+
+    def put(self, key: str, principal: Principal, session_times: Tuple[Optional[datetime], Optional[datetime]] = (None, None)) -> None:
+        if self.ttl <= 0:
+            return
+        entry = CachedPrincipal(
+            principal=principal,
+            session_created_at=session_times[0],
+            session_last_activity_at=session_times[1],
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            if len(self._entries) >= self.MAX_ENTRIES:
+                self._sweep()
+            self._entries[key] = entry
+            self._by_user.setdefault(principal.id, set()).add(key)
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry.principal.id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry.principal.id]
+
+    def invalidate_session(self, session_id: str) -> None:
+        """Logout / session expiry"""
+        with self._lock:
+            self._drop(self.key(0, session_id))
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Status, role or password changed, or the user was deleted"""
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+
+
+# Create principal cache instance
+principal_cache = PrincipalCache()
@@ -2,46 +2,83 @@
 XploitRUM CTF Platform - Security Utilities
 """
 
+import base64
 import hashlib
+import hmac
 import secrets
-from cryptography.fernet import Fernet
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import Optional
+from cryptography.fernet import Fernet, MultiFernet
 from app.core.config import settings
+from app.services.password_service import password_service
 from loguru import logger
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Flag encryption key (should be generated and stored securely)
-FLAG_ENCRYPTION_KEY = settings.SECRET_KEY.encode()[:32].ljust(32, b'0')
-fernet = Fernet(Fernet.generate_key())  # In production, use a proper key
+def _derive_key(purpose: str) -> bytes:
+    """Derive a stable 32-byte key from SECRET_KEY so every worker agrees on it"""
+    return hashlib.sha256(f"{purpose}:{settings.SECRET_KEY}".encode()).digest()
+
+
+def _load_flag_keyring() -> MultiFernet:
+    """Build the flag keyring from settings; the first key encrypts, all keys decrypt"""
+    keys = [k.strip() for k in settings.FLAG_ENCRYPTION_KEYS.split(",") if k.strip()]
+    if not keys:
+        logger.warning("FLAG_ENCRYPTION_KEYS not set, deriving flag encryption key from SECRET_KEY")
+        keys = [base64.urlsafe_b64encode(_derive_key("flag-encryption")).decode()]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+# Flag encryption keyring (persistent across workers, supports rotation)
+flag_keyring = _load_flag_keyring()
+FLAG_HMAC_KEY = settings.FLAG_HMAC_KEY.encode() if settings.FLAG_HMAC_KEY else _derive_key("flag-digest")
 
 
 def encrypt_flag(flag: str) -> str:
     """Encrypt a flag for storage"""
     try:
-        encrypted_flag = fernet.encrypt(flag.encode())
+        encrypted_flag = flag_keyring.encrypt(flag.encode())
         return encrypted_flag.decode()
     except Exception as e:
         logger.error(f"Failed to encrypt flag: {e}")
         raise
 
 
+@lru_cache(maxsize=1024)
+def _decrypt_cached(encrypted_flag: str) -> str:
+    return flag_keyring.decrypt(encrypted_flag.encode()).decode()
+
+
 def decrypt_flag(encrypted_flag: str) -> str:
     """Decrypt a flag"""
     try:
-        decrypted_flag = fernet.decrypt(encrypted_flag.encode())
-        return decrypted_flag.decode()
+        return _decrypt_cached(encrypted_flag)
     except Exception as e:
         logger.error(f"Failed to decrypt flag: {e}")
         raise
 
 
-def verify_flag(submitted_flag: str, stored_flag: str) -> bool:
-    """Verify a submitted flag against the stored encrypted flag"""
+def rotate_flag(encrypted_flag: str) -> str:
+    """Re-encrypt a stored flag with the current primary key"""
+    return flag_keyring.rotate(encrypted_flag.encode()).decode()
+
+
+def compute_flag_digest(flag: str) -> str:
+    """Keyed HMAC-SHA256 digest of a flag, stored next to the ciphertext"""
+    return hmac.new(FLAG_HMAC_KEY, flag.strip().encode(), hashlib.sha256).hexdigest()
+
+
+def verify_flag_digest(submitted_flag: str, flag_digest: str) -> bool:
+    """Constant-time check of a submitted flag against its stored digest"""
+    return hmac.compare_digest(compute_flag_digest(submitted_flag), flag_digest)
+
+
+def verify_flag(submitted_flag: str, stored_flag: str, flag_digest: Optional[str] = None) -> bool:
+    """Verify a submitted flag; uses the digest when present, otherwise decrypts"""
+    if flag_digest:
+        return verify_flag_digest(submitted_flag, flag_digest)
     try:
         decrypted_flag = decrypt_flag(stored_flag)
-        return submitted_flag.strip() == decrypted_flag.strip()
+        return hmac.compare_digest(submitted_flag.strip().encode(), decrypted_flag.strip().encode())
     except Exception as e:
         logger.error(f"Flag verification failed: {e}")
         return False
@@ -54,12 +91,12 @@ def generate_secure_token(length: int = 32) -> str:
 
 def hash_password(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return password_service.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_service.verify(plain_password, hashed_password)
 
 
 def sanitize_input(input_string: str) -> str:
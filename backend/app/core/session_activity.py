@@ -0,0 +1,148 @@
+"""
+XploitRUM CTF Platform - Session Activity Tracker
+
+Authenticated requests used to write sessions.last_activity_at on every call.
+The tracker keeps the latest activity per session in memory and only marks a
+session dirty once its stored value is older than
+SESSION_ACTIVITY_WRITE_THRESHOLD_SECONDS; dirty sessions are written in one
+batch every SESSION_ACTIVITY_FLUSH_INTERVAL seconds by a background task.
+
+The stored value can therefore lag the real last activity by at most
+threshold + flush interval ("write lag"). A worker's in-memory value only
+covers the requests it served itself. When it has nothing at least as fresh
+as the stored value, the idle-timeout check allows for the write lag, so a
+session active on another worker is never expired early; otherwise its own
+value is used as is and the idle timeout is not stretched.
+"""
+
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set
+from sqlalchemy import update, bindparam
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.session import Session
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+class SessionActivityTracker:
+    """In-memory last-seen timestamps with coalesced, batched writes"""
+
+    def __init__(self):
+        self.write_threshold = timedelta(seconds=settings.SESSION_ACTIVITY_WRITE_THRESHOLD_SECONDS)
+        self.flush_interval = max(1, settings.SESSION_ACTIVITY_FLUSH_INTERVAL)
+        self._lock = threading.Lock()
+        self._last_seen: Dict[str, datetime] = {}
+        self._stored: Dict[str, datetime] = {}
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def write_lag(self) -> timedelta:
+        """Upper bound on how far sessions.last_activity_at trails real activity"""
+        return self.write_threshold + timedelta(seconds=self.flush_interval)
+
+    def last_activity(self, session_id: str, stored: Optional[datetime]) -> Optional[datetime]:
+        """Latest activity to use for the idle-timeout check"""
+        stored = _aware(stored)
+        with self._lock:
+            seen = self._last_seen.get(session_id)
+        if stored is None or (seen is not None and seen >= stored):
+            return seen
+        # Another worker served the session after us and may not have written its latest activity
+        return stored + self.write_lag
+
+    def touch(self, session_id: str, stored: Optional[datetime], now: Optional[datetime] = None) -> None:
+        """Record activity; the session is queued for writing once the stored value is stale"""
+        now = now or datetime.now(timezone.utc)
+        stored = _aware(stored)
+        with self._lock:
+            self._last_seen[session_id] = now
+            persisted = self._stored.get(session_id)
+            if stored is not None and (persisted is None or stored > persisted):
+                self._stored[session_id] = persisted = stored
+            if persisted is None or now - persisted >= self.write_threshold:
+                self._dirty.add(session_id)
+
+    def forget(self, session_id: str) -> None:
+        """Drop a session (logout, expiry) so it is not written back"""
+        with self._lock:
+            self._last_seen.pop(session_id, None)
+            self._stored.pop(session_id, None)
+            self._dirty.discard(session_id)
+
+    def flush(self) -> int:
+        """Write all dirty sessions in one batch. Returns the number of sessions written."""
+        with self._lock:
+            batch = {session_id: self._last_seen[session_id] for session_id in self._dirty if session_id in self._last_seen}
+            self._dirty.clear()
+        if batch:
+            db = SessionLocal()
+            try:
+                db.connection().execute(
+                    update(Session.__table__)
+                    .where(Session.__table__.c.id == bindparam("sid"))
+                    .values(last_activity_at=bindparam("seen")),
+                    [
+                        {"sid": session_id, "seen": seen.replace(tzinfo=None)}
+                        for session_id, seen in batch.items()
+                    ]
+                )
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Session activity flush failed: {e}")
+                with self._lock:
+                    self._dirty.update(batch)
+                return 0
+            finally:
+                db.close()
+            with self._lock:
+                for session_id, seen in batch.items():
+                    if session_id in self._last_seen:
+                        self._stored[session_id] = seen
+        self._prune()
+        return len(batch)
+
+    def _prune(self) -> None:
+        """Forget sessions idle past the timeout so memory stays bounded"""
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES)
+        with self._lock:
+            for session_id in [sid for sid, seen in self._last_seen.items() if seen < cutoff and sid not in self._dirty]:
+                self._last_seen.pop(session_id, None)
+                self._stored.pop(session_id, None)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="session-activity-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Persist whatever is still pending
+        await asyncio.to_thread(self.flush)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Session activity flush error: {e}")
+
+
+# Create session activity tracker instance
+session_activity = SessionActivityTracker()
@@ -6,9 +6,12 @@ from .user import User
 from .session import Session
 from .challenge import Challenge, ChallengeCategory
 from .instance import Instance
+from .port_reservation import PortReservation
+from .warm_pool_owner import WarmPoolOwner
 from .submission import Submission
 from .log import Log
 from .event import Event
+from .platform_stats import PlatformStats, PlatformCounter, PlatformCounterDelta
 from .member_request import MemberRequest, MemberRequestStatus
 from .pico_challenge import PicoChallenge, PicoSubmission, PicoCategory, PicoDifficulty
 
@@ -18,9 +21,14 @@ __all__ = [
     "Challenge",
     "ChallengeCategory",
     "Instance",
+    "PortReservation",
+    "WarmPoolOwner",
     "Submission",
     "Log",
     "Event",
+    "PlatformStats",
+    "PlatformCounter",
+    "PlatformCounterDelta",
     "MemberRequest",
     "MemberRequestStatus",
     "PicoChallenge",
@@ -41,6 +41,14 @@ class ChallengeStatus(str, enum.Enum):
     MAINTENANCE = "maintenance"
 
 
+class ChallengeImageStatus(str, enum.Enum):
+    """Whether a challenge's docker_image is present on the Docker nodes"""
+    PENDING = "pending"  # Pull requested, waiting for the image warmer
+    PULLING = "pulling"
+    READY = "ready"
+    FAILED = "failed"
+
+
 class Challenge(Base):
     """Challenge model for CTF challenges"""
     
@@ -53,6 +61,7 @@ class Challenge(Base):
     difficulty = Column(Enum(ChallengeDifficulty), nullable=False, index=True)
     points = Column(Integer, nullable=False, default=100)
     flag = Column(String(500), nullable=False)  # Encrypted flag
+    flag_digest = Column(String(64), nullable=True)  # HMAC-SHA256 of the flag for verification
     author = Column(String(255), nullable=False)
     
     # Docker configuration
@@ -62,11 +71,23 @@ class Challenge(Base):
     docker_environment = Column(JSON, nullable=True)  # Environment variables
     docker_volumes = Column(JSON, nullable=True)  # Volume mappings
     
+    # Image pre-pull state, maintained by the image warmer; None = not tracked (deploys pull on demand)
+    image_status = Column(Enum(ChallengeImageStatus, native_enum=False, length=20), nullable=True)
+    image_digest = Column(String(100), nullable=True)  # sha256:... of the pulled image
+    image_pull_progress = Column(Integer, default=0, nullable=False)  # Percent
+    image_pulled_at = Column(DateTime(timezone=True), nullable=True)
+    image_error = Column(Text, nullable=True)
+    
     # Challenge configuration
     max_instances = Column(Integer, default=10, nullable=False)
     instance_timeout = Column(Integer, default=3600, nullable=False)  # seconds
     max_solves = Column(Integer, nullable=True)  # None = unlimited
     
+    # Resource profile per instance; None = platform default (CHALLENGE_DEFAULT_*)
+    cpu_millicores = Column(Integer, nullable=True)  # 1000 = one CPU
+    memory_limit_mb = Column(Integer, nullable=True)
+    pids_limit = Column(Integer, nullable=True)
+    
     # Files and resources
     attachments = Column(JSON, nullable=True)  # List of file paths
     hints = Column(JSON, nullable=True)  # List of hints with costs
@@ -99,10 +120,15 @@ class Challenge(Base):
         """Check if challenge is active"""
         return self.status == ChallengeStatus.ACTIVE
     
+    @property
+    def is_image_ready(self):
+        """Check if the image is known to be on the Docker nodes (or not tracked)"""
+        return self.image_status in (None, ChallengeImageStatus.READY)
+    
     @property
     def is_available(self):
         """Check if challenge is available for deployment"""
-        return self.is_active and self.docker_image is not None
+        return self.is_active and self.docker_image is not None and self.is_image_ready
     
     def get_solve_rate(self):
         """Calculate solve rate percentage"""
@@ -12,6 +12,7 @@ from app.core.database import Base
 
 class InstanceStatus(str, enum.Enum):
     """Instance status enumeration"""
+    QUEUED = "queued"  # Waiting for host capacity (admission queue)
     STARTING = "starting"
     RUNNING = "running"
     STOPPED = "stopped"
@@ -29,6 +30,7 @@ class Instance(Base):
     challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=False, index=True)
     
     # Docker information
+    node = Column(String(64), nullable=True, index=True)  # Docker node the container runs on (None = default node)
     container_id = Column(String(255), unique=True, nullable=True, index=True)
     container_name = Column(String(255), nullable=True)
     container_ip = Column(String(45), nullable=True)  # IPv4/IPv6
@@ -44,6 +46,10 @@ class Instance(Base):
     expires_at = Column(DateTime(timezone=True), nullable=False)
     stopped_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Host capacity committed to this instance at admission
+    reserved_cpu_millicores = Column(Integer, default=0, nullable=False)
+    reserved_memory_mb = Column(Integer, default=0, nullable=False)
+    
     # Resource usage
     cpu_usage = Column(Integer, default=0, nullable=False)  # Percentage
     memory_usage = Column(Integer, default=0, nullable=False)  # MB
@@ -2,11 +2,12 @@
 XploitRUM CTF Platform - Log Model
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, JSON, Index
 from sqlalchemy.sql import func
 import enum
 
 from app.core.database import Base
+from app.utils.pagination import sqlite_keyset_index
 
 
 class LogLevel(str, enum.Enum):
@@ -56,5 +57,13 @@ class Log(Base):
     # Timestamp
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
     
+    __table_args__ = (
+        # Keyset pagination: newest first, id breaks ties
+        Index("ix_logs_created_id", "created_at", "id"),
+        Index("ix_logs_user_created_id", "user_id", "created_at", "id"),
+        sqlite_keyset_index("ix_logs_created_id_sqlite", created_at, id),
+        sqlite_keyset_index("ix_logs_user_created_id_sqlite", user_id, created_at, id),
+    )
+    
     def __repr__(self):
         return f"<Log(id={self.id}, event_type='{self.event_type}', level='{self.level}', message='{self.message[:50]}...')>"
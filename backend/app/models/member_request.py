@@ -2,11 +2,13 @@
 XploitRUM CTF Platform - Member Request Model
 """
 
-from sqlalchemy import Column, String, Integer, DateTime, Text, Enum
+from sqlalchemy import Column, String, Integer, DateTime, Text, Enum, Index
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 import enum
 
+from app.utils.pagination import sqlite_keyset_index
+
 Base = declarative_base()
 
 
@@ -35,4 +37,12 @@ class MemberRequest(Base):
     reviewed_by = Column(String(255), nullable=True)
     reviewed_at = Column(DateTime, nullable=True)
     notes = Column(Text, nullable=True)
+    
+    __table_args__ = (
+        # Keyset pagination: newest first, id breaks ties
+        Index("ix_member_requests_created_id", "created_at", "id"),
+        Index("ix_member_requests_status_created_id", "status", "created_at", "id"),
+        sqlite_keyset_index("ix_member_requests_created_id_sqlite", created_at, id),
+        sqlite_keyset_index("ix_member_requests_status_created_id_sqlite", status, created_at, id),
+    )
 
@@ -1,7 +1,7 @@
 """
 Platform statistics model for managing custom stats
 """
-from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -14,3 +14,36 @@ class PlatformStats(Base):
     total_solves = Column(Integer, default=0, nullable=False)
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+
+class PlatformCounter(Base):
+    """Incrementally maintained platform metric, all-time or for one UTC day"""
+    __tablename__ = "platform_counters"
+    
+    TOTAL = "total"
+    
+    metric = Column(String(64), primary_key=True)
+    period = Column(String(10), primary_key=True, default=TOTAL)  # "total" or YYYY-MM-DD
+    value = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<PlatformCounter(metric='{self.metric}', period='{self.period}', value={self.value})>"
+
+
+class PlatformCounterDelta(Base):
+    """Pending change to a PlatformCounter, appended by the transaction that caused it and
+    folded into platform_counters in the background"""
+    __tablename__ = "platform_counter_deltas"
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    metric = Column(String(64), nullable=False)
+    period = Column(String(10), nullable=False)
+    delta = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_platform_counter_deltas_metric_period", "metric", "period"),
+    )
+    
+    def __repr__(self):
+        return f"<PlatformCounterDelta(metric='{self.metric}', period='{self.period}', delta={self.delta})>"
@@ -0,0 +1,22 @@
+"""
+XploitRUM CTF Platform - Port Reservation Model
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class PortReservation(Base):
+    """Host port handed to a challenge container; the primary key makes a port single-owner across workers"""
+
+    __tablename__ = "port_reservations"
+
+    port = Column(Integer, primary_key=True, autoincrement=False)
+    instance_id = Column(Integer, ForeignKey("instances.id", ondelete="SET NULL"), nullable=True, index=True)
+    container_id = Column(String(255), nullable=True, index=True)  # Set for containers without an instance yet (warm pool)
+    reserved_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<PortReservation(port={self.port}, instance_id={self.instance_id})>"
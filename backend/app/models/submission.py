@@ -2,12 +2,13 @@
 XploitRUM CTF Platform - Submission Model
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Enum, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
 
 from app.core.database import Base
+from app.utils.pagination import sqlite_keyset_index
 
 
 class SubmissionStatus(str, enum.Enum):
@@ -46,6 +47,26 @@ class Submission(Base):
     challenge = relationship("Challenge", back_populates="submissions")
     instance = relationship("Instance")
     
+    __table_args__ = (
+        # One correct submission per user and challenge, enforced by the database.
+        # Enum columns store member names, hence 'CORRECT'.
+        Index(
+            "uq_submissions_user_challenge_correct",
+            "user_id",
+            "challenge_id",
+            unique=True,
+            postgresql_where=text("status = 'CORRECT'"),
+            sqlite_where=text("status = 'CORRECT'")
+        ),
+        # Keyset pagination: newest first, id breaks ties
+        Index("ix_submissions_user_submitted_id", "user_id", "submitted_at", "id"),
+        Index("ix_submissions_challenge_submitted_id", "challenge_id", "submitted_at", "id"),
+        Index("ix_submissions_submitted_id", "submitted_at", "id"),
+        sqlite_keyset_index("ix_submissions_user_submitted_id_sqlite", user_id, submitted_at, id),
+        sqlite_keyset_index("ix_submissions_challenge_submitted_id_sqlite", challenge_id, submitted_at, id),
+        sqlite_keyset_index("ix_submissions_submitted_id_sqlite", submitted_at, id),
+    )
+    
     def __repr__(self):
         return f"<Submission(id={self.id}, user_id={self.user_id}, challenge_id={self.challenge_id}, status='{self.status}')>"
     
@@ -51,7 +51,7 @@ class User(Base):
     
     # CTF specific
     score = Column(Integer, default=0, nullable=False)
-    rank = Column(Integer, nullable=True)
+    rank = Column(Integer, nullable=True)  # Legacy; rank is derived at read time (see scoreboard_service)
     total_solves = Column(Integer, default=0, nullable=False)
     total_attempts = Column(Integer, default=0, nullable=False)
     
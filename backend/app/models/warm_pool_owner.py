@@ -0,0 +1,20 @@
+"""
+XploitRUM CTF Platform - Warm Pool Owner Model
+"""
+
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class WarmPoolOwner(Base):
+    """Heartbeat of a running warm pool; containers labelled with an owner that stopped beating are orphans"""
+
+    __tablename__ = "warm_pool_owners"
+
+    owner_id = Column(String(64), primary_key=True)  # Random per process start, stamped on the pool's containers
+    heartbeat_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<WarmPoolOwner(owner_id={self.owner_id}, heartbeat_at={self.heartbeat_at})>"
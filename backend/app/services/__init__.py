@@ -7,6 +7,16 @@ from .admin_service import admin_service
 from .ctf_service import ctf_service
 from .docker_service import DockerService
 from .event_service import event_service
+from .scoreboard_service import scoreboard_service
+from .stats_service import stats_service
+from .counter_service import platform_counters
+from .runtime_settings_service import runtime_settings
+from .pico_service import pico_registry
+from .orchestrator_service import instance_orchestrator
+from .container_state_service import container_states
+from .metrics_collector_service import container_metrics
+from .admission_service import admission_controller
+from .image_warmer_service import image_warmer
 from .vpn_service import VPNService
 
 __all__ = [
@@ -15,5 +25,15 @@ __all__ = [
     "ctf_service",
     "DockerService",
     "event_service",
+    "scoreboard_service",
+    "stats_service",
+    "platform_counters",
+    "runtime_settings",
+    "pico_registry",
+    "instance_orchestrator",
+    "container_states",
+    "container_metrics",
+    "admission_controller",
+    "image_warmer",
     "VPNService"
 ]
@@ -2,69 +2,132 @@
 XploitRUM CTF Platform - Admin Service
 """
 
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_
+from typing import Dict, Any, Optional
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, desc, and_, case, select
 from fastapi import HTTPException, status
 
 from app.models.user import User, UserRole, UserStatus
 from app.models.challenge import Challenge, ChallengeStatus
 from app.models.instance import Instance, InstanceStatus
-from app.models.submission import Submission
+from app.models.submission import Submission, SubmissionStatus
 from app.models.log import Log
 from app.services.ctf_service import ctf_service
+from app.services.scoreboard_service import scoreboard_service
+from app.services.counter_service import platform_counters, Metric
+from app.services.image_warmer_service import image_warmer
+from app.core.config import settings
+from app.utils.pagination import paginate_keyset, split_page
+from app.core.principal_cache import principal_cache
 
 class AdminService:
     """Admin service for managing platform data and statistics"""
     
+    def __init__(self, dashboard_cache_seconds: float = settings.ADMIN_DASHBOARD_CACHE_SECONDS):
+        self.dashboard_cache_seconds = dashboard_cache_seconds
+        self._dashboard_lock = threading.Lock()
+        self._dashboard: Optional[Dict[str, Any]] = None
+        self._dashboard_expires_at = 0.0
+    
     def get_dashboard_stats(self, db: Session) -> Dict[str, Any]:
-        """Get comprehensive dashboard statistics"""
+        """Get comprehensive dashboard statistics (cached for a few seconds)"""
+        with self._dashboard_lock:
+            if self._dashboard is not None and time.monotonic() < self._dashboard_expires_at:
+                return self._dashboard
+            stats = self._compute_dashboard_stats(db)
+            self._dashboard = stats
+            self._dashboard_expires_at = time.monotonic() + self.dashboard_cache_seconds
+            return stats
+    
+    def _compute_dashboard_stats(self, db: Session) -> Dict[str, Any]:
+        """One grouped query per table, today's counters, top users, the busiest containers
+        and one joined query for recent activity"""
         stats = {}
+        today = platform_counters.read(
+            db, [Metric.USERS, Metric.SUBMISSIONS], period=datetime.utcnow().strftime("%Y-%m-%d")
+        )
         
         # User statistics
+        users_total = users_active = admins = 0
+        for user_status, role, count in db.query(User.status, User.role, func.count()).group_by(User.status, User.role):
+            users_total += count
+            if user_status == UserStatus.ACTIVE:
+                users_active += count
+            if role == UserRole.ADMIN:
+                admins += count
         stats["users"] = {
-            "total": db.query(User).count(),
-            "active": db.query(User).filter(User.status == UserStatus.ACTIVE).count(),
-            "new_today": db.query(User).filter(
-                func.date(User.created_at) == func.current_date()
-            ).count(),
-            "admins": db.query(User).filter(User.role == UserRole.ADMIN).count()
-        }
-        
-        # Challenge statistics
-        stats["challenges"] = {
-            "total": db.query(Challenge).count(),
-            "active": db.query(Challenge).filter(Challenge.status == ChallengeStatus.ACTIVE).count(),
-            "draft": db.query(Challenge).filter(Challenge.status == ChallengeStatus.DRAFT).count(),
-            "by_category": {}
+            "total": users_total,
+            "active": users_active,
+            "new_today": today[Metric.USERS.value],
+            "admins": admins
         }
         
-        # Challenge breakdown by category
-        category_stats = db.query(
-            Challenge.category,
-            func.count(Challenge.id).label('count')
-        ).group_by(Challenge.category).all()
-        
-        for category, count in category_stats:
-            stats["challenges"]["by_category"][category.value] = count
+        # Challenge statistics, with the breakdown by category
+        stats["challenges"] = {"total": 0, "active": 0, "draft": 0, "by_category": {}}
+        for challenge_status, category, count in db.query(
+            Challenge.status, Challenge.category, func.count()
+        ).group_by(Challenge.status, Challenge.category):
+            stats["challenges"]["total"] += count
+            if challenge_status == ChallengeStatus.ACTIVE:
+                stats["challenges"]["active"] += count
+            elif challenge_status == ChallengeStatus.DRAFT:
+                stats["challenges"]["draft"] += count
+            by_category = stats["challenges"]["by_category"]
+            by_category[category.value] = by_category.get(category.value, 0) + count
         
-        # Instance statistics
+        # Instance statistics, with the resource totals of running containers
+        instance_counts = {}
+        running_cpu = running_memory = 0
+        for instance_status, count, cpu, memory in db.query(
+            Instance.status, func.count(), func.sum(Instance.cpu_usage), func.sum(Instance.memory_usage)
+        ).group_by(Instance.status):
+            instance_counts[instance_status] = count
+            if instance_status == InstanceStatus.RUNNING:
+                running_cpu, running_memory = int(cpu or 0), int(memory or 0)
         stats["instances"] = {
-            "total": db.query(Instance).count(),
-            "running": db.query(Instance).filter(Instance.status == InstanceStatus.RUNNING).count(),
-            "stopped": db.query(Instance).filter(Instance.status == InstanceStatus.STOPPED).count(),
-            "expired": db.query(Instance).filter(Instance.status == InstanceStatus.EXPIRED).count()
+            "total": sum(instance_counts.values()),
+            "running": instance_counts.get(InstanceStatus.RUNNING, 0),
+            "stopped": instance_counts.get(InstanceStatus.STOPPED, 0),
+            "expired": instance_counts.get(InstanceStatus.EXPIRED, 0),
+            "cpu_percent": running_cpu,
+            "memory_mb": running_memory
         }
         
+        # Busiest running containers, from the metrics collector's rolling averages
+        stats["top_resource_instances"] = [
+            {
+                "id": instance_id,
+                "container_name": container_name,
+                "challenge_title": challenge_title,
+                "username": username,
+                "cpu_percent": cpu,
+                "memory_mb": memory,
+                "network_bytes": network
+            }
+            for instance_id, container_name, challenge_title, username, cpu, memory, network in db.query(
+                Instance.id, Instance.container_name, Challenge.title, User.username,
+                Instance.cpu_usage, Instance.memory_usage, Instance.network_traffic
+            ).join(
+                Challenge, Challenge.id == Instance.challenge_id
+            ).outerjoin(
+                User, User.id == Instance.user_id
+            ).filter(
+                Instance.status == InstanceStatus.RUNNING
+            ).order_by(
+                desc(Instance.cpu_usage), desc(Instance.memory_usage)
+            ).limit(5)
+        ]
+        
         # Submission statistics
+        submission_counts = dict(db.query(Submission.status, func.count()).group_by(Submission.status).all())
         stats["submissions"] = {
-            "total": db.query(Submission).count(),
-            "correct": db.query(Submission).filter(Submission.status == "correct").count(),
-            "incorrect": db.query(Submission).filter(Submission.status == "incorrect").count(),
-            "today": db.query(Submission).filter(
-                func.date(Submission.submitted_at) == func.current_date()
-            ).count()
+            "total": sum(submission_counts.values()),
+            "correct": submission_counts.get(SubmissionStatus.CORRECT, 0),
+            "incorrect": submission_counts.get(SubmissionStatus.INCORRECT, 0),
+            "today": today[Metric.SUBMISSIONS.value]
         }
         
         # Calculate success rate
@@ -81,19 +144,23 @@ class AdminService:
             User.score > 0
         ).order_by(desc(User.score)).limit(10).all()
         
+        top_ranks = scoreboard_service.get_ranks(db, [user.id for user in top_users])
         stats["top_users"] = [
             {
                 "username": user.username,
                 "full_name": user.full_name,
                 "score": user.score,
                 "total_solves": user.total_solves,
-                "rank": user.rank
+                "rank": top_ranks.get(user.id)
             }
             for user in top_users
         ]
         
-        # Recent activity
-        recent_submissions = db.query(Submission).order_by(
+        # Recent activity: submitters and challenges are joined into the same query
+        recent_submissions = db.query(Submission).options(
+            joinedload(Submission.user).load_only(User.username),
+            joinedload(Submission.challenge).load_only(Challenge.title)
+        ).order_by(
             desc(Submission.submitted_at)
         ).limit(10).all()
         
@@ -102,7 +169,7 @@ class AdminService:
                 "id": sub.id,
                 "username": sub.user.username,
                 "challenge_title": sub.challenge.title,
-                "is_correct": sub.status == "correct",
+                "is_correct": sub.status == SubmissionStatus.CORRECT,
                 "submitted_at": sub.submitted_at.isoformat()
             }
             for sub in recent_submissions
@@ -110,28 +177,49 @@ class AdminService:
         
         return stats
     
+    @staticmethod
+    def _submission_counts(group_column, *criteria):
+        """Attempts and solves per group_column as a subquery"""
+        return select(
+            group_column.label("key"),
+            func.count().label("attempts"),
+            func.count().filter(Submission.status == SubmissionStatus.CORRECT).label("solves")
+        ).where(*criteria).group_by(group_column).subquery()
+    
+    @staticmethod
+    def _running_instance_counts(group_column, *criteria):
+        """Running instances per group_column as a subquery"""
+        return select(
+            group_column.label("key"),
+            func.count().label("active_instances")
+        ).where(Instance.status == InstanceStatus.RUNNING, *criteria).group_by(group_column).subquery()
+    
     def get_user_management_data(self, db: Session, page: int = 1, limit: int = 50) -> Dict[str, Any]:
         """Get user management data with pagination"""
         offset = (page - 1) * limit
         
-        users = db.query(User).order_by(desc(User.created_at)).offset(offset).limit(limit).all()
-        total_users = db.query(User).count()
+        # Aggregates are computed for the users of this page only and joined onto it
+        page_ids = select(User.id).order_by(desc(User.created_at), desc(User.id)).offset(offset).limit(limit)
+        submissions = self._submission_counts(Submission.user_id, Submission.user_id.in_(page_ids))
+        instances = self._running_instance_counts(Instance.user_id, Instance.user_id.in_(page_ids))
+        rows = db.query(
+            User,
+            func.coalesce(submissions.c.attempts, 0),
+            func.coalesce(submissions.c.solves, 0),
+            func.coalesce(instances.c.active_instances, 0)
+        ).outerjoin(
+            submissions, submissions.c.key == User.id
+        ).outerjoin(
+            instances, instances.c.key == User.id
+        ).filter(
+            User.id.in_(page_ids)
+        ).order_by(desc(User.created_at), desc(User.id)).all()
+        total_users = db.query(func.count(User.id)).scalar()
+        
+        ranks = scoreboard_service.get_ranks(db, [user.id for user, _, _, _ in rows])
         
         user_data = []
-        for user in users:
-            # Get user statistics
-            total_submissions = db.query(Submission).filter(Submission.user_id == user.id).count()
-            correct_submissions = db.query(Submission).filter(
-                Submission.user_id == user.id,
-                Submission.status == "correct"
-            ).count()
-            
-            # Get active instances
-            active_instances = db.query(Instance).filter(
-                Instance.user_id == user.id,
-                Instance.status == InstanceStatus.RUNNING
-            ).count()
-            
+        for user, total_submissions, correct_submissions, active_instances in rows:
             user_data.append({
                 "id": user.id,
                 "username": user.username,
@@ -140,7 +228,7 @@ class AdminService:
                 "role": user.role.value,
                 "status": user.status.value,
                 "score": user.score,
-                "rank": user.rank,
+                "rank": ranks.get(user.id),
                 "total_solves": user.total_solves,
                 "total_submissions": total_submissions,
                 "success_rate": round((correct_submissions / total_submissions * 100), 2) if total_submissions > 0 else 0,
@@ -172,6 +260,8 @@ class AdminService:
         user.status = status
         user.updated_at = datetime.utcnow()
         db.commit()
+        scoreboard_service.upsert(user)
+        principal_cache.invalidate_user(user.id)
         
         return {"message": f"User status updated to {status.value}"}
     
@@ -187,28 +277,51 @@ class AdminService:
         user.role = role
         user.updated_at = datetime.utcnow()
         db.commit()
+        scoreboard_service.upsert(user)
+        principal_cache.invalidate_user(user.id)
         
         return {"message": f"User role updated to {role.value}"}
     
-    def get_challenge_management_data(self, db: Session) -> List[Dict[str, Any]]:
-        """Get challenge management data"""
-        challenges = db.query(Challenge).order_by(desc(Challenge.created_at)).all()
+    # Sort keys for the challenge management view; the id is appended as tie-breaker
+    CHALLENGE_SORTS = ("created_at", "solve_rate", "active_instances")
+    
+    def get_challenge_management_data(self, db: Session, limit: int = 50, cursor: Optional[str] = None,
+                                      sort: str = "created_at", descending: bool = True) -> Dict[str, Any]:
+        """Get challenge management data, one keyset-paginated page at a time"""
+        if sort not in self.CHALLENGE_SORTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"sort must be one of: {', '.join(self.CHALLENGE_SORTS)}"
+            )
+        
+        submissions = self._submission_counts(Submission.challenge_id)
+        instances = self._running_instance_counts(Instance.challenge_id)
+        attempts = func.coalesce(submissions.c.attempts, 0)
+        solves = func.coalesce(submissions.c.solves, 0)
+        active_instances = func.coalesce(instances.c.active_instances, 0).label("active_instances")
+        solve_rate = case((attempts > 0, solves * 100.0 / attempts), else_=0.0).label("solve_rate")
+        sort_column = {
+            "created_at": Challenge.created_at,
+            "solve_rate": solve_rate,
+            "active_instances": active_instances,
+        }[sort]
+        keys = [sort_column, Challenge.id]
+        
+        query = select(Challenge, attempts, solves, solve_rate, active_instances).outerjoin(
+            submissions, submissions.c.key == Challenge.id
+        ).outerjoin(
+            instances, instances.c.key == Challenge.id
+        )
+        rows = db.execute(paginate_keyset(query, keys, limit, cursor, descending)).all()
+        
+        sort_index = {"created_at": None, "solve_rate": 3, "active_instances": 4}[sort]
+        rows, next_cursor = split_page(
+            rows, limit,
+            lambda row: [row[0].created_at if sort_index is None else row[sort_index], row[0].id]
+        )
         
         challenge_data = []
-        for challenge in challenges:
-            # Get challenge statistics
-            total_attempts = db.query(Submission).filter(Submission.challenge_id == challenge.id).count()
-            total_solves = db.query(Submission).filter(
-                Submission.challenge_id == challenge.id,
-                Submission.status == "correct"
-            ).count()
-            
-            # Get active instances
-            active_instances = db.query(Instance).filter(
-                Instance.challenge_id == challenge.id,
-                Instance.status == InstanceStatus.RUNNING
-            ).count()
-            
+        for challenge, total_attempts, total_solves, challenge_solve_rate, challenge_instances in rows:
             challenge_data.append({
                 "id": challenge.id,
                 "title": challenge.title,
@@ -218,8 +331,8 @@ class AdminService:
                 "status": challenge.status.value,
                 "total_attempts": total_attempts,
                 "total_solves": total_solves,
-                "solve_rate": round((total_solves / total_attempts * 100), 2) if total_attempts > 0 else 0,
-                "active_instances": active_instances,
+                "solve_rate": round(float(challenge_solve_rate), 2),
+                "active_instances": challenge_instances,
                 "max_instances": challenge.max_instances,
                 "author": challenge.author,
                 "created_at": challenge.created_at.isoformat(),
@@ -227,7 +340,10 @@ class AdminService:
                 "is_featured": challenge.is_featured
             })
         
-        return challenge_data
+        return {
+            "challenges": challenge_data,
+            "next_cursor": next_cursor
+        }
     
     def update_challenge_status(self, db: Session, challenge_id: int, status: ChallengeStatus) -> Dict[str, Any]:
         """Update challenge status"""
@@ -238,12 +354,19 @@ class AdminService:
                 detail="Challenge not found"
             )
         
+        was_active = challenge.status == ChallengeStatus.ACTIVE
         challenge.status = status
-        if status == ChallengeStatus.ACTIVE and not challenge.published_at:
-            challenge.published_at = datetime.utcnow()
+        pull = False
+        if status == ChallengeStatus.ACTIVE:
+            if not challenge.published_at:
+                challenge.published_at = datetime.utcnow()
+            if not was_active:
+                pull = image_warmer.request_pull(db, challenge)
         
         challenge.updated_at = datetime.utcnow()
         db.commit()
+        if pull:
+            image_warmer.wake()
         
         return {"message": f"Challenge status updated to {status.value}"}
     
@@ -278,11 +401,11 @@ class AdminService:
         }
     
     def cleanup_expired_instances(self, db: Session) -> Dict[str, Any]:
-        """Clean up expired instances"""
+        """Queue teardown of expired instances"""
         cleaned_count = ctf_service.cleanup_expired_instances(db)
         
         return {
-            "message": f"Cleaned up {cleaned_count} expired instances",
+            "message": f"Queued cleanup of {cleaned_count} expired instances",
             "cleaned_count": cleaned_count
         }
     
@@ -0,0 +1,359 @@
+"""
+XploitRUM CTF Platform - Instance Admission Control
+
+Every instance reserves the CPU and memory of its challenge's resource profile
+when it is admitted, and the containers are started with exactly those limits.
+A deploy is admitted only while its reservation fits on some healthy Docker
+node next to the STARTING/RUNNING instances already placed there (node
+capacity: see cluster_service.py), the platform has fewer than
+MAX_CONCURRENT_CHALLENGES active instances and the challenge is below its
+max_instances. The node is chosen at admission and recorded on the instance.
+
+A deploy that does not fit is recorded as QUEUED instead of being rejected.
+The queue is strictly first come, first served: nothing is admitted past a
+waiting deploy that is blocked on host capacity or the global cap, so a stream
+of small deploys cannot starve a large one. Deploys waiting only on their own
+challenge's max_instances do not hold up other challenges. Whenever capacity
+is released (stop, expiry, failed deploy, dead container) and every
+ADMISSION_QUEUE_POLL_SECONDS, the queue is drained from the head; entries older
+than ADMISSION_QUEUE_TIMEOUT_SECONDS are dropped as EXPIRED.
+
+Admission decisions are serialized across workers with a transaction-scoped
+advisory lock (pg_advisory_xact_lock on PostgreSQL, an flock next to the
+database file on SQLite), so two workers never admit into the same free slot.
+"""
+
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal, engine, is_sqlite
+from app.core.leader_lock import LeaderLock
+from app.models.challenge import Challenge
+from app.models.instance import Instance, InstanceStatus
+from app.services.expiry_service import _as_utc_naive
+from app.services.orchestrator_service import instance_orchestrator, InstanceOrchestrator
+from app.utils.resources import ResourceProfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, a single process is assumed
+    fcntl = None
+
+ACTIVE_STATUSES = (InstanceStatus.STARTING, InstanceStatus.RUNNING)
+
+
+@dataclass
+class Usage:
+    """Reservations of the active instances"""
+    instances: int
+    cpu_millicores: int
+    memory_mb: int
+
+
+class AdmissionController:
+    """Capacity accounting and the fair wait queue for instance deploys"""
+
+    # Arbitrary, stable advisory lock ids: admission decisions / queue drainer leader
+    LOCK_KEY = 0x58524144
+    DRAIN_LOCK_KEY = 0x58524451
+
+    def __init__(self, orchestrator: InstanceOrchestrator,
+                 poll_seconds: int = settings.ADMISSION_QUEUE_POLL_SECONDS):
+        self.orchestrator = orchestrator
+        self.cluster = orchestrator.docker_service.cluster
+        self.poll_seconds = max(1, poll_seconds)
+        self._thread_lock = threading.Lock()
+        self._serial_lock = threading.Lock()
+        self._leader = LeaderLock(self.DRAIN_LOCK_KEY)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timed_out = 0
+        orchestrator.add_release_listener(self._on_release)
+
+    # Capacity
+
+    def _usage(self, db: Session) -> Usage:
+        count, cpu, memory = db.query(
+            func.count(Instance.id),
+            func.coalesce(func.sum(Instance.reserved_cpu_millicores), 0),
+            func.coalesce(func.sum(Instance.reserved_memory_mb), 0)
+        ).filter(Instance.status.in_(ACTIVE_STATUSES)).one()
+        return Usage(instances=count, cpu_millicores=int(cpu), memory_mb=int(memory))
+
+    def _committed_by_node(self, db: Session) -> Dict[str, Tuple[int, int]]:
+        """(cpu, memory) reserved by active instances on each node"""
+        node = func.coalesce(Instance.node, self.cluster.default)
+        rows = db.query(
+            node,
+            func.coalesce(func.sum(Instance.reserved_cpu_millicores), 0),
+            func.coalesce(func.sum(Instance.reserved_memory_mb), 0)
+        ).filter(Instance.status.in_(ACTIVE_STATUSES)).group_by(node).all()
+        return {name: (int(cpu), int(memory)) for name, cpu, memory in rows}
+
+    def _challenge_active(self, db: Session, challenge_id: int) -> int:
+        return db.query(func.count(Instance.id)).filter(
+            Instance.challenge_id == challenge_id,
+            Instance.status.in_(ACTIVE_STATUSES)
+        ).scalar()
+
+    def _place(self, usage: Usage, committed: Dict[str, Tuple[int, int]],
+               cpu_millicores: int, memory_mb: int) -> Tuple[Optional[str], Optional[str]]:
+        """(node, None) for a reservation that fits the shared capacity, else (None, reason)"""
+        if usage.instances >= settings.MAX_CONCURRENT_CHALLENGES:
+            return None, "global_limit"
+        node = self.cluster.place(committed, cpu_millicores, memory_mb)
+        if node is None:
+            return None, "capacity"
+        return node, None
+
+    # Serialization
+
+    @contextmanager
+    def serialized(self, db: Session):
+        """Hold the admission lock around a capacity check and its write. On PostgreSQL the
+        lock ends with db's transaction, so the caller must commit inside the block."""
+        if not is_sqlite:
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": self.LOCK_KEY})
+            yield
+            return
+        with self._serial_lock:
+            if fcntl is None:
+                yield
+                return
+            database = engine.url.database or "xploitrum.db"
+            fd = os.open(f"{database}.{self.LOCK_KEY:x}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    # Admission
+
+    def reserve(self, instance: Instance, challenge: Challenge) -> ResourceProfile:
+        """Record the challenge's resource profile on a new instance and check it can ever fit"""
+        profile = ResourceProfile.for_challenge(challenge)
+        if not self.cluster.fits_any(profile.cpu_millicores, profile.memory_mb):
+            with self._thread_lock:
+                self._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="This challenge needs more resources than any Docker node provides"
+            )
+        instance.reserved_cpu_millicores = profile.cpu_millicores
+        instance.reserved_memory_mb = profile.memory_mb
+        return profile
+
+    def try_admit(self, db: Session, instance: Instance, challenge: Challenge) -> bool:
+        """Set a new (unflushed) instance to STARTING if it fits now, else QUEUED.
+        Call inside serialized(); raises 503 when it can neither run nor wait."""
+        self.reserve(instance, challenge)
+        queue_empty = db.query(Instance.id).filter(Instance.status == InstanceStatus.QUEUED).first() is None
+        blocker = None
+        if self._challenge_active(db, challenge.id) >= challenge.max_instances:
+            blocker = "challenge_limit"
+        elif not queue_empty:
+            blocker = "queue"
+        else:
+            instance.node, blocker = self._place(
+                self._usage(db), self._committed_by_node(db),
+                instance.reserved_cpu_millicores, instance.reserved_memory_mb
+            )
+
+        if blocker is None:
+            instance.status = InstanceStatus.STARTING
+            with self._thread_lock:
+                self._admitted += 1
+            return True
+
+        queued = db.query(func.count(Instance.id)).filter(Instance.status == InstanceStatus.QUEUED).scalar()
+        if not settings.ADMISSION_QUEUE_ENABLED or queued >= settings.ADMISSION_QUEUE_MAX:
+            with self._thread_lock:
+                self._rejected += 1
+            detail = ("Maximum instances reached for this challenge" if blocker == "challenge_limit"
+                      else "The platform is at capacity, please try again later")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+
+        instance.status = InstanceStatus.QUEUED
+        with self._thread_lock:
+            self._queued += 1
+        return False
+
+    def cancel(self, db: Session, instance: Instance) -> bool:
+        """Withdraw a QUEUED instance; False if it was admitted meanwhile"""
+        result = db.query(Instance).filter(
+            Instance.id == instance.id,
+            Instance.status == InstanceStatus.QUEUED
+        ).update({"status": InstanceStatus.STOPPED, "stopped_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        return result == 1
+
+    def drain_queue(self) -> List[int]:
+        """Admit queued instances in arrival order while they fit; returns the admitted ids"""
+        admitted: List[int] = []
+        db = SessionLocal()
+        try:
+            with self.serialized(db):
+                queued = db.query(Instance, Challenge).join(
+                    Challenge, Challenge.id == Instance.challenge_id
+                ).filter(Instance.status == InstanceStatus.QUEUED).order_by(Instance.id).all()
+                if not queued:
+                    db.commit()
+                    return admitted
+
+                now = datetime.utcnow()
+                cutoff = now - timedelta(seconds=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS)
+                usage = self._usage(db)
+                committed = self._committed_by_node(db)
+                per_challenge: Dict[int, int] = {}
+                for instance, challenge in queued:
+                    if _as_utc_naive(instance.started_at) < cutoff:
+                        instance.status = InstanceStatus.EXPIRED
+                        instance.stopped_at = now
+                        instance.error_message = "Timed out waiting for host capacity"
+                        with self._thread_lock:
+                            self._timed_out += 1
+                        continue
+                    if challenge.id not in per_challenge:
+                        per_challenge[challenge.id] = self._challenge_active(db, challenge.id)
+                    if per_challenge[challenge.id] >= challenge.max_instances:
+                        continue  # Only blocks later entries of the same challenge
+                    node, blocker = self._place(usage, committed, instance.reserved_cpu_millicores, instance.reserved_memory_mb)
+                    if blocker is not None:
+                        break  # First come, first served: nothing overtakes the head
+                    used_cpu, used_memory = committed.get(node, (0, 0))
+                    committed[node] = (used_cpu + instance.reserved_cpu_millicores, used_memory + instance.reserved_memory_mb)
+                    instance.node = node
+                    instance.status = InstanceStatus.STARTING
+                    instance.started_at = now
+                    instance.expires_at = now + timedelta(seconds=challenge.instance_timeout)
+                    usage.instances += 1
+                    usage.cpu_millicores += instance.reserved_cpu_millicores
+                    usage.memory_mb += instance.reserved_memory_mb
+                    per_challenge[challenge.id] += 1
+                    admitted.append(instance.id)
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to drain admission queue: {e}")
+            return []
+        finally:
+            db.close()
+
+        if admitted:
+            with self._thread_lock:
+                self._admitted += len(admitted)
+            logger.info(f"Admitted {len(admitted)} queued instance(s): {admitted}")
+        for instance_id in admitted:
+            self.orchestrator.enqueue_deploy(instance_id)
+        return admitted
+
+    # Queue drainer
+
+    def start(self) -> None:
+        """Start the queue drainer on the running event loop"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="admission-queue")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._loop = None
+        self._leader.release()
+
+    def _on_release(self, instance_id: int) -> None:
+        """Orchestrator callback (worker thread): wake the drainer instead of waiting for the poll"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # Loop closed during shutdown
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await asyncio.to_thread(self._leader.try_acquire) and await asyncio.to_thread(self._leader.check):
+                    await asyncio.to_thread(self.drain_queue)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Admission queue error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    # Reads
+
+    def queue_position(self, db: Session, instance_id: int) -> Optional[int]:
+        """1-based place of a QUEUED instance in the wait queue, None if it is not queued"""
+        queued = db.query(Instance.id).filter(
+            Instance.id == instance_id,
+            Instance.status == InstanceStatus.QUEUED
+        ).first()
+        if queued is None:
+            return None
+        return db.query(func.count(Instance.id)).filter(
+            Instance.status == InstanceStatus.QUEUED,
+            Instance.id <= instance_id
+        ).scalar()
+
+    def get_stats(self, db: Session) -> Dict[str, Any]:
+        capacity = self.cluster.total_capacity()
+        usage = self._usage(db)
+        committed = self._committed_by_node(db)
+        queued = db.query(func.count(Instance.id)).filter(Instance.status == InstanceStatus.QUEUED).scalar()
+        with self._thread_lock:
+            counters = {
+                "admitted": self._admitted,
+                "queued_total": self._queued,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+            }
+        return {
+            "capacity": {"cpu_millicores": capacity.cpu_millicores, "memory_mb": capacity.memory_mb},
+            "committed": {"cpu_millicores": usage.cpu_millicores, "memory_mb": usage.memory_mb},
+            "nodes": {
+                node.name: {
+                    "healthy": node.healthy,
+                    "capacity": {"cpu_millicores": node.capacity.cpu_millicores, "memory_mb": node.capacity.memory_mb},
+                    "committed": dict(zip(("cpu_millicores", "memory_mb"), committed.get(node.name, (0, 0)))),
+                }
+                for node in self.cluster.nodes.values()
+            },
+            "active_instances": usage.instances,
+            "max_concurrent_instances": settings.MAX_CONCURRENT_CHALLENGES,
+            "queue_length": queued,
+            "queue_enabled": settings.ADMISSION_QUEUE_ENABLED,
+            "draining": self._leader.held,
+            **counters,
+        }
+
+
+# Create admission controller instance
+admission_controller = AdmissionController(instance_orchestrator)
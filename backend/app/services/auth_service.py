@@ -5,7 +5,6 @@ XploitRUM CTF Platform - Authentication Service
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -13,9 +12,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import settings
 from app.models.user import User, UserRole, UserStatus
 from app.core.database import get_db
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.core.principal_cache import principal_cache
+from app.services.password_service import password_service
 
 # JWT token scheme
 security = HTTPBearer()
@@ -31,11 +29,11 @@ class AuthService:
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        return password_service.verify(plain_password, hashed_password)
     
     def get_password_hash(self, password: str) -> str:
         """Hash a password"""
-        return pwd_context.hash(password)
+        return password_service.hash(password)
     
     def create_access_token(self, data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT access token"""
@@ -84,7 +82,8 @@ class AuthService:
         if not user:
             return None
         
-        if not self.verify_password(password, user.password_hash):
+        password_valid, upgraded_hash = password_service.verify_and_update(password, user.password_hash)
+        if not password_valid:
             return None
         
         if not user.is_active:
@@ -93,6 +92,10 @@ class AuthService:
         if user.is_locked:
             return None
         
+        if upgraded_hash:
+            user.password_hash = upgraded_hash
+            db.commit()
+        
         return user
     
     def register_user(self, db: Session, user_data: Dict[str, Any]) -> User:
@@ -171,6 +174,7 @@ class AuthService:
         user.password_hash = self.get_password_hash(new_password)
         user.updated_at = datetime.utcnow()
         db.commit()
+        principal_cache.invalidate_user(user.id)
         
         return True
     
@@ -225,6 +229,7 @@ class AuthService:
             user.password_reset_expires = None
             user.updated_at = datetime.utcnow()
             db.commit()
+            principal_cache.invalidate_user(user.id)
             
             return True
             
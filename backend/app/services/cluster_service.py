@@ -0,0 +1,278 @@
+"""
+XploitRUM CTF Platform - Docker Node Cluster
+
+Challenge containers can run on several Docker daemons ("nodes"), configured
+in DOCKER_NODES as comma-separated name=url pairs:
+
+    DOCKER_NODES=local=unix:///var/run/docker.sock,edge1=tcp://10.0.0.2:2376
+
+An empty DOCKER_NODES means one node, "local", at DOCKER_HOST. A fake://
+URL selects the in-process fake daemon (see fake_docker.py).
+
+Each node's capacity is its CPUs and memory as reported by `docker info`
+(or HOST_*_CAPACITY when set), less HOST_MEMORY_RESERVED_MB, with CPU scaled
+by HOST_CPU_OVERCOMMIT. A health thread calls `info` on every node each
+DOCKER_NODE_HEALTH_INTERVAL seconds. A node that fails
+DOCKER_NODE_FAILURE_THRESHOLD checks in a row gets no new instances until a
+check succeeds again. Nodes that were unreachable at startup are connected
+on a later check.
+
+Placement is decided by admission control against the reservations already
+committed per node. DOCKER_PLACEMENT_STRATEGY=binpack (the default) picks
+the node with the least room left after the instance, filling nodes before
+using new ones and keeping big gaps for big profiles. spread picks the node
+with the most room.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import docker
+from loguru import logger
+
+from app.core.config import settings
+from app.services.fake_docker import FakeDockerClient
+
+DEFAULT_NODE = "local"
+
+
+@dataclass(frozen=True)
+class HostCapacity:
+    """What instances may reserve on one node"""
+    cpu_millicores: int
+    memory_mb: int
+
+
+def parse_docker_nodes(value: str) -> List[Tuple[str, str]]:
+    """"a=tcp://host:2376,b=fake://" -> [(name, url)]; empty -> the local daemon at DOCKER_HOST"""
+    nodes: List[Tuple[str, str]] = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition("=")
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"Invalid DOCKER_NODES entry (expected name=url): {item}")
+        if any(existing == name.strip() for existing, _ in nodes):
+            raise ValueError(f"Duplicate Docker node name: {name.strip()}")
+        nodes.append((name.strip(), url.strip()))
+    return nodes or [(DEFAULT_NODE, settings.DOCKER_HOST)]
+
+
+class DockerNode:
+    """One Docker daemon, its capacity and its health"""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.client = None
+        self.healthy = False
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self._capacity: Optional[HostCapacity] = None
+
+    @property
+    def is_fake(self) -> bool:
+        return self.url.startswith("fake://")
+
+    @property
+    def is_local(self) -> bool:
+        """Containers run on this machine (their cgroups and /proc are visible here)"""
+        return self.url.startswith("unix://") or self.url.startswith("npipe://")
+
+    @property
+    def public_host(self) -> Optional[str]:
+        """Host users reach this node's published ports on; None for the platform host itself"""
+        if self.is_local or self.is_fake:
+            return None
+        return urlparse(self.url).hostname
+
+    @property
+    def capacity(self) -> HostCapacity:
+        if self._capacity is None:
+            self._capacity = self._scale(*self._local_resources())
+        return self._capacity
+
+    def connect(self) -> None:
+        """Create the client and read the node's resources; raises if the daemon is unreachable"""
+        if self.is_fake:
+            client = FakeDockerClient.from_url(self.name, self.url)
+        elif self.name == DEFAULT_NODE and self.url == settings.DOCKER_HOST:
+            client = docker.from_env(timeout=settings.DOCKER_NODE_TIMEOUT)
+        else:
+            client = docker.DockerClient(base_url=self.url, timeout=settings.DOCKER_NODE_TIMEOUT)
+        self._read_info(client)
+        self.client = client
+
+    def check(self) -> bool:
+        """One health check; returns True if the node just became healthy"""
+        self.last_checked = time.time()
+        try:
+            if self.client is None:
+                self.connect()
+            else:
+                self._read_info(self.client)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            if self.healthy and self.failures >= settings.DOCKER_NODE_FAILURE_THRESHOLD:
+                self.healthy = False
+                logger.warning(f"Docker node {self.name} marked unhealthy after {self.failures} failed checks: {e}")
+            return False
+        recovered = not self.healthy
+        self.failures = 0
+        self.last_error = None
+        self.healthy = True
+        return recovered
+
+    def _read_info(self, client) -> None:
+        info = client.info()
+        self._capacity = self._scale(int(info["NCPU"]) * 1000, int(info["MemTotal"]) // (1024 * 1024))
+
+    @staticmethod
+    def _local_resources() -> Tuple[int, int]:
+        """(millicores, MB) of this machine, for simulation mode"""
+        cpu = (os.cpu_count() or 1) * 1000
+        try:
+            memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        except (ValueError, OSError, AttributeError):
+            memory = 0
+        return cpu, memory
+
+    @staticmethod
+    def _scale(cpu: int, memory: int) -> HostCapacity:
+        cpu = settings.HOST_CPU_CAPACITY_MILLICORES or cpu
+        memory = (settings.HOST_MEMORY_CAPACITY_MB or memory) - settings.HOST_MEMORY_RESERVED_MB
+        return HostCapacity(
+            cpu_millicores=int(cpu * max(settings.HOST_CPU_OVERCOMMIT, 0.0)),
+            memory_mb=max(0, memory)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "connected": self.client is not None,
+            "healthy": self.healthy,
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+            "capacity": {"cpu_millicores": self.capacity.cpu_millicores, "memory_mb": self.capacity.memory_mb},
+        }
+
+
+class DockerCluster:
+    """The configured Docker nodes, their health tracking and instance placement"""
+
+    def __init__(self, nodes: List[Tuple[str, str]], on_connect: Optional[Callable[[DockerNode], None]] = None):
+        self.nodes: Dict[str, DockerNode] = {name: DockerNode(name, url) for name, url in nodes}
+        self.default = next(iter(self.nodes))
+        self._on_connect = on_connect
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        for node in self.nodes.values():
+            try:
+                node.connect()
+                node.healthy = True
+                if on_connect is not None:
+                    on_connect(node)
+                logger.info(f"Docker node {node.name} connected ({node.url})")
+            except Exception as e:
+                node.client = None
+                node.healthy = False
+                node.last_error = str(e)
+                logger.warning(f"Docker node {node.name} not available: {e}")
+
+    @property
+    def simulated(self) -> bool:
+        """No node was ever reachable: instances get mock containers"""
+        return all(node.client is None for node in self.nodes.values())
+
+    def get(self, name: Optional[str]) -> DockerNode:
+        """The named node; instances recorded before multi-node support run on the default one"""
+        node = self.nodes.get(name or self.default)
+        if node is None:
+            raise KeyError(f"Unknown Docker node: {name}")
+        return node
+
+    def public_host(self, name: Optional[str]) -> Optional[str]:
+        """Where an instance's published ports are reached; None = the platform host"""
+        node = self.nodes.get(name or self.default)
+        return node.public_host if node is not None else None
+
+    def connected(self) -> List[DockerNode]:
+        return [node for node in self.nodes.values() if node.client is not None]
+
+    def schedulable(self) -> List[DockerNode]:
+        """Nodes that may receive new instances"""
+        if self.simulated:
+            return [self.nodes[self.default]]
+        return [node for node in self.nodes.values() if node.client is not None and node.healthy]
+
+    # Placement
+
+    def place(self, committed: Dict[str, Tuple[int, int]], cpu_millicores: int, memory_mb: int) -> Optional[str]:
+        """Node for a new reservation given the (cpu, memory) already committed per node, or None if none fits"""
+        spread = settings.DOCKER_PLACEMENT_STRATEGY == "spread"
+        best: Optional[Tuple[Tuple[int, int, str], str]] = None
+        for node in self.schedulable():
+            used_cpu, used_memory = committed.get(node.name, (0, 0))
+            free_cpu = node.capacity.cpu_millicores - used_cpu - cpu_millicores
+            free_memory = node.capacity.memory_mb - used_memory - memory_mb
+            if free_cpu < 0 or free_memory < 0:
+                continue
+            # Memory first: running out of it kills containers, running out of CPU only slows them
+            key = (-free_memory, -free_cpu, node.name) if spread else (free_memory, free_cpu, node.name)
+            if best is None or key < best[0]:
+                best = (key, node.name)
+        return best[1] if best else None
+
+    def fits_any(self, cpu_millicores: int, memory_mb: int) -> bool:
+        """Whether a reservation fits an empty node at all"""
+        return any(
+            cpu_millicores <= node.capacity.cpu_millicores and memory_mb <= node.capacity.memory_mb
+            for node in self.nodes.values()
+        )
+
+    def total_capacity(self) -> HostCapacity:
+        nodes = self.schedulable()
+        return HostCapacity(
+            cpu_millicores=sum(node.capacity.cpu_millicores for node in nodes),
+            memory_mb=sum(node.capacity.memory_mb for node in nodes)
+        )
+
+    # Health tracking
+
+    def start(self, interval: int = settings.DOCKER_NODE_HEALTH_INTERVAL) -> None:
+        if (self.simulated and not settings.DOCKER_NODES) or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(max(1, interval),), name="docker-node-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self, interval: int) -> None:
+        while not self._stop.wait(interval):
+            self.check_all()
+
+    def check_all(self) -> None:
+        for node in list(self.nodes.values()):
+            if node.check():
+                logger.info(f"Docker node {node.name} is healthy")
+                if self._on_connect is not None:
+                    try:
+                        self._on_connect(node)
+                    except Exception as e:
+                        logger.error(f"Failed to prepare Docker node {node.name}: {e}")
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [node.get_stats() for node in self.nodes.values()]
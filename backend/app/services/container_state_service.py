@@ -0,0 +1,303 @@
+"""
+XploitRUM CTF Platform - Container State Cache
+
+Instance listings used to inspect every running container through the Docker
+API on each poll. Instead, each worker keeps the status, IP and port mappings
+of all managed containers (label managed_by=xploitrum) in memory, fed by one
+long-lived subscription to the Docker events API per Docker node. A node's
+part of the cache is seeded from a full container listing and re-seeded
+whenever its event stream reconnects, so missed events never leave it stale
+for long.
+
+Changes are written back to the Instance row. A container that dies while its
+instance is RUNNING is given CONTAINER_DEATH_GRACE_SECONDS for an
+orchestrated stop to record STOPPED/EXPIRED; if the instance is still RUNNING
+after that, it is marked ERROR and its ports are released. The write-back is a
+conditional UPDATE, so with several workers watching the same events only one
+of them applies it.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+from sqlalchemy import update
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.instance import Instance, InstanceStatus
+from app.services.counter_service import platform_counters, DomainEvent
+from app.services.orchestrator_service import instance_orchestrator, InstanceOrchestrator
+from app.services.port_service import port_allocator
+
+MANAGED_LABEL = "managed_by=xploitrum"
+
+
+@dataclass(frozen=True)
+class ContainerState:
+    """What the Docker daemon last told us about a managed container"""
+    container_id: str
+    name: str
+    status: str
+    ip_address: Optional[str]
+    ports: Dict[str, Any]
+    exit_code: Optional[int] = None
+    updated_at: float = 0.0
+    node: Optional[str] = None
+
+
+class ContainerStateCache:
+    """In-memory view of managed containers, kept current by the Docker event stream"""
+
+    # Seconds between reconnect attempts after the event stream fails
+    RETRY_SECONDS = 5
+    # Actions after which the container is inspected again (network details may have changed)
+    INSPECT_ACTIONS = {"start", "restart", "unpause"}
+
+    def __init__(self, orchestrator: InstanceOrchestrator,
+                 grace_seconds: float = settings.CONTAINER_DEATH_GRACE_SECONDS):
+        self.orchestrator = orchestrator
+        self.docker_service = orchestrator.docker_service
+        self.grace_seconds = max(0.0, grace_seconds)
+        self._lock = threading.Lock()
+        self._states: Dict[str, ContainerState] = {}
+        self._synced: Set[str] = set()
+        self._stop = threading.Event()
+        self._streams: Dict[str, Any] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._deaths: Dict[str, threading.Timer] = {}
+        self._events_seen = 0
+        self._resyncs = 0
+
+    # Lifecycle
+
+    def start(self) -> None:
+        if not settings.CONTAINER_EVENTS_ENABLED or not self.docker_service.is_available or self._threads:
+            return
+        self._stop.clear()
+        # One stream per configured node; nodes that are not connected yet are retried
+        for node in self.docker_service.cluster.nodes:
+            thread = threading.Thread(target=self._run, args=(node,), name=f"container-events-{node}", daemon=True)
+            self._threads[node] = thread
+            thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for node in list(self._streams):
+            self._close_stream(node)
+        for thread in self._threads.values():
+            thread.join(timeout=10)
+        self._threads = {}
+        with self._lock:
+            timers, self._deaths = list(self._deaths.values()), {}
+            self._synced.clear()
+        for timer in timers:
+            timer.cancel()
+
+    def _close_stream(self, node: str) -> None:
+        stream = self._streams.pop(node, None)
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _run(self, node: str) -> None:
+        while not self._stop.is_set():
+            try:
+                client = self.docker_service.client_for(node)
+                # Subscribe before listing so nothing between the two is lost
+                since = int(time.time())
+                stream = self._streams[node] = client.events(
+                    since=since, decode=True,
+                    filters={"type": "container", "label": [MANAGED_LABEL]}
+                )
+                self._resync(node)
+                for event in stream:
+                    if self._stop.is_set():
+                        break
+                    self._handle(node, event)
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning(f"Docker event stream of node {node} interrupted, reconnecting: {e}")
+            finally:
+                with self._lock:
+                    self._synced.discard(node)
+                self._close_stream(node)
+            self._stop.wait(self.RETRY_SECONDS)
+
+    # Cache maintenance
+
+    def _state_from_container(self, container, node: str) -> ContainerState:
+        ip_address, ports = self.docker_service.get_network_info(container)
+        state = container.attrs.get("State", {})
+        exit_code = state.get("ExitCode") if container.status != "running" else None
+        return ContainerState(
+            container_id=container.id,
+            name=container.name,
+            status=container.status,
+            ip_address=ip_address,
+            ports=ports or {},
+            exit_code=exit_code,
+            updated_at=time.time(),
+            node=node
+        )
+
+    def _resync(self, node: str) -> None:
+        """Replace a node's part of the cache with a full listing of its managed containers"""
+        containers = self.docker_service.client_for(node).containers.list(all=True, filters={"label": MANAGED_LABEL})
+        states = {container.id: self._state_from_container(container, node) for container in containers}
+        with self._lock:
+            self._states = {cid: state for cid, state in self._states.items() if state.node != node}
+            self._states.update(states)
+            self._synced.add(node)
+            self._resyncs += 1
+        logger.info(f"Container state cache synced: {len(states)} managed container(s) on node {node}")
+
+    def _handle(self, node: str, event: Dict[str, Any]) -> None:
+        action = event.get("Action") or event.get("status") or ""
+        actor = event.get("Actor", {})
+        container_id = actor.get("ID") or event.get("id")
+        if not container_id or ":" in action:  # exec_start: ..., health_status: ...
+            return
+        with self._lock:
+            self._events_seen += 1
+
+        if action in self.INSPECT_ACTIONS:
+            self._refresh(node, container_id)
+        elif action == "rename":
+            self._patch(container_id, name=actor.get("Attributes", {}).get("name"))
+        elif action == "pause":
+            self._patch(container_id, status="paused")
+        elif action == "die":
+            exit_code = actor.get("Attributes", {}).get("exitCode")
+            exit_code = int(exit_code) if exit_code and exit_code.lstrip("-").isdigit() else None
+            self._patch(container_id, status="exited", exit_code=exit_code)
+            self._schedule_death(container_id, exit_code)
+        elif action == "destroy":
+            with self._lock:
+                state = self._states.pop(container_id, None)
+            if state is None or state.status == "running":
+                self._schedule_death(container_id)
+
+    def _refresh(self, node: str, container_id: str) -> None:
+        try:
+            container = self.docker_service.client_for(node).containers.get(container_id)
+        except Exception as e:
+            logger.debug(f"Could not inspect container {container_id} on node {node}: {e}")
+            return
+        new = self._state_from_container(container, node)
+        with self._lock:
+            old = self._states.get(container_id)
+            self._states[container_id] = new
+            death = self._deaths.pop(container_id, None)
+        if death is not None:
+            death.cancel()  # Restarted within the grace period
+        if old is None or (old.ip_address, old.ports) != (new.ip_address, new.ports):
+            self._write_network(new)
+
+    def _patch(self, container_id: str, **changes: Any) -> None:
+        changes = {key: value for key, value in changes.items() if value is not None or key == "exit_code"}
+        with self._lock:
+            state = self._states.get(container_id)
+            if state is not None:
+                self._states[container_id] = replace(state, updated_at=time.time(), **changes)
+
+    # Write-back
+
+    def _write_network(self, state: ContainerState) -> None:
+        """Record a running container's (possibly new) IP and port mappings on its instance"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(Instance)
+                .where(Instance.container_id == state.container_id, Instance.status == InstanceStatus.RUNNING)
+                .values(container_ip=state.ip_address, container_ports=state.ports)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record network details of container {state.container_id}: {e}")
+        finally:
+            db.close()
+
+    def _schedule_death(self, container_id: str, exit_code: Optional[int] = None) -> None:
+        timer = threading.Timer(self.grace_seconds, self._mark_dead, args=(container_id, exit_code))
+        timer.daemon = True
+        with self._lock:
+            if container_id in self._deaths or self._stop.is_set():
+                return
+            self._deaths[container_id] = timer
+        timer.start()
+
+    def _mark_dead(self, container_id: str, exit_code: Optional[int] = None) -> Optional[int]:
+        """Mark the instance of a dead container ERROR unless it was stopped on purpose meanwhile.
+        Returns the instance id if this worker applied the change."""
+        with self._lock:
+            self._deaths.pop(container_id, None)
+            state = self._states.get(container_id)
+        if state is not None and state.status == "running":
+            return None  # Restarted (e.g. by a restart policy)
+        db = SessionLocal()
+        try:
+            instance_id = db.query(Instance.id).filter(
+                Instance.container_id == container_id,
+                Instance.status == InstanceStatus.RUNNING
+            ).scalar()
+            if instance_id is None or self.orchestrator.is_pending(instance_id):
+                return None
+            message = "Container exited unexpectedly" + (f" (exit code {exit_code})" if exit_code is not None else "")
+            result = db.execute(
+                update(Instance)
+                .where(Instance.id == instance_id, Instance.status == InstanceStatus.RUNNING)
+                .values(status=InstanceStatus.ERROR, error_message=message, stopped_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                db.rollback()
+                return None  # Stopped meanwhile, or another worker got there first
+            # Bulk updates bypass the flush-derived counter events
+            platform_counters.emit(db, [DomainEvent.INSTANCE_STOPPED])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record death of container {container_id}: {e}")
+            return None
+        finally:
+            db.close()
+        port_allocator.release_instance(instance_id)
+        self.orchestrator.notify_released(instance_id)
+        logger.warning(f"Instance {instance_id}: {message}")
+        return instance_id
+
+    # Reads
+
+    @property
+    def is_synced(self) -> bool:
+        """True while the cache mirrors every node (all streams connected and seeded)"""
+        with self._lock:
+            return bool(self._threads) and len(self._synced) == len(self._threads)
+
+    def get(self, container_id: Optional[str]) -> Optional[ContainerState]:
+        if not container_id:
+            return None
+        with self._lock:
+            return self._states.get(container_id)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "synced": bool(self._threads) and len(self._synced) == len(self._threads),
+                "synced_nodes": sorted(self._synced),
+                "containers": len(self._states),
+                "events_seen": self._events_seen,
+                "resyncs": self._resyncs,
+                "pending_death_checks": len(self._deaths),
+            }
+
+
+# Create container state cache instance
+container_states = ContainerStateCache(instance_orchestrator)
@@ -0,0 +1,388 @@
+"""
+XploitRUM CTF Platform - Platform Counters
+
+Keeps running totals for users, submissions, solves, instances and events in
+the platform_counters table, so dashboards read a few rows instead of
+counting whole tables.
+
+Domain events (registration, flag solve, instance start/stop, event
+creation, ...) are derived from the ORM changes of every flush and turned
+into counter increments. Request transactions never touch the shared counter
+rows (every submission would queue on the same "total" row lock); they
+append rows to platform_counter_deltas on the flushing session's connection,
+so the deltas commit or roll back together with the change that caused
+them. One worker folds pending deltas into platform_counters every
+COUNTER_FOLD_INTERVAL seconds, and reads add the still-pending deltas, so
+counters are exact at all times. Flow metrics also get a row per UTC day;
+gauges only have a total.
+
+Anything that bypasses the ORM (bulk updates, manual SQL) is not seen, so
+the same worker rebuilds all counters from the source tables every
+COUNTER_RECONCILE_INTERVAL seconds.
+"""
+
+import asyncio
+import enum
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, func, insert, select, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal, AsyncBackedSession, is_sqlite
+from app.core.leader_lock import LeaderLock
+from app.models.event import Event
+from app.models.instance import Instance, InstanceStatus
+from app.models.platform_stats import PlatformCounter, PlatformCounterDelta
+from app.models.submission import Submission, SubmissionStatus
+from app.models.user import User, UserStatus
+
+TOTAL = PlatformCounter.TOTAL
+
+
+class DomainEvent(str, enum.Enum):
+    """Domain events that move platform counters"""
+    USER_REGISTERED = "user_registered"
+    USER_DELETED = "user_deleted"
+    USER_ACTIVATED = "user_activated"
+    USER_DEACTIVATED = "user_deactivated"
+    SUBMISSION_MADE = "submission_made"
+    FLAG_SOLVED = "flag_solved"
+    INSTANCE_CREATED = "instance_created"
+    INSTANCE_STARTED = "instance_started"
+    INSTANCE_STOPPED = "instance_stopped"
+    EVENT_CREATED = "event_created"
+
+
+class Metric(str, enum.Enum):
+    """Counter names; flow metrics are also bucketed by day"""
+    USERS = "users"
+    USERS_ACTIVE = "users_active"
+    SUBMISSIONS = "submissions"
+    FLAGS_CAPTURED = "flags_captured"
+    INSTANCES = "instances"
+    INSTANCES_RUNNING = "instances_running"
+    EVENTS = "events"
+
+
+# (metric, delta, bucket by day)
+EVENT_COUNTERS: Dict[DomainEvent, List[Tuple[Metric, int, bool]]] = {
+    DomainEvent.USER_REGISTERED: [(Metric.USERS, 1, True)],
+    DomainEvent.USER_DELETED: [(Metric.USERS, -1, False)],
+    DomainEvent.USER_ACTIVATED: [(Metric.USERS_ACTIVE, 1, False)],
+    DomainEvent.USER_DEACTIVATED: [(Metric.USERS_ACTIVE, -1, False)],
+    DomainEvent.SUBMISSION_MADE: [(Metric.SUBMISSIONS, 1, True)],
+    DomainEvent.FLAG_SOLVED: [(Metric.FLAGS_CAPTURED, 1, True)],
+    DomainEvent.INSTANCE_CREATED: [(Metric.INSTANCES, 1, True)],
+    DomainEvent.INSTANCE_STARTED: [(Metric.INSTANCES_RUNNING, 1, False)],
+    DomainEvent.INSTANCE_STOPPED: [(Metric.INSTANCES_RUNNING, -1, False)],
+    DomainEvent.EVENT_CREATED: [(Metric.EVENTS, 1, True)],
+}
+
+
+def _status_change(obj, attribute: str = "status") -> Optional[Tuple[object, object]]:
+    """(old, new) if the attribute changed in this flush"""
+    history = get_history(obj, attribute)
+    if not history.added:
+        return None
+    old = history.deleted[0] if history.deleted else None
+    return old, history.added[0]
+
+
+def derive_events(session: Session) -> List[DomainEvent]:
+    """Domain events implied by the pending changes of a flush"""
+    events: List[DomainEvent] = []
+    for obj in session.new:
+        if isinstance(obj, User):
+            events.append(DomainEvent.USER_REGISTERED)
+            if obj.status == UserStatus.ACTIVE:
+                events.append(DomainEvent.USER_ACTIVATED)
+        elif isinstance(obj, Submission):
+            events.append(DomainEvent.SUBMISSION_MADE)
+            if obj.status == SubmissionStatus.CORRECT:
+                events.append(DomainEvent.FLAG_SOLVED)
+        elif isinstance(obj, Instance):
+            events.append(DomainEvent.INSTANCE_CREATED)
+            if obj.status == InstanceStatus.RUNNING:
+                events.append(DomainEvent.INSTANCE_STARTED)
+        elif isinstance(obj, Event):
+            events.append(DomainEvent.EVENT_CREATED)
+
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            change = _status_change(obj)
+            if change:
+                was_active, is_active = change[0] == UserStatus.ACTIVE, change[1] == UserStatus.ACTIVE
+                if is_active and not was_active:
+                    events.append(DomainEvent.USER_ACTIVATED)
+                elif was_active and not is_active:
+                    events.append(DomainEvent.USER_DEACTIVATED)
+        elif isinstance(obj, Instance):
+            change = _status_change(obj)
+            if change:
+                was_running, is_running = change[0] == InstanceStatus.RUNNING, change[1] == InstanceStatus.RUNNING
+                if is_running and not was_running:
+                    events.append(DomainEvent.INSTANCE_STARTED)
+                elif was_running and not is_running:
+                    events.append(DomainEvent.INSTANCE_STOPPED)
+        elif isinstance(obj, Submission):
+            change = _status_change(obj)
+            if change and change[1] == SubmissionStatus.CORRECT and change[0] != SubmissionStatus.CORRECT:
+                events.append(DomainEvent.FLAG_SOLVED)
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            events.append(DomainEvent.USER_DELETED)
+            if obj.status == UserStatus.ACTIVE:
+                events.append(DomainEvent.USER_DEACTIVATED)
+        elif isinstance(obj, Instance) and obj.status == InstanceStatus.RUNNING:
+            events.append(DomainEvent.INSTANCE_STOPPED)
+    return events
+
+
+def _upsert(values_from_excluded: bool):
+    """INSERT ... ON CONFLICT (metric, period) DO UPDATE, adding to or replacing the value"""
+    table = PlatformCounter.__table__
+    stmt = (sqlite_insert if is_sqlite else pg_insert)(table)
+    new_value = stmt.excluded.value if values_from_excluded else table.c.value + stmt.excluded.value
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.metric, table.c.period],
+        set_={"value": new_value, "updated_at": func.now()}
+    )
+
+
+class CounterService:
+    """Event-driven platform counters with periodic reconciliation"""
+
+    # Arbitrary, stable advisory lock id for the fold/reconciliation leader
+    LOCK_KEY = 0x58524354
+    FOLD_BATCH = 5000
+
+    def __init__(self, fold_interval: float = settings.COUNTER_FOLD_INTERVAL,
+                 reconcile_interval: int = settings.COUNTER_RECONCILE_INTERVAL):
+        self.fold_interval = max(0.5, fold_interval)
+        self.reconcile_interval = max(60, reconcile_interval)
+        self._leader = LeaderLock(self.LOCK_KEY)
+        self._task: Optional[asyncio.Task] = None
+
+    def install(self, session_factory) -> None:
+        """Derive domain events from every flush of sessions made by session_factory
+        (a sessionmaker or Session class; AsyncSessions flush through AsyncBackedSession)"""
+        if not event.contains(session_factory, "after_flush", self._after_flush):
+            event.listen(session_factory, "after_flush", self._after_flush)
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        events = derive_events(session)
+        if events:
+            self.emit(session, events)
+
+    def emit(self, db: Session, events: Iterable[DomainEvent], at: Optional[datetime] = None) -> None:
+        """Record domain events as pending deltas inside the caller's transaction"""
+        day = (at or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+        deltas: Counter = Counter()
+        for domain_event in events:
+            for metric, delta, by_day in EVENT_COUNTERS[domain_event]:
+                deltas[(metric.value, TOTAL)] += delta
+                if by_day:
+                    deltas[(metric.value, day)] += delta
+        rows = [
+            {"metric": metric, "period": period, "delta": delta}
+            for (metric, period), delta in deltas.items() if delta
+        ]
+        if rows:
+            db.connection().execute(insert(PlatformCounterDelta.__table__), rows)
+
+    def fold(self) -> int:
+        """Move pending deltas into platform_counters. Returns how many deltas were folded."""
+        table = PlatformCounterDelta.__table__
+        folded = 0
+        while True:
+            db = SessionLocal()
+            try:
+                # DELETE ... RETURNING: exactly the deltas removed are added, even if older ids commit late
+                batch = select(table.c.id).order_by(table.c.id).limit(self.FOLD_BATCH)
+                taken = db.execute(
+                    delete(table).where(table.c.id.in_(batch)).returning(table.c.metric, table.c.period, table.c.delta)
+                ).all()
+                totals: Counter = Counter()
+                for metric, period, delta in taken:
+                    totals[(metric, period)] += delta
+                rows = [
+                    {"metric": metric, "period": period, "value": value}
+                    for (metric, period), value in sorted(totals.items()) if value
+                ]
+                if rows:
+                    db.connection().execute(_upsert(values_from_excluded=False), rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            folded += len(taken)
+            if len(taken) < self.FOLD_BATCH:
+                return folded
+
+    @staticmethod
+    def _pending(db: Session, names: Optional[List[str]] = None, period: Optional[str] = None) -> Dict[Tuple[str, str], int]:
+        query = select(PlatformCounterDelta.metric, PlatformCounterDelta.period, func.sum(PlatformCounterDelta.delta))
+        if names is not None:
+            query = query.where(PlatformCounterDelta.metric.in_(names))
+        if period is not None:
+            query = query.where(PlatformCounterDelta.period == period)
+        query = query.group_by(PlatformCounterDelta.metric, PlatformCounterDelta.period)
+        return {(metric, day): int(value or 0) for metric, day, value in db.execute(query)}
+
+    def read(self, db: Session, metrics: Iterable[Metric], period: str = TOTAL) -> Dict[str, int]:
+        """Current value of each metric, including deltas not folded yet (0 when it has no row)"""
+        names = [metric.value for metric in metrics]
+        values = dict(db.execute(
+            select(PlatformCounter.metric, PlatformCounter.value).where(
+                PlatformCounter.metric.in_(names),
+                PlatformCounter.period == period
+            )
+        ).all())
+        pending = self._pending(db, names, period)
+        return {name: int(values.get(name, 0)) + pending.get((name, period), 0) for name in names}
+
+    @staticmethod
+    def value_of(metric: Metric, period: str = TOTAL):
+        """Scalar subquery for a counter (folded value plus pending deltas), to embed in a larger SELECT"""
+        folded = select(PlatformCounter.value).where(
+            PlatformCounter.metric == metric.value,
+            PlatformCounter.period == period
+        ).scalar_subquery()
+        pending = select(func.sum(PlatformCounterDelta.delta)).where(
+            PlatformCounterDelta.metric == metric.value,
+            PlatformCounterDelta.period == period
+        ).scalar_subquery()
+        return func.coalesce(folded, 0) + func.coalesce(pending, 0)
+
+    def compute_from_source(self, db: Session) -> Dict[Tuple[str, str], int]:
+        """Every counter row recomputed from the source tables"""
+        counts: Dict[Tuple[str, str], int] = {}
+
+        def add_daily(metric: Metric, query) -> None:
+            total = 0
+            for day, count in db.execute(query):
+                if day is None:
+                    continue
+                counts[(metric.value, str(day)[:10])] = count
+                total += count
+            counts[(metric.value, TOTAL)] = total
+
+        def by_day(column, *criteria):
+            # UTC days like emit(); PostgreSQL's date() would use the session time zone
+            day = func.date(column if is_sqlite else func.timezone("UTC", column))
+            return select(day, func.count()).where(*criteria).group_by(day)
+
+        add_daily(Metric.USERS, by_day(User.created_at))
+        add_daily(Metric.SUBMISSIONS, by_day(Submission.submitted_at))
+        add_daily(Metric.FLAGS_CAPTURED, by_day(Submission.submitted_at, Submission.status == SubmissionStatus.CORRECT))
+        add_daily(Metric.INSTANCES, by_day(Instance.started_at))
+        add_daily(Metric.EVENTS, by_day(Event.created_at))
+        counts[(Metric.USERS_ACTIVE.value, TOTAL)] = db.execute(
+            select(func.count()).select_from(User).where(User.status == UserStatus.ACTIVE)
+        ).scalar() or 0
+        counts[(Metric.INSTANCES_RUNNING.value, TOTAL)] = db.execute(
+            select(func.count()).select_from(Instance).where(Instance.status == InstanceStatus.RUNNING)
+        ).scalar() or 0
+        return counts
+
+    def reconcile(self) -> Dict[str, int]:
+        """Rebuild counters from the source tables. Returns how many rows were corrected."""
+        self.fold()
+        db = SessionLocal()
+        try:
+            # Source tables, counters and pending deltas must come from one snapshot: a delta
+            # committed between two of the reads would be subtracted without being counted
+            if is_sqlite:
+                # pysqlite runs SELECTs outside a transaction; take the write lock up front
+                db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            else:
+                db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            expected = self.compute_from_source(db)
+            stored = {
+                (metric, period): value
+                for metric, period, value in db.execute(
+                    select(PlatformCounter.metric, PlatformCounter.period, PlatformCounter.value)
+                )
+            }
+            # Deltas committed since the fold are already counted by the source tables in this snapshot
+            pending = self._pending(db)
+            current = {key: stored.get(key, 0) + pending.get(key, 0) for key in stored.keys() | pending.keys()}
+            drifted = sorted(
+                key for key in expected.keys() | pending.keys()
+                if current.get(key) != expected.get(key, 0)
+            )
+            stale = [key for key in stored if key not in expected and key not in pending]
+            if drifted:
+                db.connection().execute(
+                    _upsert(values_from_excluded=True),
+                    [
+                        {"metric": metric, "period": period, "value": expected.get((metric, period), 0) - pending.get((metric, period), 0)}
+                        for metric, period in drifted
+                    ]
+                )
+            if stale:
+                db.execute(delete(PlatformCounter).where(
+                    tuple_(PlatformCounter.metric, PlatformCounter.period).in_(stale)
+                ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if drifted or stale:
+            logger.info(f"Platform counters reconciled: {len(drifted)} corrected, {len(stale)} removed")
+        return {"corrected": len(drifted), "removed": len(stale)}
+
+    def start(self) -> None:
+        """Start the reconciliation task on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="counter-reconcile")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._leader.held:
+            try:
+                await asyncio.to_thread(self.fold)
+            except Exception as e:
+                logger.error(f"Platform counter fold on shutdown failed: {e}")
+        self._leader.release()
+
+    async def _run(self) -> None:
+        next_reconcile = time.monotonic()
+        while True:
+            try:
+                if await asyncio.to_thread(self._leader.try_acquire) and await asyncio.to_thread(self._leader.check):
+                    if time.monotonic() >= next_reconcile:
+                        await asyncio.to_thread(self.reconcile)
+                        next_reconcile = time.monotonic() + self.reconcile_interval
+                    else:
+                        await asyncio.to_thread(self.fold)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Platform counter fold/reconciliation error: {e}")
+            await asyncio.sleep(self.fold_interval)
+
+
+# Create platform counter service instance
+platform_counters = CounterService()
+platform_counters.install(SessionLocal)
+platform_counters.install(AsyncBackedSession)
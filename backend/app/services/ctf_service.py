@@ -6,24 +6,59 @@ import docker
 import json
 import time
 import uuid
-import random
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 from sqlalchemy.orm import Session
+from sqlalchemy import exists, update, or_
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 
-from app.models.user import User, UserStatus, UserRole
-from app.models.challenge import Challenge, ChallengeStatus
+from app.models.user import User
+from app.models.challenge import Challenge, ChallengeImageStatus, ChallengeStatus
 from app.models.instance import Instance, InstanceStatus
-from app.models.submission import Submission
-from app.core.config import settings
-from app.services.docker_service import DockerService
+from app.models.submission import Submission, SubmissionStatus
+from app.core.security import verify_flag
+from app.services.orchestrator_service import instance_orchestrator
+from app.services.admission_service import admission_controller
+from app.services.container_state_service import container_states
+from app.services.expiry_service import expiry_scheduler
+from app.services.scoreboard_service import scoreboard_service
 
 class CTFService:
     """CTF service for managing challenges and instances"""
     
     def __init__(self):
-        self.docker_service = DockerService()
+        self.docker_service = instance_orchestrator.docker_service
+    
+    def get_solve_state(self, db: Session, user_id: Optional[int]) -> Tuple[Set[int], Set[int]]:
+        """Return (solved challenge IDs, challenge IDs with a running instance) for a user.
+        
+        One query per set, so callers can annotate any number of challenges in memory.
+        """
+        if user_id is None:
+            return set(), set()
+        
+        solved_ids = {
+            challenge_id for (challenge_id,) in db.query(Submission.challenge_id).filter(
+                Submission.user_id == user_id,
+                Submission.status == SubmissionStatus.CORRECT
+            ).distinct()
+        }
+        active_ids = {
+            challenge_id for (challenge_id,) in db.query(Instance.challenge_id).filter(
+                Instance.user_id == user_id,
+                Instance.status.in_([InstanceStatus.QUEUED, InstanceStatus.STARTING, InstanceStatus.RUNNING])
+            ).distinct()
+        }
+        return solved_ids, active_ids
+    
+    def annotate_solve_state(self, db: Session, user: User, challenges: List[Challenge]) -> List[Challenge]:
+        """Set is_solved / has_active_instance on each challenge using the batched solve state"""
+        solved_ids, active_ids = self.get_solve_state(db, getattr(user, "id", None))
+        for challenge in challenges:
+            challenge.is_solved = challenge.id in solved_ids
+            challenge.has_active_instance = challenge.id in active_ids
+        return challenges
     
     def get_available_challenges(self, db: Session, user: User) -> List[Challenge]:
         """Get all available challenges for a user"""
@@ -31,24 +66,8 @@ class CTFService:
             Challenge.status == ChallengeStatus.ACTIVE
         ).order_by(Challenge.points.desc()).all()
         
-        # Add solve status for each challenge
-        for challenge in challenges:
-            existing_submission = db.query(Submission).filter(
-                Submission.user_id == user.id,
-                Submission.challenge_id == challenge.id,
-                Submission.status == "correct"
-            ).first()
-            challenge.is_solved = existing_submission is not None
-            
-            # Check if user has an active instance
-            active_instance = db.query(Instance).filter(
-                Instance.user_id == user.id,
-                Instance.challenge_id == challenge.id,
-                Instance.status == InstanceStatus.RUNNING
-            ).first()
-            challenge.has_active_instance = active_instance is not None
-        
-        return challenges
+        # Add solve and instance status for all challenges at once
+        return self.annotate_solve_state(db, user, challenges)
     
     def deploy_challenge_instance(self, db: Session, user: User, challenge_id: int) -> Dict[str, Any]:
         """Deploy a new challenge instance for a user"""
@@ -79,13 +98,25 @@ class CTFService:
                 detail="Challenge is not active"
             )
         
+        # Image pre-pull (image_warmer_service): wait for it rather than pulling inside the deploy
+        if challenge.image_status in (ChallengeImageStatus.PENDING, ChallengeImageStatus.PULLING):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Challenge image is still being prepared, please try again shortly"
+            )
+        if challenge.image_status == ChallengeImageStatus.FAILED:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Challenge image is unavailable"
+            )
+        
         # Check if user already has ANY active instance (only one at a time allowed)
         # Skip this check for anonymous users (user.id is None)
         if user.id is not None:
-            # Check for any active instance (not just this challenge)
+            # Check for any active instance (not just this challenge); a queued deploy counts too
             any_active_instance = db.query(Instance).filter(
                 Instance.user_id == user.id,
-                Instance.status == InstanceStatus.RUNNING
+                Instance.status.in_([InstanceStatus.QUEUED, InstanceStatus.STARTING, InstanceStatus.RUNNING])
             ).first()
             
             if any_active_instance:
@@ -99,134 +130,52 @@ class CTFService:
                     detail=f"You already have an active instance running: {active_challenge.title if active_challenge else 'Unknown'}. Please stop it before starting a new one."
                 )
         
-        # Check if challenge has reached max instances
-        active_instances = db.query(Instance).filter(
-            Instance.challenge_id == challenge_id,
-            Instance.status == InstanceStatus.RUNNING
-        ).count()
-        
-        if active_instances >= challenge.max_instances:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Maximum instances reached for this challenge"
-            )
+        # Generate unique instance name
+        instance_name = f"{challenge.title.lower().replace(' ', '-')}-{user.username}-{uuid.uuid4().hex[:8]}"
         
+        # Record the instance as STARTING if host capacity and the instance limits allow it,
+        # otherwise as QUEUED; the container itself is created by the orchestrator
+        instance = Instance(
+            user_id=user.id,
+            challenge_id=challenge_id,
+            container_name=instance_name,
+            started_at=datetime.utcnow(),
+            expires_at=datetime.utcnow() + timedelta(seconds=challenge.instance_timeout)
+        )
         try:
-            # Generate unique instance name
-            instance_name = f"{challenge.title.lower().replace(' ', '-')}-{user.username}-{uuid.uuid4().hex[:8]}"
-            print(f"DEBUG CTF Service: Generated instance name: {instance_name}")
-            
-            # Deploy Docker container using docker client directly
-            if not self.docker_service.is_available:
-                # SIMULATION MODE: Docker not available, create mock instance
-                print("DEBUG CTF Service: Docker not available, using simulation mode")
-                mock_container_id = f"mock-{uuid.uuid4().hex[:12]}"
-                mock_ip = f"172.20.0.{random.randint(10, 250)}"
-                
-                print(f"DEBUG CTF Service: Creating instance record with mock container")
-                instance = Instance(
-                    user_id=user.id,
-                    challenge_id=challenge_id,
-                    container_id=mock_container_id,
-                    container_name=instance_name,
-                    status=InstanceStatus.RUNNING,
-                    started_at=datetime.utcnow(),
-                    expires_at=datetime.utcnow() + timedelta(seconds=challenge.instance_timeout)
-                )
-                
+            with admission_controller.serialized(db):
+                admitted = admission_controller.try_admit(db, instance, challenge)
                 db.add(instance)
                 db.commit()
-                db.refresh(instance)
-                
-                return {
-                    "instance_id": instance.id,
-                    "container_id": mock_container_id,
-                    "container_name": instance_name,
-                    "status": "running",
-                    "ports": {"80/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(random.randint(8000, 9000))}]},
-                    "ip_address": mock_ip,
-                    "expires_at": instance.expires_at.isoformat(),
-                    "challenge_info": {
-                        "title": challenge.title,
-                        "category": challenge.category.value,
-                        "difficulty": challenge.difficulty.value,
-                        "points": challenge.points
-                    },
-                    "note": "SIMULATION MODE - Docker not available"
-                }
-            
-            print(f"DEBUG CTF Service: Starting Docker container deployment")
-            container = self.docker_service.client.containers.run(
-                image=challenge.docker_image,
-                name=instance_name,
-                environment=challenge.docker_environment or {},
-                ports=challenge.docker_ports or {},
-                volumes=challenge.docker_volumes or {},
-                network=settings.CHALLENGE_NETWORK,
-                detach=True,
-                labels={
-                    "challenge_id": str(challenge_id),
-                    "user_id": str(user.id) if user.id else "anonymous",
-                    "managed_by": "xploitrum"
-                }
-            )
-            print(f"DEBUG CTF Service: Container created: {container.id}")
-            
-            # Create instance record
-            print(f"DEBUG CTF Service: Creating instance record with user_id={user.id}")
-            instance = Instance(
-                user_id=user.id,
-                challenge_id=challenge_id,
-                container_id=container.id,
-                container_name=instance_name,
-                status=InstanceStatus.RUNNING,
-                started_at=datetime.utcnow(),
-                expires_at=datetime.utcnow() + timedelta(seconds=challenge.instance_timeout)
-            )
-            
-            print(f"DEBUG CTF Service: Adding instance to database")
-            db.add(instance)
-            print(f"DEBUG CTF Service: Committing to database")
-            db.commit()
-            print(f"DEBUG CTF Service: Refreshing instance")
+        except Exception:
+            db.rollback()
+            raise
+        db.refresh(instance)
+        
+        if admitted:
+            instance_orchestrator.enqueue_deploy(instance.id)
+        else:
+            # Entries waiting on their own challenge's limit do not block this one
+            admission_controller.drain_queue()
             db.refresh(instance)
-            
-            # Get container info
-            container.reload()
-            container_ip = None
-            if container.attrs.get("NetworkSettings", {}).get("Networks", {}).get(settings.CHALLENGE_NETWORK):
-                container_ip = container.attrs["NetworkSettings"]["Networks"][settings.CHALLENGE_NETWORK]["IPAddress"]
-            
-            container_info = {
-                "ports": container.attrs.get("NetworkSettings", {}).get("Ports", {}),
-                "ip_address": container_ip
-            }
-            
-            return {
-                "instance_id": instance.id,
-                "container_id": container.id,
-                "container_name": instance_name,
-                "status": instance.status.value,
-                "ports": container_info.get("ports", {}),
-                "ip_address": container_info.get("ip_address"),
-                "expires_at": instance.expires_at.isoformat(),
-                "challenge_info": {
-                    "title": challenge.title,
-                    "category": challenge.category.value,
-                    "difficulty": challenge.difficulty.value,
-                    "points": challenge.points
-                }
+        
+        result = {
+            "instance_id": instance.id,
+            "container_name": instance_name,
+            "status": instance.status.value,
+            "expires_at": instance.expires_at.isoformat(),
+            "queue_position": admission_controller.queue_position(db, instance.id),
+            "poll_url": f"/api/v1/ctf/instances/{instance.id}",
+            "challenge_info": {
+                "title": challenge.title,
+                "category": challenge.category.value,
+                "difficulty": challenge.difficulty.value,
+                "points": challenge.points
             }
-            
-        except Exception as e:
-            print(f"DEBUG CTF Service: Exception occurred: {str(e)}")
-            print(f"DEBUG CTF Service: Exception type: {type(e)}")
-            import traceback
-            print(f"DEBUG CTF Service: Traceback: {traceback.format_exc()}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to deploy instance: {str(e)}"
-            )
+        }
+        if not self.docker_service.is_available:
+            result["note"] = "SIMULATION MODE - Docker not available"
+        return result
     
     def stop_challenge_instance(self, db: Session, user: User, instance_id: int) -> Dict[str, Any]:
         """Stop a challenge instance"""
@@ -241,36 +190,30 @@ class CTFService:
                 detail="Instance not found"
             )
         
+        if instance.status == InstanceStatus.QUEUED and admission_controller.cancel(db, instance):
+            return {
+                "message": "Queued deploy cancelled",
+                "instance_id": instance.id,
+                "status": InstanceStatus.STOPPED.value
+            }
+        
         if instance.status != InstanceStatus.RUNNING:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Instance is not running"
             )
         
-        try:
-            # Stop and remove Docker container
-            container = self.docker_service.client.containers.get(instance.container_id)
-            container.stop(timeout=10)
-            container.remove(force=True)
-            
-            # Update instance status
-            instance.status = InstanceStatus.STOPPED
-            instance.stopped_at = datetime.utcnow()
-            db.commit()
-            
-            return {
-                "message": "Instance stopped successfully",
-                "instance_id": instance.id
-            }
-            
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to stop instance: {str(e)}"
-            )
+        # Container removal happens in the background; the instance flips to STOPPED when done
+        instance_orchestrator.enqueue_stop(instance.id)
+        
+        return {
+            "message": "Instance stop requested",
+            "instance_id": instance.id,
+            "status": "stopping"
+        }
     
     def submit_flag(self, db: Session, user: User, challenge_id: int, flag: str) -> Dict[str, Any]:
-        """Submit a flag for a challenge"""
+        """Submit a flag for a challenge in a single transaction"""
         challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
         if not challenge:
             raise HTTPException(
@@ -278,6 +221,25 @@ class CTFService:
                 detail="Challenge not found"
             )
         
+        submission = self.record_submission(db, user.id, challenge, flag)
+        if submission is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You have already solved this challenge"
+            )
+        
+        is_correct = submission.status == SubmissionStatus.CORRECT
+        return {
+            "correct": is_correct,
+            "points": submission.points_awarded,
+            "message": "Correct flag!" if is_correct else "Incorrect flag. Try again!",
+            "submission_id": submission.id
+        }
+    
+    def record_submission(self, db: Session, user_id: int, challenge: Challenge, flag: str) -> Optional[Submission]:
+        """Record a flag submission and its counters in one transaction and commit it.
+        Shared by /ctf/challenges/{id}/submit and /submissions (through AsyncSession.run_sync).
+        Returns None, recording nothing, if the user has already solved the challenge."""
         # Convert status to string for comparison
         if hasattr(challenge.status, 'value'):
             status_str = challenge.status.value
@@ -290,78 +252,88 @@ class CTFService:
                 detail="Challenge is not active"
             )
         
-        # Check if user already solved this challenge
-        existing_submission = db.query(Submission).filter(
-            Submission.user_id == user.id,
-            Submission.challenge_id == challenge_id,
-            Submission.status == "correct"
-        ).first()
+        # Once solved, nothing more is recorded or counted. Indexed EXISTS; the unique partial
+        # index on correct submissions still rejects a concurrent second solve below.
+        already_solved = db.query(exists().where(
+            Submission.user_id == user_id,
+            Submission.challenge_id == challenge.id,
+            Submission.status == SubmissionStatus.CORRECT
+        )).scalar()
+        if already_solved:
+            return None
+        
+        challenge_id = challenge.id
+        is_correct = verify_flag(flag, challenge.flag, challenge.flag_digest)
+        points_awarded = challenge.points if is_correct else 0
+        solved = 1 if is_correct else 0
         
-        if existing_submission:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="You have already solved this challenge"
+        try:
+            submission = Submission(
+                user_id=user_id,
+                challenge_id=challenge_id,
+                flag=flag,
+                status=SubmissionStatus.CORRECT if is_correct else SubmissionStatus.INCORRECT,
+                points_awarded=points_awarded,
+                submitted_at=datetime.utcnow()
             )
-        
-        # Check if challenge has reached max solves
-        if challenge.max_solves:
-            current_solves = db.query(Submission).filter(
-                Submission.challenge_id == challenge_id,
-                Submission.status == "correct"
-            ).count()
+            db.add(submission)
+            db.flush()
             
-            if current_solves >= challenge.max_solves:
+            # Counters are incremented in SQL so concurrent submissions never lose updates
+            criteria = [Challenge.id == challenge_id]
+            if is_correct:
+                # Claim a solve slot; matches no row once max_solves is reached
+                criteria.append(or_(Challenge.max_solves.is_(None), Challenge.total_solves < Challenge.max_solves))
+            claimed = db.execute(
+                update(Challenge)
+                .where(*criteria)
+                .values(
+                    total_attempts=Challenge.total_attempts + 1,
+                    total_solves=Challenge.total_solves + solved,
+                    solve_percentage=(Challenge.total_solves + solved) * 100 / (Challenge.total_attempts + 1)
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.rowcount == 0:
+                db.rollback()
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Challenge has reached maximum solves"
                 )
-        
-        # Verify flag (in real implementation, this should be encrypted)
-        is_correct = flag.strip() == challenge.flag.strip()
-        
-        # Create submission record
-        submission = Submission(
-            user_id=user.id,
-            challenge_id=challenge_id,
-            flag=flag,
-            status="correct" if is_correct else "incorrect",
-            submitted_at=datetime.utcnow()
-        )
-        
-        db.add(submission)
-        
-        # Update challenge statistics
-        challenge.total_attempts += 1
-        if is_correct:
-            challenge.total_solves += 1
-            user.score += challenge.points
-            user.total_solves += 1
             
-            # Update user rank
-            self.update_user_rank(db, user.id)
-        
-        user.total_attempts += 1
+            db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(
+                    score=User.score + points_awarded,
+                    total_solves=User.total_solves + solved,
+                    total_attempts=User.total_attempts + 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            
+            db.commit()
+        except IntegrityError:
+            # A concurrent request recorded the solve first
+            db.rollback()
+            return None
         
-        db.commit()
-        db.refresh(submission)
+        if is_correct:
+            scoreboard_service.upsert(db.get(User, user_id, populate_existing=True))
         
-        return {
-            "correct": is_correct,
-            "points": challenge.points if is_correct else 0,
-            "message": "Correct flag!" if is_correct else "Incorrect flag. Try again!",
-            "submission_id": submission.id
-        }
+        return submission
     
     def get_user_instances(self, db: Session, user: User) -> List[Dict[str, Any]]:
-        """Get all instances for a user"""
-        instances = db.query(Instance).filter(
+        """Get all instances for a user. Container details come from the event-fed state cache
+        (or the last values recorded on the instance), never from a Docker API call."""
+        rows = db.query(Instance, Challenge).outerjoin(
+            Challenge, Challenge.id == Instance.challenge_id
+        ).filter(
             Instance.user_id == user.id
-        ).order_by(Instance.created_at.desc()).all()
+        ).order_by(Instance.started_at.desc()).all()
         
         result = []
-        for instance in instances:
-            challenge = db.query(Challenge).filter(Challenge.id == instance.challenge_id).first()
-            
+        for instance, challenge in rows:
             instance_data = {
                 "id": instance.id,
                 "challenge_title": challenge.title if challenge else "Unknown",
@@ -374,20 +346,21 @@ class CTFService:
             
             # Add container info if running
             if instance.status == InstanceStatus.RUNNING:
-                try:
-                    container = self.docker_service.client.containers.get(instance.container_id)
-                    container.reload()
-                    container_ip = None
-                    if container.attrs.get("NetworkSettings", {}).get("Networks", {}).get(settings.CHALLENGE_NETWORK):
-                        container_ip = container.attrs["NetworkSettings"]["Networks"][settings.CHALLENGE_NETWORK]["IPAddress"]
-                    
+                instance_data["host"] = self.docker_service.cluster.public_host(instance.node)
+                state = container_states.get(instance.container_id)
+                if state is not None:
+                    instance_data.update({
+                        "ports": state.ports,
+                        "ip_address": state.ip_address,
+                        "status_details": state.status
+                    })
+                else:
                     instance_data.update({
-                        "ports": container.attrs.get("NetworkSettings", {}).get("Ports", {}),
-                        "ip_address": container_ip,
-                        "status_details": container.status
+                        "ports": instance.container_ports or {},
+                        "ip_address": instance.container_ip
                     })
-                except:
-                    pass
+            elif instance.status == InstanceStatus.QUEUED:
+                instance_data["queue_position"] = admission_controller.queue_position(db, instance.id)
             
             result.append(instance_data)
         
@@ -395,67 +368,23 @@ class CTFService:
     
     def get_leaderboard(self, db: Session, limit: int = 100) -> List[Dict[str, Any]]:
         """Get leaderboard data (excludes admin)."""
-        users = db.query(User).filter(
-            User.status == UserStatus.ACTIVE,
-            User.role != UserRole.ADMIN,
-            User.score > 0
-        ).order_by(User.score.desc(), User.total_solves.desc()).limit(limit).all()
-        
-        leaderboard = []
-        for rank, user in enumerate(users, 1):
-            leaderboard.append({
-                "rank": rank,
-                "username": user.username,
-                "full_name": user.full_name,
-                "score": user.score,
-                "total_solves": user.total_solves,
-                "university": user.university,
-                "country": user.country,
-                "avatar_url": user.avatar_url
-            })
-        
-        return leaderboard
-    
-    def update_user_rank(self, db: Session, user_id: int):
-        """Update user rank based on score"""
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return
-        
-        # Count non-admin users with higher scores
-        higher_score_count = db.query(User).filter(
-            User.score > user.score,
-            User.status == UserStatus.ACTIVE,
-            User.role != UserRole.ADMIN
-        ).count()
-        
-        user.rank = higher_score_count + 1
-        db.commit()
+        return [
+            {
+                "rank": entry["rank"],
+                "username": entry["username"],
+                "full_name": entry["full_name"],
+                "score": entry["score"],
+                "total_solves": entry["total_solves"],
+                "university": entry["university"],
+                "country": entry["country"],
+                "avatar_url": entry["avatar_url"]
+            }
+            for entry in scoreboard_service.get_top(db, limit=limit, min_score=1)
+        ]
     
     def cleanup_expired_instances(self, db: Session):
-        """Clean up expired instances"""
-        expired_instances = db.query(Instance).filter(
-            Instance.status == InstanceStatus.RUNNING,
-            Instance.expires_at < datetime.utcnow()
-        ).all()
-        
-        for instance in expired_instances:
-            try:
-                # Stop and remove Docker container
-                container = self.docker_service.client.containers.get(instance.container_id)
-                container.stop(timeout=10)
-                container.remove(force=True)
-                
-                # Update instance status
-                instance.status = InstanceStatus.EXPIRED
-                instance.stopped_at = datetime.utcnow()
-                
-            except Exception as e:
-                # Log error but continue
-                print(f"Error cleaning up instance {instance.id}: {str(e)}")
-        
-        db.commit()
-        return len(expired_instances)
+        """Queue teardown of expired instances now instead of waiting for the expiry scheduler"""
+        return expiry_scheduler.sweep()
 
 
 # Create CTF service instance
@@ -2,43 +2,377 @@
 XploitRUM CTF Platform - Docker Service
 """
 
+import asyncio
 import docker
 import json
+import math
 import random
 import string
+import threading
 import time
-import socket
-from typing import Dict, Any, Optional
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple, Callable
 from loguru import logger
 from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.warm_pool_owner import WarmPoolOwner
 from app.core.exceptions import DockerError
+from app.services.port_service import port_allocator, ports_from_mapping
+from app.services.cluster_service import DockerCluster, DockerNode, parse_docker_nodes
+from app.utils.resources import ResourceProfile
+
+
+@dataclass
+class WarmPoolSpec:
+    """What a pre-started container for one challenge looks like"""
+    challenge_id: int
+    image: str
+    size: int
+    environment: Dict[str, Any] = field(default_factory=dict)
+    ports: Dict[str, Any] = field(default_factory=dict)
+    volumes: Dict[str, Any] = field(default_factory=dict)
+    resources: Optional[ResourceProfile] = None
+
+    def same_container(self, other: "WarmPoolSpec") -> bool:
+        return (self.image, self.environment, self.ports, self.volumes, self.resources) == (
+            other.image, other.environment, other.ports, other.volumes, other.resources
+        )
+
+
+def warm_pool_size(max_instances: int) -> int:
+    """Target pool size for a challenge: a fraction of max_instances, capped"""
+    if not settings.WARM_POOL_ENABLED or max_instances <= 0:
+        return 0
+    return min(settings.WARM_POOL_MAX_PER_CHALLENGE, max(1, math.ceil(max_instances * settings.WARM_POOL_FRACTION)))
+
+
+class WarmContainerPool:
+    """Pre-started challenge containers, claimed on deploy instead of a cold `containers.run`.
+
+    Docker labels are immutable, so a claimed container is renamed to the
+    instance name and ownership lives on the Instance row. Each worker process
+    owns its own pool under a random owner id generated at start, which is
+    stamped on its containers and kept alive by a heartbeat row in
+    warm_pool_owners. Unclaimed warm containers whose owner has not beaten
+    within WARM_POOL_OWNER_TIMEOUT (or has no row at all) belong to a process
+    that is gone and are reaped by whichever pool notices first. Pools live on
+    the default Docker node only.
+    """
+
+    POOL_LABEL = "warm_pool"
+    OWNER_LABEL = "warm_pool_owner"
+    LATENCY_SAMPLES = 500
+
+    def __init__(self, docker_service: "DockerService"):
+        self.docker_service = docker_service
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._specs: Dict[int, WarmPoolSpec] = {}
+        self._idle: Dict[int, deque] = {}
+        self._ports: Dict[str, List[int]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reaped_at = 0.0
+
+    def start(self, target_provider: Callable[[], List[WarmPoolSpec]], interval: int = settings.WARM_POOL_REFRESH_INTERVAL) -> None:
+        """Start background replenishment; target_provider returns the desired specs"""
+        if self.docker_service.client is None or self._thread is not None:
+            return
+        self._heartbeat()
+        self._reap_orphans()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(target_provider, interval), name="warm-pool", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, drain: bool = True) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+        if drain:
+            self.drain()
+            self._retire()
+
+    def _run(self, target_provider: Callable[[], List[WarmPoolSpec]], interval: int) -> None:
+        while not self._stop.is_set():
+            try:
+                self._heartbeat()
+                if time.monotonic() - self._reaped_at >= settings.WARM_POOL_OWNER_TIMEOUT:
+                    self._reap_orphans()
+                self.set_targets(target_provider())
+                self.replenish()
+            except Exception as e:
+                logger.error(f"Warm pool refresh failed: {e}")
+            self._wake.wait(timeout=interval)
+            self._wake.clear()
+
+    def set_targets(self, specs: List[WarmPoolSpec]) -> None:
+        """Replace desired pool sizes; pools whose container spec changed are drained"""
+        wanted = {spec.challenge_id: spec for spec in specs if spec.size > 0 and spec.image}
+        stale: List[Any] = []
+        with self._lock:
+            for challenge_id, current in list(self._specs.items()):
+                new = wanted.get(challenge_id)
+                if new is None or not new.same_container(current):
+                    stale.extend(self._idle.pop(challenge_id, ()))
+                    del self._specs[challenge_id]
+                elif len(self._idle.get(challenge_id, ())) > new.size:
+                    idle = self._idle[challenge_id]
+                    while len(idle) > new.size:
+                        stale.append(idle.pop())
+            self._specs.update(wanted)
+        for container in stale:
+            self._discard(container)
+
+    def replenish(self) -> int:
+        """Start containers until every pool is at its target size. Returns the number started."""
+        started = 0
+        with self._lock:
+            deficits = [
+                (spec, spec.size - len(self._idle.get(challenge_id, ())))
+                for challenge_id, spec in self._specs.items()
+            ]
+        for spec, missing in deficits:
+            for _ in range(max(0, missing)):
+                if self._stop.is_set():
+                    return started
+                try:
+                    # Cold starts can be slow; keep the owner alive while the pool grows
+                    self._heartbeat()
+                    container = self._start_warm(spec)
+                except Exception as e:
+                    logger.error(f"Failed to pre-start container for challenge {spec.challenge_id}: {e}")
+                    break
+                with self._lock:
+                    current = self._specs.get(spec.challenge_id)
+                    if current is not None and current.same_container(spec):
+                        self._idle.setdefault(spec.challenge_id, deque()).append(container)
+                        container = None
+                if container is not None:
+                    self._discard(container)
+                else:
+                    started += 1
+        return started
+
+    def _start_warm(self, spec: WarmPoolSpec):
+        host_ports = port_allocator.map_ports(spec.ports)
+        try:
+            container = self._run_warm(spec, host_ports)
+        except Exception:
+            port_allocator.release(host_ports.values())
+            raise
+        port_allocator.assign(host_ports.values(), container_id=container.id)
+        with self._lock:
+            self._ports[container.id] = list(host_ports.values())
+        return container
+
+    def _run_warm(self, spec: WarmPoolSpec, host_ports: Dict[str, int]):
+        container = self.docker_service.client.containers.run(
+            image=spec.image,
+            name=f"warm-{spec.challenge_id}-{uuid.uuid4().hex[:8]}",
+            environment=spec.environment or {},
+            ports=host_ports,
+            volumes=spec.volumes or {},
+            network=self.docker_service.network_name,
+            detach=True,
+            labels={
+                "challenge_id": str(spec.challenge_id),
+                "managed_by": "xploitrum",
+                self.POOL_LABEL: "true",
+                self.OWNER_LABEL: self.owner
+            },
+            **(spec.resources.docker_limits() if spec.resources else {})
+        )
+        try:
+            self.docker_service.wait_for_container_running(container, timeout=settings.CONTAINER_READY_TIMEOUT)
+        except Exception:
+            container.remove(force=True)
+            raise
+        return container
+
+    def claim(self, challenge_id: int, name: str, instance_id: Optional[int] = None):
+        """Take a pre-started container for a challenge and rename it, or None on a pool miss.
+
+        The container's reserved host ports move to the instance.
+        """
+        started = time.perf_counter()
+        container = None
+        while True:
+            with self._lock:
+                idle = self._idle.get(challenge_id)
+                candidate = idle.popleft() if idle else None
+            if candidate is None:
+                break
+            try:
+                candidate.reload()
+                if candidate.status != "running":
+                    raise DockerError(f"warm container {candidate.id} is {candidate.status}")
+                candidate.rename(name)
+                candidate.reload()
+                with self._lock:
+                    ports = self._ports.pop(candidate.id, [])
+                if instance_id is not None:
+                    port_allocator.assign(ports, instance_id=instance_id)
+                container = candidate
+                break
+            except Exception as e:
+                logger.warning(f"Discarding warm container for challenge {challenge_id}: {e}")
+                self._discard(candidate)
+
+        with self._lock:
+            if container is not None:
+                self._hits += 1
+                self._latencies.append(time.perf_counter() - started)
+            else:
+                self._misses += 1
+        # Refill the pool without waiting for the next interval
+        self._wake.set()
+        return container
+
+    def drain(self, challenge_id: Optional[int] = None) -> int:
+        """Remove idle warm containers (all pools, or one challenge)"""
+        with self._lock:
+            if challenge_id is None:
+                containers = [c for idle in self._idle.values() for c in idle]
+                self._idle.clear()
+            else:
+                containers = list(self._idle.pop(challenge_id, ()))
+        for container in containers:
+            self._discard(container)
+        return len(containers)
+
+    def _discard(self, container) -> None:
+        try:
+            container.remove(force=True)
+        except Exception:
+            pass
+        with self._lock:
+            ports = self._ports.pop(container.id, [])
+        port_allocator.release(ports)
+
+    def _heartbeat(self) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(WarmPoolOwner(owner_id=self.owner, heartbeat_at=datetime.utcnow()))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Warm pool heartbeat failed: {e}")
+        finally:
+            db.close()
+
+    def _retire(self) -> None:
+        """Drop this pool's heartbeat row after draining on shutdown"""
+        db = SessionLocal()
+        try:
+            db.query(WarmPoolOwner).filter(WarmPoolOwner.owner_id == self.owner).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not retire warm pool owner {self.owner}: {e}")
+        finally:
+            db.close()
+
+    def _live_owners(self) -> Set[str]:
+        """Owner ids with a recent heartbeat; rows of owners that stopped beating are deleted"""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.WARM_POOL_OWNER_TIMEOUT)
+        db = SessionLocal()
+        try:
+            db.query(WarmPoolOwner).filter(WarmPoolOwner.heartbeat_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+            return {owner_id for (owner_id,) in db.query(WarmPoolOwner.owner_id)} | {self.owner}
+        finally:
+            db.close()
+
+    def _reap_orphans(self) -> int:
+        """Remove unclaimed warm containers whose owning pool has stopped heartbeating"""
+        self._reaped_at = time.monotonic()
+        try:
+            live = self._live_owners()
+            containers = self.docker_service.client.containers.list(
+                all=True, filters={"label": f"{self.POOL_LABEL}=true"}
+            )
+        except Exception as e:
+            logger.warning(f"Could not list warm pool owners or containers: {e}")
+            return 0
+        reaped = 0
+        for container in containers:
+            if not container.name.startswith("warm-"):
+                continue  # Already claimed by an instance
+            if container.labels.get(self.OWNER_LABEL) in live:
+                continue
+            self._discard(container)
+            port_allocator.release(ports_from_mapping(container.attrs.get("HostConfig", {}).get("PortBindings")))
+            reaped += 1
+        if reaped:
+            logger.info(f"Reaped {reaped} orphaned warm container(s)")
+        return reaped
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            claims = self._hits + self._misses
+            latencies = sorted(self._latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+            return {
+                "enabled": settings.WARM_POOL_ENABLED and self.docker_service.is_available,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / claims, 4) if claims else 0.0,
+                "claim_latency_ms": {
+                    "avg": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+                    "p95": round(p95 * 1000, 2)
+                },
+                "pools": {
+                    challenge_id: {"target": spec.size, "idle": len(self._idle.get(challenge_id, ()))}
+                    for challenge_id, spec in self._specs.items()
+                }
+            }
 
 
 class DockerService:
     """Service for managing Docker containers for challenges"""
     
     def __init__(self):
-        try:
-            self.client = docker.from_env()
-            self.network_name = settings.CHALLENGE_NETWORK
-            self._ensure_network_exists()
-            self.is_available = True
-            logger.info("Docker client initialized successfully")
-        except Exception as e:
-            logger.warning(f"Docker client not available: {e}")
+        self.network_name = settings.CHALLENGE_NETWORK
+        self.cluster = DockerCluster(parse_docker_nodes(settings.DOCKER_NODES), on_connect=self._ensure_network_exists)
+        if self.is_available:
+            logger.info(f"Docker client initialized successfully ({len(self.cluster.connected())} node(s))")
+        else:
             logger.warning("CTF challenge instances will not be available without Docker")
-            self.client = None
-            self.network_name = None
-            self.is_available = False
+        self.warm_pool = WarmContainerPool(self)
     
-    def _ensure_network_exists(self):
-        """Ensure the challenge network exists"""
-        if not self.client:
-            return
+    @property
+    def is_available(self) -> bool:
+        return not self.cluster.simulated
+    
+    @property
+    def client(self):
+        """Client of the default node (warm pool and single-host code paths)"""
+        return self.cluster.get(None).client
+    
+    def client_for(self, node: Optional[str]):
+        """Client of the node an instance runs on (None = default node)"""
+        client = self.cluster.get(node).client
+        if client is None:
+            raise DockerError(f"Docker node {node or self.cluster.default} is not connected")
+        return client
+    
+    def _ensure_network_exists(self, node: DockerNode):
+        """Ensure the challenge network exists on a node"""
         try:
-            networks = self.client.networks.list(names=[self.network_name])
+            networks = node.client.networks.list(names=[self.network_name])
             if not networks:
-                self.client.networks.create(
+                node.client.networks.create(
                     name=self.network_name,
                     driver="bridge",
                     ipam=docker.types.IPAMConfig(
@@ -47,7 +381,7 @@ class DockerService:
                         ]
                     )
                 )
-                logger.info(f"Created Docker network: {self.network_name}")
+                logger.info(f"Created Docker network {self.network_name} on node {node.name}")
         except Exception as e:
             logger.error(f"Failed to create network: {e}")
             raise DockerError("Failed to create challenge network")
@@ -61,7 +395,9 @@ class DockerService:
         docker_compose_file: Optional[str] = None,
         environment: Optional[Dict[str, str]] = None,
         ports: Optional[Dict[str, str]] = None,
-        volumes: Optional[Dict[str, str]] = None
+        volumes: Optional[Dict[str, str]] = None,
+        resources: Optional[ResourceProfile] = None,
+        node: Optional[str] = None
     ) -> Dict[str, Any]:
         """Deploy a challenge container with enhanced functionality"""
         if not self.is_available:
@@ -70,8 +406,8 @@ class DockerService:
             # Generate unique container name
             container_name = f"challenge-{challenge_id}-{instance_id}-{user_id}"
             
-            # Find available ports dynamically
-            host_ports = self._find_available_ports(ports or {"80/tcp": None})
+            # Reserve host ports for the instance
+            host_ports = port_allocator.map_ports(ports or {"80/tcp": None}, instance_id=instance_id)
             
             # Prepare container configuration
             container_config = {
@@ -90,23 +426,22 @@ class DockerService:
                     "challenge_type": "ctf"
                 },
                 "restart_policy": {"Name": "unless-stopped"},
-                "mem_limit": "1g",  # Limit memory usage
-                "cpu_period": 100000,
-                "cpu_quota": 50000  # Limit CPU usage to 50%
+                # CPU, memory and process limits from the challenge's resource profile
+                **(resources or ResourceProfile.default()).docker_limits()
             }
             
             # Add volume mappings
             if volumes:
                 container_config["volumes"] = volumes
             
-            # Create and start container
-            container = self.client.containers.run(**container_config)
+            # Create and start container (blocking SDK call runs off the event loop)
+            container = await asyncio.to_thread(self.client_for(node).containers.run, **container_config)
             
             # Wait for container to be ready
             await self._wait_for_container_ready(container, timeout=60)
             
             # Get container information
-            container.reload()
+            await asyncio.to_thread(container.reload)
             
             # Get container IP
             container_ip = None
@@ -134,46 +469,51 @@ class DockerService:
             
         except Exception as e:
             logger.error(f"Failed to deploy challenge: {e}")
+            port_allocator.release_instance(instance_id)
             raise DockerError(f"Failed to deploy challenge: {e}")
     
-    def _find_available_ports(self, port_mapping: Dict[str, str]) -> Dict[str, str]:
-        """Find available host ports for container port mapping"""
-        available_ports = {}
-        start_port = 10000  # Start from port 10000
-        
-        for container_port in port_mapping.keys():
-            for port in range(start_port, 65535):
-                try:
-                    # Check if port is available
-                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                        s.bind(('', port))
-                        available_ports[container_port] = str(port)
-                        start_port = port + 1
-                        break
-                except OSError:
-                    continue
-        
-        return available_ports
-    
     async def _wait_for_container_ready(self, container, timeout: int = 60):
         """Wait for container to be ready and healthy"""
         start_time = time.time()
+        while time.time() - start_time < timeout:
+            await asyncio.to_thread(container.reload)
+            if container.status == "running":
+                return True
+            await asyncio.sleep(2)
+        
+        raise DockerError(f"Container {container.id} failed to become ready within {timeout} seconds")
+    
+    def wait_for_container_running(self, container, timeout: int = 60) -> bool:
+        """Blocking variant of _wait_for_container_ready for worker threads"""
+        start_time = time.time()
         while time.time() - start_time < timeout:
             container.reload()
             if container.status == "running":
-                # Check if container is healthy (basic check)
-                try:
-                    # For web applications, try to connect to port 80
-                    if "80/tcp" in [port.split("/")[0] + "/" + port.split("/")[1] for port in container.attrs.get("NetworkSettings", {}).get("Ports", {}).keys()]:
-                        # Simple health check - could be enhanced
-                        return True
-                except:
-                    pass
                 return True
             time.sleep(2)
         
         raise DockerError(f"Container {container.id} failed to become ready within {timeout} seconds")
     
+    def get_network_info(self, container) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Return (IP on the challenge network, published port mappings) for a container"""
+        network_settings = container.attrs.get("NetworkSettings", {})
+        container_ip = None
+        network = network_settings.get("Networks", {}).get(self.network_name)
+        if network:
+            container_ip = network.get("IPAddress")
+        return container_ip, network_settings.get("Ports", {})
+    
+    def remove_container(self, container_id: str, node: Optional[str] = None) -> bool:
+        """Stop and remove a container (blocking). Returns False if it no longer exists."""
+        try:
+            container = self.client_for(node).containers.get(container_id)
+        except docker.errors.NotFound:
+            return False
+        container.stop(timeout=10)
+        container.remove(force=True)
+        logger.info(f"Stopped and removed container: {container_id}")
+        return True
+    
     def _generate_access_urls(self, container_ip: str, host_ports: Dict[str, str]) -> Dict[str, str]:
         """Generate access URLs for both direct and VPN access"""
         urls = {}
@@ -199,29 +539,20 @@ class DockerService:
         
         return urls
     
-    async def stop_container(self, container_id: str) -> bool:
+    async def stop_container(self, container_id: str, node: Optional[str] = None) -> bool:
         """Stop and remove a container"""
         try:
-            container = self.client.containers.get(container_id)
-            
-            # Stop container
-            container.stop(timeout=10)
-            
-            # Remove container
-            container.remove(force=True)
-            
-            logger.info(f"Stopped and removed container: {container_id}")
+            await asyncio.to_thread(self.remove_container, container_id, node)
             return True
             
         except Exception as e:
             logger.error(f"Failed to stop container {container_id}: {e}")
             raise DockerError(f"Failed to stop container: {e}")
     
-    async def get_container_status(self, container_id: str) -> Dict[str, Any]:
+    async def get_container_status(self, container_id: str, node: Optional[str] = None) -> Dict[str, Any]:
         """Get container status and information"""
         try:
-            container = self.client.containers.get(container_id)
-            container.reload()
+            container = await asyncio.to_thread(self.client_for(node).containers.get, container_id)
             
             return {
                 "id": container.id,
@@ -238,23 +569,21 @@ class DockerService:
             raise DockerError(f"Failed to get container status: {e}")
     
     async def list_user_containers(self, user_id: int) -> list:
-        """List containers for a specific user"""
+        """List containers for a specific user (all nodes)"""
         try:
-            containers = self.client.containers.list(
-                all=True,
-                filters={"label": f"user_id={user_id}"}
-            )
+            containers = await self._list_all_nodes(filters={"label": f"user_id={user_id}"})
             
             return [
                 {
                     "id": container.id,
+                    "node": node,
                     "name": container.name,
                     "status": container.status,
                     "created": container.attrs.get("Created"),
                     "image": container.attrs.get("Config", {}).get("Image"),
                     "labels": container.attrs.get("Config", {}).get("Labels", {})
                 }
-                for container in containers
+                for node, container in containers
             ]
             
         except Exception as e:
@@ -264,19 +593,16 @@ class DockerService:
     async def cleanup_expired_containers(self) -> int:
         """Cleanup expired containers"""
         try:
-            # Get all challenge containers
-            containers = self.client.containers.list(
-                all=True,
-                filters={"label": "managed_by=xploitrum"}
-            )
+            # Get all challenge containers, on every node
+            containers = await self._list_all_nodes(filters={"label": "managed_by=xploitrum"})
             
             cleaned_count = 0
-            for container in containers:
+            for _, container in containers:
                 try:
                     # Check if container is expired (this would need additional logic)
                     # For now, just remove stopped containers
                     if container.status == "exited":
-                        container.remove(force=True)
+                        await asyncio.to_thread(container.remove, force=True)
                         cleaned_count += 1
                 except Exception as e:
                     logger.error(f"Failed to cleanup container {container.id}: {e}")
@@ -288,22 +614,30 @@ class DockerService:
             logger.error(f"Failed to cleanup containers: {e}")
             raise DockerError(f"Failed to cleanup containers: {e}")
     
-    async def get_container_logs(self, container_id: str, tail: int = 100) -> str:
+    async def _list_all_nodes(self, **kwargs) -> List[Tuple[str, Any]]:
+        """(node name, container) for all containers matching the filters on the connected nodes"""
+        result = []
+        for node in self.cluster.connected():
+            containers = await asyncio.to_thread(node.client.containers.list, all=True, **kwargs)
+            result.extend((node.name, container) for container in containers)
+        return result
+    
+    async def get_container_logs(self, container_id: str, tail: int = 100, node: Optional[str] = None) -> str:
         """Get container logs"""
         try:
-            container = self.client.containers.get(container_id)
-            logs = container.logs(tail=tail, timestamps=True)
+            container = await asyncio.to_thread(self.client_for(node).containers.get, container_id)
+            logs = await asyncio.to_thread(container.logs, tail=tail, timestamps=True)
             return logs.decode('utf-8')
             
         except Exception as e:
             logger.error(f"Failed to get container logs {container_id}: {e}")
             raise DockerError(f"Failed to get container logs: {e}")
     
-    async def get_container_metrics(self, container_id: str) -> Dict[str, Any]:
+    async def get_container_metrics(self, container_id: str, node: Optional[str] = None) -> Dict[str, Any]:
         """Get container resource usage metrics"""
         try:
-            container = self.client.containers.get(container_id)
-            stats = container.stats(stream=False)
+            container = await asyncio.to_thread(self.client_for(node).containers.get, container_id)
+            stats = await asyncio.to_thread(container.stats, stream=False)
             
             # Calculate CPU usage percentage
             cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - stats['precpu_stats']['cpu_usage']['total_usage']
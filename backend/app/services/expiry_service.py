@@ -0,0 +1,237 @@
+"""
+XploitRUM CTF Platform - Instance Expiry Scheduler
+
+Keeps a min-heap of (expires_at, instance_id) for active instances and sleeps
+until the earliest deadline, then hands expired instances to the orchestrator,
+whose bounded worker pool tears the containers down. Only one process runs
+the scheduler at a time: leadership is a database advisory lock
+(pg_try_advisory_lock on PostgreSQL, an flock next to the database file on
+SQLite), which the other workers try to take every EXPIRY_POLL_INTERVAL
+seconds.
+
+New instances are picked up by a cheap incremental poll (id > last seen)
+every EXPIRY_POLL_INTERVAL seconds. The poll does not move past a QUEUED
+deploy, which becomes active only when admitted, possibly by another worker;
+rows above it are re-read until it leaves the queue. The heap is rebuilt
+from the database every AUTO_CLEANUP_INTERVAL seconds. The full sync also
+re-enqueues deploys stranded by a worker that exited (see InstanceOrchestrator.recover_stranded).
+"""
+
+import asyncio
+import heapq
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.leader_lock import LeaderLock
+from app.models.instance import Instance, InstanceStatus
+from app.services.orchestrator_service import instance_orchestrator, InstanceOrchestrator
+
+ACTIVE_STATUSES = (InstanceStatus.STARTING, InstanceStatus.RUNNING)
+
+
+def _as_utc_naive(value: datetime) -> datetime:
+    """expires_at is written as naive UTC but may come back timezone-aware from PostgreSQL"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class ExpiryScheduler:
+    """Tears down instances when they reach expires_at"""
+
+    # Arbitrary, stable advisory lock id for the expiry leader
+    LOCK_KEY = 0x58525545
+
+    def __init__(self, orchestrator: InstanceOrchestrator):
+        self.orchestrator = orchestrator
+        self.full_sync_interval = max(60, settings.AUTO_CLEANUP_INTERVAL)
+        self.poll_interval = max(1, settings.EXPIRY_POLL_INTERVAL)
+        self._leader = LeaderLock(self.LOCK_KEY)
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._last_seen_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader.held
+
+    def start(self) -> None:
+        """Start the scheduler task on the running event loop"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.orchestrator.add_deadline_listener(self.schedule)
+        self._task = asyncio.create_task(self._run(), name="instance-expiry")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._leader.release()
+
+    def schedule(self, instance_id: int, expires_at: datetime) -> None:
+        """Add or move a deadline (thread-safe); wakes the loop if it is now the earliest"""
+        if not self._leader.held:
+            return
+        expires_at = _as_utc_naive(expires_at)
+        with self._lock:
+            self._deadlines[instance_id] = expires_at
+            heapq.heappush(self._heap, (expires_at, instance_id))
+            is_earliest = self._heap[0][1] == instance_id
+        if is_earliest and self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _load(self, min_id: Optional[int] = None) -> int:
+        """Push deadlines of active instances with id > min_id (all of them, replacing the heap,
+        when None) and advance the poll window up to the first QUEUED row. Returns how many
+        deadlines were new or moved."""
+        db = SessionLocal()
+        try:
+            # Bound the window first so rows inserted mid-query are picked up by the next poll
+            max_id = db.query(Instance.id).order_by(Instance.id.desc()).limit(1).scalar() or 0
+            rows = db.query(Instance.id, Instance.expires_at).filter(
+                Instance.status.in_(ACTIVE_STATUSES),
+                Instance.id > (min_id or 0),
+                Instance.id <= max_id
+            ).all()
+            # Admitted later (maybe by a worker that is not the leader), so keep it in the window
+            first_queued = db.query(func.min(Instance.id)).filter(
+                Instance.status == InstanceStatus.QUEUED,
+                Instance.id > (min_id or 0),
+                Instance.id <= max_id
+            ).scalar()
+        finally:
+            db.close()
+        seen_id = max_id if first_queued is None else first_queued - 1
+        loaded = 0
+        with self._lock:
+            if min_id is None:
+                self._heap = []
+                self._deadlines = {}
+            for instance_id, expires_at in rows:
+                deadline = _as_utc_naive(expires_at)
+                if self._deadlines.get(instance_id) == deadline:
+                    continue  # Re-read behind a queued row, already scheduled
+                self._deadlines[instance_id] = deadline
+                self._heap.append((deadline, instance_id))
+                loaded += 1
+            heapq.heapify(self._heap)
+            self._last_seen_id = seen_id if min_id is None else max(self._last_seen_id, seen_id)
+        return loaded
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, instance_id = heapq.heappop(self._heap)
+                # Skip entries superseded by a later schedule() for the same instance
+                if self._deadlines.get(instance_id) != deadline:
+                    continue
+                del self._deadlines[instance_id]
+                due.append(instance_id)
+        return due
+
+    def _expire(self, instance_ids: List[int]) -> int:
+        """Queue teardown for instances that are still active and past their deadline"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            rows = db.query(Instance.id, Instance.status, Instance.expires_at).filter(
+                Instance.id.in_(instance_ids)
+            ).all()
+        finally:
+            db.close()
+        queued = 0
+        for instance_id, status, expires_at in rows:
+            if status not in ACTIVE_STATUSES:
+                continue
+            deadline = _as_utc_naive(expires_at)
+            if deadline > now:
+                # Deadline moved (e.g. reset when the deploy finished)
+                self.schedule(instance_id, deadline)
+                continue
+            if not self.orchestrator.is_pending(instance_id):
+                self.orchestrator.enqueue_stop(instance_id, InstanceStatus.EXPIRED)
+                queued += 1
+        if queued:
+            logger.info(f"Queued teardown of {queued} expired instance(s)")
+        return queued
+
+    def sweep(self) -> int:
+        """Queue teardown of every expired active instance now (admin-triggered cleanup)"""
+        db = SessionLocal()
+        try:
+            expired_ids = [
+                instance_id for (instance_id,) in db.query(Instance.id).filter(
+                    Instance.status.in_(ACTIVE_STATUSES),
+                    Instance.expires_at < datetime.utcnow()
+                )
+            ]
+        finally:
+            db.close()
+        return self._expire(expired_ids) if expired_ids else 0
+
+    def _next_wakeup(self, now: datetime, next_poll: datetime) -> float:
+        with self._lock:
+            deadline = self._heap[0][0] if self._heap else next_poll
+        return max(0.0, (min(deadline, next_poll) - now).total_seconds())
+
+    async def _run(self) -> None:
+        next_full = datetime.utcnow()
+        next_poll = next_full
+        while True:
+            try:
+                if not self._leader.held:
+                    if not await asyncio.to_thread(self._leader.try_acquire):
+                        # Retry soon: if the leader's worker died, expiry stalls until someone takes over
+                        await asyncio.sleep(self.poll_interval)
+                        continue
+                    logger.info("Instance expiry scheduler is leader on this worker")
+                    next_full = datetime.utcnow()
+
+                now = datetime.utcnow()
+                if now >= next_full:
+                    if not await asyncio.to_thread(self._leader.check):
+                        logger.warning("Lost expiry scheduler leadership")
+                        continue
+                    await asyncio.to_thread(self._load)
+                    await asyncio.to_thread(self.orchestrator.recover_stranded)
+                    next_full = now + timedelta(seconds=self.full_sync_interval)
+                    next_poll = now + timedelta(seconds=self.poll_interval)
+                elif now >= next_poll:
+                    await asyncio.to_thread(self._load, self._last_seen_id)
+                    next_poll = now + timedelta(seconds=self.poll_interval)
+
+                due = self._pop_due(now)
+                if due:
+                    await asyncio.to_thread(self._expire, due)
+
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._next_wakeup(datetime.utcnow(), next_poll))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Instance expiry scheduler error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+
+# Create expiry scheduler instance
+expiry_scheduler = ExpiryScheduler(instance_orchestrator)
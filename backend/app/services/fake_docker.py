@@ -0,0 +1,448 @@
+"""
+XploitRUM CTF Platform - In-process fake Docker daemon
+
+Stands in for a Docker daemon wherever a DockerClient is used, so scheduling
+across several nodes can be exercised on a laptop or in CI without real
+hosts. Select it per node with a fake:// URL in DOCKER_NODES, e.g.
+
+    DOCKER_NODES=a=fake://?cpus=4&memory=8192,b=fake://?cpus=8&memory=16384
+
+Only the parts of the docker SDK the platform calls are implemented:
+info/ping, networks, containers (run/get/list, reload/stop/remove/rename/
+logs/stats), images (pull/get/list/remove), the events stream,
+api.stats and api.pull (streamed progress). Containers never run anything; they are records that move
+between "running" and "exited". A node can be taken down with set_down(True)
+to exercise health tracking and failover.
+"""
+
+import hashlib
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from docker.errors import APIError, ImageNotFound, NotFound
+
+_ids = itertools.count(1)
+
+
+def _new_id(prefix: str) -> str:
+    return hashlib.sha256(f"{prefix}-{next(_ids)}-{time.time_ns()}".encode()).hexdigest()
+
+
+def _labels_match(labels: Dict[str, str], wanted: Any) -> bool:
+    """Docker label filter semantics: "key" or "key=value", all must match"""
+    for item in [wanted] if isinstance(wanted, str) else list(wanted or []):
+        key, sep, value = item.partition("=")
+        if key not in labels or (sep and labels[key] != value):
+            return False
+    return True
+
+
+def _parse_memory(value: Any) -> int:
+    """mem_limit ("512m", "1g" or bytes) in bytes"""
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    units = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    text = str(value).strip().lower()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class FakeContainer:
+    def __init__(self, daemon: "FakeDockerClient", attrs: Dict[str, Any]):
+        self._daemon = daemon
+        self.attrs = attrs
+
+    @property
+    def id(self) -> str:
+        return self.attrs["Id"]
+
+    @property
+    def name(self) -> str:
+        return self.attrs["Name"].lstrip("/")
+
+    @property
+    def status(self) -> str:
+        return self.attrs["State"]["Status"]
+
+    @property
+    def labels(self) -> Dict[str, str]:
+        return self.attrs["Config"]["Labels"]
+
+    def reload(self) -> None:
+        self.attrs = self._daemon._inspect(self.id)
+
+    def stop(self, timeout: int = 10) -> None:
+        self._daemon._set_status(self.id, "exited", exit_code=0, action="die")
+        self.reload()
+
+    def remove(self, force: bool = False, v: bool = False) -> None:
+        self._daemon._remove(self.id, force=force)
+
+    def rename(self, name: str) -> None:
+        self._daemon._rename(self.id, name)
+        self.reload()
+
+    def logs(self, tail: Any = "all", timestamps: bool = False, **kwargs) -> bytes:
+        return b""
+
+    def stats(self, stream: bool = False, **kwargs) -> Dict[str, Any]:
+        return self._daemon.api.stats(self.id, stream=stream)
+
+
+class FakeImage:
+    def __init__(self, attrs: Dict[str, Any]):
+        self.attrs = attrs
+
+    @property
+    def id(self) -> str:
+        return self.attrs["Id"]
+
+    @property
+    def tags(self) -> List[str]:
+        return self.attrs["RepoTags"]
+
+
+class _Containers:
+    def __init__(self, daemon: "FakeDockerClient"):
+        self._daemon = daemon
+
+    def run(self, image: str, name: Optional[str] = None, environment: Optional[Dict[str, Any]] = None,
+            ports: Optional[Dict[str, Any]] = None, volumes: Any = None, network: Optional[str] = None,
+            labels: Optional[Dict[str, str]] = None, nano_cpus: int = 0, mem_limit: Any = None,
+            pids_limit: Optional[int] = None, **kwargs) -> FakeContainer:
+        return self._daemon._run(image, name, environment or {}, ports or {}, network, labels or {},
+                                 nano_cpus, _parse_memory(mem_limit), pids_limit)
+
+    def get(self, container_id: str) -> FakeContainer:
+        return FakeContainer(self._daemon, self._daemon._inspect(container_id))
+
+    def list(self, all: bool = False, filters: Optional[Dict[str, Any]] = None, **kwargs) -> List[FakeContainer]:
+        return [FakeContainer(self._daemon, attrs) for attrs in self._daemon._list(all, filters or {})]
+
+
+class _Images:
+    def __init__(self, daemon: "FakeDockerClient"):
+        self._daemon = daemon
+
+    def pull(self, repository: str, tag: Optional[str] = None, **kwargs) -> FakeImage:
+        return FakeImage(self._daemon._pull(f"{repository}:{tag}" if tag else repository))
+
+    def get(self, name: str) -> FakeImage:
+        return FakeImage(self._daemon._image(name))
+
+    def list(self, name: Optional[str] = None, **kwargs) -> List[FakeImage]:
+        return [FakeImage(attrs) for attrs in self._daemon._list_images(name)]
+
+    def remove(self, image: str, force: bool = False, **kwargs) -> None:
+        self._daemon._remove_image(image, force=force)
+
+
+class _Networks:
+    def __init__(self, daemon: "FakeDockerClient"):
+        self._daemon = daemon
+
+    def list(self, names: Optional[List[str]] = None, **kwargs) -> List[Dict[str, Any]]:
+        with self._daemon._lock:
+            return [{"Name": name} for name in self._daemon._networks if not names or name in names]
+
+    def create(self, name: str, **kwargs) -> Dict[str, Any]:
+        with self._daemon._lock:
+            self._daemon._networks.add(name)
+        return {"Name": name}
+
+
+class _Api:
+    def __init__(self, daemon: "FakeDockerClient"):
+        self._daemon = daemon
+
+    def stats(self, container: str, stream: bool = False, **kwargs) -> Dict[str, Any]:
+        attrs = self._daemon._inspect(container)
+        return {
+            "cpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0, "online_cpus": self._daemon.cpus},
+            "precpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0},
+            "memory_stats": {"usage": 0, "limit": attrs["HostConfig"]["Memory"] or self._daemon.memory_bytes},
+            "networks": {"eth0": {"rx_bytes": 0, "tx_bytes": 0}},
+        }
+
+    def pull(self, repository: str, tag: Optional[str] = None, stream: bool = False, decode: bool = False, **kwargs):
+        """Progress messages of a one-layer pull; the image exists once the stream is exhausted"""
+        reference = f"{repository}:{tag}" if tag else repository
+        self._daemon._check_up()
+        size = 50 * 1024 * 1024
+        messages = [{"status": f"Pulling from {repository}", "id": tag or "latest"}]
+        messages += [
+            {"status": "Downloading", "id": "layer0", "progressDetail": {"current": size * step // 4, "total": size}}
+            for step in range(1, 5)
+        ]
+        messages.append({"status": "Pull complete", "id": "layer0", "progressDetail": {}})
+
+        def events():
+            yield from messages
+            attrs = self._daemon._pull(reference)
+            yield {"status": f"Digest: {attrs['RepoDigests'][0].split('@')[1]}"}
+
+        return events() if stream else list(events())
+
+
+class _EventStream:
+    """Blocking iterator over daemon events, like the SDK's CancellableStream"""
+
+    def __init__(self, daemon: "FakeDockerClient", filters: Dict[str, Any]):
+        self._daemon = daemon
+        self._filters = filters
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._closed = False
+
+    def _offer(self, event: Dict[str, Any]) -> None:
+        if event["Type"] != self._filters.get("type", event["Type"]):
+            return
+        if "label" in self._filters and not _labels_match(event["Actor"]["Attributes"], self._filters["label"]):
+            return
+        self._queue.put(event)
+
+    def __iter__(self):
+        while True:
+            event = self._queue.get()
+            if event is None or self._closed:
+                return
+            yield event
+
+    def close(self) -> None:
+        self._closed = True
+        self._daemon._unsubscribe(self)
+        self._queue.put(None)
+
+
+class FakeDockerClient:
+    """A DockerClient look-alike whose "daemon" is a few dicts"""
+
+    def __init__(self, name: str = "fake", cpus: int = 4, memory_mb: int = 8192):
+        self.node_name = name
+        self.cpus = cpus
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self._lock = threading.RLock()
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._images: Dict[str, Dict[str, Any]] = {}
+        self._networks = {"bridge"}
+        self._subscribers: List[_EventStream] = []
+        self._down = False
+        self._next_ip = 10
+        self.containers = _Containers(self)
+        self.images = _Images(self)
+        self.networks = _Networks(self)
+        self.api = _Api(self)
+
+    @classmethod
+    def from_url(cls, name: str, url: str) -> "FakeDockerClient":
+        """fake://?cpus=4&memory=8192 (memory in MB)"""
+        query = parse_qs(urlparse(url).query)
+        return cls(
+            name=name,
+            cpus=int(query.get("cpus", ["4"])[0]),
+            memory_mb=int(query.get("memory", ["8192"])[0]),
+        )
+
+    # Failure injection
+
+    def set_down(self, down: bool) -> None:
+        """Make every call fail as if the daemon were unreachable"""
+        self._down = down
+        if down:
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for stream in subscribers:
+                stream.close()
+
+    def _check_up(self) -> None:
+        if self._down:
+            raise APIError(f"fake node {self.node_name} is down")
+
+    # Daemon
+
+    def ping(self) -> bool:
+        self._check_up()
+        return True
+
+    def info(self) -> Dict[str, Any]:
+        self._check_up()
+        with self._lock:
+            running = sum(1 for attrs in self._containers.values() if attrs["State"]["Status"] == "running")
+            return {
+                "Name": self.node_name,
+                "NCPU": self.cpus,
+                "MemTotal": self.memory_bytes,
+                "Containers": len(self._containers),
+                "ContainersRunning": running,
+                "ServerVersion": "fake",
+            }
+
+    def events(self, since: Optional[int] = None, decode: bool = True,
+               filters: Optional[Dict[str, Any]] = None, **kwargs) -> _EventStream:
+        self._check_up()
+        stream = _EventStream(self, filters or {})
+        with self._lock:
+            self._subscribers.append(stream)
+        return stream
+
+    def close(self) -> None:
+        pass
+
+    def _unsubscribe(self, stream: _EventStream) -> None:
+        with self._lock:
+            if stream in self._subscribers:
+                self._subscribers.remove(stream)
+
+    def _emit(self, action: str, attrs: Dict[str, Any], **extra: str) -> None:
+        event = {
+            "Type": "container",
+            "Action": action,
+            "status": action,
+            "id": attrs["Id"],
+            "Actor": {"ID": attrs["Id"], "Attributes": {**attrs["Config"]["Labels"], "name": attrs["Name"].lstrip("/"), **extra}},
+            "time": int(time.time()),
+        }
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for stream in subscribers:
+            stream._offer(event)
+
+    # Containers
+
+    def _find(self, container_id: str) -> Dict[str, Any]:
+        attrs = self._containers.get(container_id)
+        if attrs is None:
+            for candidate in self._containers.values():
+                if candidate["Name"].lstrip("/") == container_id or candidate["Id"].startswith(container_id):
+                    return candidate
+            raise NotFound(f"No such container: {container_id}")
+        return attrs
+
+    def _inspect(self, container_id: str) -> Dict[str, Any]:
+        self._check_up()
+        with self._lock:
+            return _copy(self._find(container_id))
+
+    def _run(self, image: str, name: Optional[str], environment: Dict[str, Any], ports: Dict[str, Any],
+             network: Optional[str], labels: Dict[str, str], nano_cpus: int, memory: int,
+             pids_limit: Optional[int]) -> FakeContainer:
+        self._check_up()
+        with self._lock:
+            container_id = _new_id(name or image)
+            name = name or f"fake_{container_id[:12]}"
+            if any(attrs["Name"] == f"/{name}" for attrs in self._containers.values()):
+                raise APIError(f"Conflict. The container name \"/{name}\" is already in use")
+            self._pull_locked(image)
+            ip_address = f"172.20.{self._next_ip // 250}.{self._next_ip % 250 + 2}"
+            self._next_ip += 1
+            attrs = {
+                "Id": container_id,
+                "Name": f"/{name}",
+                "Created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "State": {"Status": "running", "Running": True, "ExitCode": 0},
+                "Config": {"Image": image, "Labels": dict(labels), "Env": [f"{k}={v}" for k, v in environment.items()]},
+                "HostConfig": {"NanoCpus": nano_cpus, "Memory": memory, "PidsLimit": pids_limit},
+                "NetworkSettings": {
+                    "Networks": {network or "bridge": {"IPAddress": ip_address}},
+                    "Ports": {
+                        container_port: [{"HostIp": "0.0.0.0", "HostPort": str(host_port)}] if host_port else None
+                        for container_port, host_port in ports.items()
+                    },
+                },
+            }
+            self._containers[container_id] = attrs
+        self._emit("create", attrs)
+        self._emit("start", attrs)
+        return FakeContainer(self, _copy(attrs))
+
+    def _set_status(self, container_id: str, status: str, exit_code: int = 0, action: Optional[str] = None) -> None:
+        self._check_up()
+        with self._lock:
+            attrs = self._find(container_id)
+            was_running = attrs["State"]["Status"] == "running"
+            attrs["State"] = {"Status": status, "Running": status == "running", "ExitCode": exit_code}
+        if action and was_running:
+            self._emit(action, attrs, exitCode=str(exit_code))
+
+    def _remove(self, container_id: str, force: bool = False) -> None:
+        self._check_up()
+        with self._lock:
+            attrs = self._find(container_id)
+            if attrs["State"]["Status"] == "running" and not force:
+                raise APIError("You cannot remove a running container. Stop the container before attempting removal or force remove")
+            del self._containers[attrs["Id"]]
+        if attrs["State"]["Status"] == "running":
+            self._emit("die", attrs, exitCode="137")
+        self._emit("destroy", attrs)
+
+    def _rename(self, container_id: str, name: str) -> None:
+        self._check_up()
+        with self._lock:
+            attrs = self._find(container_id)
+            attrs["Name"] = f"/{name}"
+        self._emit("rename", attrs)
+
+    def _list(self, include_stopped: bool, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self._check_up()
+        with self._lock:
+            return [
+                _copy(attrs) for attrs in self._containers.values()
+                if (include_stopped or attrs["State"]["Status"] == "running")
+                and _labels_match(attrs["Config"]["Labels"], filters.get("label"))
+            ]
+
+    def kill(self, container_id: str, exit_code: int = 137) -> None:
+        """Simulate a container crashing"""
+        self._set_status(container_id, "exited", exit_code=exit_code, action="die")
+
+    # Images
+
+    def _pull_locked(self, reference: str) -> Dict[str, Any]:
+        name = reference if ":" in reference.rsplit("/", 1)[-1] else f"{reference}:latest"
+        attrs = self._images.get(name)
+        if attrs is None:
+            digest = hashlib.sha256(name.encode()).hexdigest()
+            attrs = {"Id": f"sha256:{digest}", "RepoTags": [name], "RepoDigests": [f"{name.split(':')[0]}@sha256:{digest}"],
+                     "Size": 50 * 1024 * 1024}
+            self._images[name] = attrs
+        return attrs
+
+    def _pull(self, reference: str) -> Dict[str, Any]:
+        self._check_up()
+        with self._lock:
+            return _copy(self._pull_locked(reference))
+
+    def _image(self, name: str) -> Dict[str, Any]:
+        self._check_up()
+        name = name if ":" in name.rsplit("/", 1)[-1] or name.startswith("sha256:") else f"{name}:latest"
+        with self._lock:
+            for tag, attrs in self._images.items():
+                if tag == name or attrs["Id"] == name:
+                    return _copy(attrs)
+        raise ImageNotFound(f"No such image: {name}")
+
+    def _list_images(self, name: Optional[str]) -> List[Dict[str, Any]]:
+        self._check_up()
+        with self._lock:
+            return [_copy(attrs) for tag, attrs in self._images.items() if not name or tag.split(":")[0] == name]
+
+    def _remove_image(self, image: str, force: bool = False) -> None:
+        attrs = self._image(image)
+        with self._lock:
+            in_use = any(c["Config"]["Image"] in attrs["RepoTags"] for c in self._containers.values())
+            if in_use and not force:
+                raise APIError(f"conflict: unable to remove image {image}, it is being used by a container")
+            for tag in attrs["RepoTags"]:
+                self._images.pop(tag, None)
+
+
+def _copy(attrs: Dict[str, Any]) -> Dict[str, Any]:
+    """Deep enough copy of an attrs dict (callers mutate what they get back)"""
+    return {key: _copy(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+            for key, value in attrs.items()}
@@ -0,0 +1,343 @@
+"""
+XploitRUM CTF Platform - Challenge Image Warmer
+
+A challenge's first deploy used to pull its docker_image inside the deploy,
+so the first player to start it waited for the whole download (and several
+players starting it at once each waited on the same pull). Instead, setting a
+challenge ACTIVE (create, update, status change) marks its image PENDING and
+the image is pulled in the background onto every connected Docker node, with
+the layer download progress and the resulting digest recorded on the
+challenge. Deploys of a challenge whose image is PENDING or PULLING are
+refused with a "try again shortly" error, and the warm pool skips it, until
+the image is READY. Challenges whose image_status is None (warmer disabled,
+simulation mode) keep pulling on demand; active challenges from before the
+warmer are picked up by its first resync.
+
+Pulls run on IMAGE_WARMER_WORKERS threads of one worker (database advisory
+lock). Requests are picked up immediately when made on that worker and every
+IMAGE_WARMER_POLL_SECONDS otherwise. Every IMAGE_WARMER_RESYNC_INTERVAL the
+warmer also retries FAILED pulls, re-pulls READY images missing from a node
+(e.g. one that joined later), and removes the images of challenges that have
+not been ACTIVE for IMAGE_GC_GRACE_HOURS and that no active challenge uses.
+Only images the warmer pulled itself are ever removed, never with force, so an
+image still used by a container is kept until a later pass.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from docker.errors import ImageNotFound
+from docker.utils import parse_repository_tag
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.exceptions import DockerError
+from app.core.leader_lock import LeaderLock
+from app.models.challenge import Challenge, ChallengeImageStatus, ChallengeStatus
+from app.services.cluster_service import DockerNode
+from app.services.expiry_service import _as_utc_naive
+from app.services.orchestrator_service import instance_orchestrator, InstanceOrchestrator
+
+IN_PROGRESS = (ChallengeImageStatus.PENDING, ChallengeImageStatus.PULLING)
+
+
+class ImageWarmer:
+    """Background pre-pull and garbage collection of challenge images"""
+
+    # Arbitrary, stable advisory lock id for the pulling worker
+    LOCK_KEY = 0x58524947
+    # Minimum seconds between progress writes of one pull
+    PROGRESS_WRITE_SECONDS = 2.0
+
+    def __init__(self, orchestrator: InstanceOrchestrator,
+                 max_workers: int = settings.IMAGE_WARMER_WORKERS,
+                 poll_seconds: int = settings.IMAGE_WARMER_POLL_SECONDS,
+                 resync_interval: int = settings.IMAGE_WARMER_RESYNC_INTERVAL):
+        self.cluster = orchestrator.docker_service.cluster
+        self.max_workers = max(1, max_workers)
+        self.poll_seconds = max(1, poll_seconds)
+        self.resync_interval = max(self.poll_seconds, resync_interval)
+        self._leader = LeaderLock(self.LOCK_KEY)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._inflight: Set[int] = set()
+        self._last_resync: Optional[float] = None
+        self._pulled = 0
+        self._failed = 0
+        self._removed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.IMAGE_WARMER_ENABLED and not self.cluster.simulated
+
+    # Requests
+
+    def request_pull(self, db: Session, challenge: Challenge) -> bool:
+        """Mark a challenge's image for pulling. The caller commits, then calls wake().
+        Returns False (image stays untracked) when there is nothing to pull."""
+        if not self.enabled or not challenge.docker_image:
+            return False
+        challenge.image_status = ChallengeImageStatus.PENDING
+        challenge.image_pull_progress = 0
+        challenge.image_error = None
+        return True
+
+    def wake(self) -> None:
+        """Pick up new requests now instead of at the next poll (no-op on non-leader workers' loops)"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # Loop closed during shutdown
+
+    # Lifecycle
+
+    def start(self) -> None:
+        """Start the warmer on the running event loop"""
+        if not self.enabled or self._task is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-warmer")
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="image-warmer")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._loop = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._leader.release()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await asyncio.to_thread(self._leader.try_acquire) and await asyncio.to_thread(self._leader.check):
+                    now = time.monotonic()
+                    if self._last_resync is None or now - self._last_resync >= self.resync_interval:
+                        self._last_resync = now
+                        await asyncio.to_thread(self.resync)
+                    await asyncio.to_thread(self.dispatch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Image warmer error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    # Pulling
+
+    def dispatch(self) -> int:
+        """Start pulls for requested images not already being pulled here. Returns how many were started."""
+        db = SessionLocal()
+        try:
+            # PULLING rows not in flight here were left behind by a previous leader
+            wanted = db.query(Challenge.id, Challenge.docker_image).filter(
+                Challenge.image_status.in_(IN_PROGRESS),
+                Challenge.docker_image.isnot(None)
+            ).all()
+        finally:
+            db.close()
+
+        started = 0
+        for challenge_id, image in wanted:
+            with self._lock:
+                if challenge_id in self._inflight:
+                    continue
+                self._inflight.add(challenge_id)
+            self._executor.submit(self._pull, challenge_id, image)
+            started += 1
+        return started
+
+    def _pull(self, challenge_id: int, image: str) -> None:
+        try:
+            if not self._update(challenge_id, image, IN_PROGRESS,
+                                image_status=ChallengeImageStatus.PULLING, image_pull_progress=0, image_error=None):
+                return  # Image changed or request withdrawn meanwhile
+            nodes = self.cluster.connected()
+            if not nodes:
+                raise DockerError("No Docker node is connected")
+            logger.info(f"Pulling image {image} of challenge {challenge_id} on {len(nodes)} node(s)")
+
+            percents = {node.name: 0 for node in nodes}
+            last_write = [time.monotonic()]
+
+            def report(node: str, percent: int) -> None:
+                percents[node] = percent
+                now = time.monotonic()
+                if now - last_write[0] >= self.PROGRESS_WRITE_SECONDS:
+                    last_write[0] = now
+                    overall = sum(percents.values()) // len(percents)
+                    self._update(challenge_id, image, (ChallengeImageStatus.PULLING,), image_pull_progress=min(overall, 99))
+
+            digest = None
+            for node in nodes:
+                digest = self._pull_on(node, image, report) or digest
+            if self._update(challenge_id, image, (ChallengeImageStatus.PULLING,),
+                            image_status=ChallengeImageStatus.READY, image_pull_progress=100,
+                            image_digest=digest, image_pulled_at=datetime.utcnow(), image_error=None):
+                with self._lock:
+                    self._pulled += 1
+                logger.info(f"Image {image} of challenge {challenge_id} is ready ({digest})")
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            logger.error(f"Failed to pull image {image} of challenge {challenge_id}: {e}")
+            self._update(challenge_id, image, IN_PROGRESS,
+                         image_status=ChallengeImageStatus.FAILED, image_error=str(e)[:1000])
+        finally:
+            with self._lock:
+                self._inflight.discard(challenge_id)
+
+    def _pull_on(self, node: DockerNode, image: str, report: Callable[[str, int], None]) -> Optional[str]:
+        """Pull onto one node, reporting download progress; returns the image digest"""
+        repository, tag = parse_repository_tag(image)
+        layers: Dict[str, tuple] = {}
+        for message in node.client.api.pull(repository, tag=tag or "latest", stream=True, decode=True):
+            if message.get("error"):
+                raise DockerError(f"{node.name}: {message['error']}")
+            layer, detail = message.get("id"), message.get("progressDetail") or {}
+            if layer and message.get("status") == "Downloading" and detail.get("total"):
+                layers[layer] = (detail.get("current", 0), detail["total"])
+            elif layer in layers and message.get("status") in ("Download complete", "Pull complete"):
+                layers[layer] = (layers[layer][1], layers[layer][1])
+            else:
+                continue
+            report(node.name, 100 * sum(c for c, _ in layers.values()) // max(1, sum(t for _, t in layers.values())))
+        report(node.name, 100)
+        pulled = node.client.images.get(image)
+        repo_digests = pulled.attrs.get("RepoDigests") or []
+        return repo_digests[0].split("@", 1)[1] if repo_digests else pulled.id
+
+    def _update(self, challenge_id: int, image: str, statuses, **values: Any) -> bool:
+        """Conditional write: only while the challenge still has this image and one of these statuses"""
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(Challenge)
+                .where(Challenge.id == challenge_id, Challenge.docker_image == image,
+                       Challenge.image_status.in_(statuses))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return result.rowcount == 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record image state of challenge {challenge_id}: {e}")
+            return False
+        finally:
+            db.close()
+
+    # Resync and garbage collection
+
+    def resync(self) -> None:
+        """Retry failed pulls, re-pull images missing from a node and collect unused images"""
+        db = SessionLocal()
+        try:
+            challenges = db.query(Challenge).filter(Challenge.docker_image.isnot(None)).all()
+            active_images = {c.docker_image for c in challenges if c.status == ChallengeStatus.ACTIVE}
+            for challenge in challenges:
+                if challenge.status != ChallengeStatus.ACTIVE or challenge.image_status in IN_PROGRESS:
+                    continue
+                if challenge.image_status in (None, ChallengeImageStatus.FAILED) or (
+                    challenge.image_status == ChallengeImageStatus.READY and not self._present(challenge.docker_image)
+                ):
+                    self.request_pull(db, challenge)
+            db.commit()
+
+            if settings.IMAGE_GC_ENABLED:
+                cutoff = datetime.utcnow() - timedelta(hours=settings.IMAGE_GC_GRACE_HOURS)
+                with self._lock:
+                    inflight = set(self._inflight)
+                for challenge in challenges:
+                    if (challenge.status == ChallengeStatus.ACTIVE or challenge.docker_image in active_images
+                            or challenge.image_status not in (ChallengeImageStatus.READY, ChallengeImageStatus.FAILED)
+                            or challenge.id in inflight):
+                        continue
+                    if _as_utc_naive(challenge.updated_at or challenge.created_at) > cutoff:
+                        continue
+                    if self._remove(challenge.docker_image):
+                        challenge.image_status = None
+                        challenge.image_digest = None
+                        challenge.image_pull_progress = 0
+                        challenge.image_pulled_at = None
+                        challenge.image_error = None
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _present(self, image: str) -> bool:
+        """Whether every reachable node has the image"""
+        for node in self.cluster.connected():
+            try:
+                node.client.images.get(image)
+            except ImageNotFound:
+                return False
+            except Exception as e:
+                logger.debug(f"Could not inspect image {image} on node {node.name}: {e}")
+        return True
+
+    def _remove(self, image: str) -> bool:
+        """Remove an image from every reachable node; False if some node still needs it"""
+        removed = True
+        for node in self.cluster.connected():
+            try:
+                node.client.images.remove(image, force=False)
+                with self._lock:
+                    self._removed += 1
+                logger.info(f"Removed unused image {image} from node {node.name}")
+            except ImageNotFound:
+                pass
+            except Exception as e:
+                removed = False
+                logger.debug(f"Kept image {image} on node {node.name}: {e}")
+        return removed
+
+    # Reads
+
+    def get_stats(self, db: Session) -> Dict[str, Any]:
+        by_status = dict(db.query(Challenge.image_status, func.count(Challenge.id)).filter(
+            Challenge.image_status.isnot(None)
+        ).group_by(Challenge.image_status).all())
+        with self._lock:
+            counters = {
+                "in_flight": len(self._inflight),
+                "pulled": self._pulled,
+                "failed": self._failed,
+                "removed": self._removed,
+            }
+        return {
+            "enabled": self.enabled,
+            "pulling": self._leader.held,
+            "gc_enabled": settings.IMAGE_GC_ENABLED,
+            "gc_grace_hours": settings.IMAGE_GC_GRACE_HOURS,
+            "challenges": {status.value: by_status.get(status, 0) for status in ChallengeImageStatus},
+            **counters,
+        }
+
+
+# Create image warmer instance
+image_warmer = ImageWarmer(instance_orchestrator)
@@ -0,0 +1,310 @@
+"""
+XploitRUM CTF Platform - Container Metrics Collector
+
+Samples CPU, memory and network usage of every running instance's container
+each CONTAINER_METRICS_INTERVAL seconds and stores smoothed values on the
+Instance row (cpu_usage %, memory_usage MB, network_traffic bytes), where the
+admin dashboard reads them.
+
+When the backend can see the host's cgroup v2 hierarchy (containers on a
+local Docker node), a sample is a few small file reads (cpu.stat,
+memory.current, memory.stat, and /proc/<pid>/net/dev for network counters).
+Otherwise, and for containers on remote nodes, it uses the owning node's
+Docker stats API, which blocks for a second or two per container, so
+samples are taken concurrently on a bounded thread pool. Either way the work runs in the background, never
+on a request. One worker collects at a time (database advisory lock) and
+writes all rows in a single executemany UPDATE.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from sqlalchemy import bindparam, update
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.leader_lock import LeaderLock
+from app.models.instance import Instance, InstanceStatus
+from app.services.orchestrator_service import instance_orchestrator, InstanceOrchestrator
+
+# Instance.network_traffic is a 32-bit integer column
+MAX_INT_COLUMN = 2 ** 31 - 1
+
+
+@dataclass
+class Sample:
+    """One reading of a container. cpu_percent is None when it needs a previous reading."""
+    cpu_percent: Optional[float]
+    memory_bytes: Optional[int]
+    network_bytes: Optional[int]
+
+
+@dataclass
+class Aggregate:
+    """Rolling per-instance values plus what the next cgroup sample needs"""
+    container_id: str
+    node: Optional[str] = None
+    cpu_percent: float = 0.0
+    memory_bytes: float = 0.0
+    network_bytes: int = 0
+    cgroup_path: Optional[Path] = None
+    cpu_usage_usec: Optional[int] = None
+    sampled_at: Optional[float] = None
+
+
+class ContainerMetricsCollector:
+    """Periodic, batched resource sampling of running instance containers"""
+
+    # Arbitrary, stable advisory lock id for the collecting worker
+    LOCK_KEY = 0x58524d43
+    # Weight of the newest sample in the exponential moving averages
+    SMOOTHING = 0.3
+
+    def __init__(self, orchestrator: InstanceOrchestrator,
+                 interval: int = settings.CONTAINER_METRICS_INTERVAL,
+                 max_workers: int = settings.CONTAINER_METRICS_WORKERS,
+                 cgroup_root: str = settings.CONTAINER_METRICS_CGROUP_ROOT):
+        self.docker_service = orchestrator.docker_service
+        self.interval = max(1, interval)
+        self.max_workers = max(1, max_workers)
+        self.cgroup_root = Path(cgroup_root)
+        self.cgroup_v2 = (self.cgroup_root / "cgroup.controllers").exists()
+        self._leader = LeaderLock(self.LOCK_KEY)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._aggregates: Dict[int, Aggregate] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._cgroup_samples = 0
+        self._api_samples = 0
+        self._failures = 0
+        self._last_duration = 0.0
+
+    def start(self) -> None:
+        """Start the collection task on the running event loop"""
+        if not settings.CONTAINER_METRICS_ENABLED or not self.docker_service.is_available or self._task is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="container-metrics")
+        self._task = asyncio.create_task(self._run(), name="container-metrics")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._leader.release()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await asyncio.to_thread(self._leader.try_acquire) and await asyncio.to_thread(self._leader.check):
+                    await asyncio.to_thread(self.collect)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Container metrics collection error: {e}")
+            await asyncio.sleep(self.interval)
+
+    # Collection
+
+    def collect(self) -> int:
+        """Sample every running instance and store the aggregates. Returns how many were updated."""
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            targets = db.query(Instance.id, Instance.container_id, Instance.node).filter(
+                Instance.status == InstanceStatus.RUNNING,
+                Instance.container_id.isnot(None)
+            ).all()
+        finally:
+            db.close()
+
+        live = {instance_id: (container_id, node) for instance_id, container_id, node in targets
+                if not container_id.startswith("mock-")}
+        for instance_id in [i for i, agg in self._aggregates.items() if live.get(i) != (agg.container_id, agg.node)]:
+            del self._aggregates[instance_id]
+        if not live:
+            return 0
+
+        aggregates = [
+            (instance_id, self._aggregates.setdefault(instance_id, Aggregate(container_id=container_id, node=node)))
+            for instance_id, (container_id, node) in live.items()
+        ]
+        samples = list(self._executor.map(self._sample, [aggregate for _, aggregate in aggregates]))
+
+        rows = []
+        for (instance_id, aggregate), sample in zip(aggregates, samples):
+            if sample is None:
+                continue
+            self._fold(aggregate, sample)
+            rows.append({
+                "b_id": instance_id,
+                "b_cpu": int(round(aggregate.cpu_percent)),
+                "b_memory": int(round(aggregate.memory_bytes / (1024 * 1024))),
+                "b_network": min(aggregate.network_bytes, MAX_INT_COLUMN),
+            })
+        if rows:
+            self._write(rows)
+        self._last_duration = time.monotonic() - started
+        return len(rows)
+
+    def _fold(self, aggregate: Aggregate, sample: Sample) -> None:
+        alpha = self.SMOOTHING
+        if sample.cpu_percent is not None:
+            aggregate.cpu_percent += alpha * (sample.cpu_percent - aggregate.cpu_percent)
+        if sample.memory_bytes is not None:
+            if aggregate.memory_bytes:
+                aggregate.memory_bytes += alpha * (sample.memory_bytes - aggregate.memory_bytes)
+            else:
+                aggregate.memory_bytes = float(sample.memory_bytes)
+        if sample.network_bytes is not None:
+            # Counters are cumulative since container start
+            aggregate.network_bytes = sample.network_bytes
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        stmt = (
+            update(Instance.__table__)
+            .where(Instance.__table__.c.id == bindparam("b_id"))
+            .values(
+                cpu_usage=bindparam("b_cpu"),
+                memory_usage=bindparam("b_memory"),
+                network_traffic=bindparam("b_network"),
+            )
+        )
+        db = SessionLocal()
+        try:
+            db.connection().execute(stmt, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _sample(self, aggregate: Aggregate) -> Optional[Sample]:
+        try:
+            if self.cgroup_v2 and self.docker_service.cluster.get(aggregate.node).is_local:
+                sample = self._sample_cgroup(aggregate)
+                if sample is not None:
+                    with self._lock:
+                        self._cgroup_samples += 1
+                    return sample
+            sample = self._sample_stats_api(aggregate)
+            with self._lock:
+                self._api_samples += 1
+            return sample
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+            logger.debug(f"Could not sample container {aggregate.container_id}: {e}")
+            return None
+
+    # cgroup v2
+
+    def _find_cgroup(self, container_id: str) -> Optional[Path]:
+        """Container cgroup under the systemd or cgroupfs Docker cgroup drivers"""
+        for candidate in (
+            self.cgroup_root / "system.slice" / f"docker-{container_id}.scope",
+            self.cgroup_root / "docker" / container_id,
+        ):
+            if (candidate / "cpu.stat").exists():
+                return candidate
+        return None
+
+    def _sample_cgroup(self, aggregate: Aggregate) -> Optional[Sample]:
+        if aggregate.cgroup_path is None:
+            aggregate.cgroup_path = self._find_cgroup(aggregate.container_id)
+            if aggregate.cgroup_path is None:
+                return None
+        path = aggregate.cgroup_path
+        try:
+            usage_usec = int(_read_keyed(path / "cpu.stat")["usage_usec"])
+            memory = int((path / "memory.current").read_text())
+            memory -= int(_read_keyed(path / "memory.stat").get("inactive_file", 0))
+        except (OSError, KeyError, ValueError):
+            aggregate.cgroup_path = None
+            return None
+
+        now = time.monotonic()
+        cpu_percent = None
+        if aggregate.cpu_usage_usec is not None and now > aggregate.sampled_at:
+            cpu_percent = max(0.0, (usage_usec - aggregate.cpu_usage_usec) / ((now - aggregate.sampled_at) * 1e6) * 100.0)
+        aggregate.cpu_usage_usec, aggregate.sampled_at = usage_usec, now
+        return Sample(cpu_percent=cpu_percent, memory_bytes=max(0, memory), network_bytes=_network_bytes(path))
+
+    # Docker stats API fallback
+
+    def _sample_stats_api(self, aggregate: Aggregate) -> Sample:
+        stats = self.docker_service.client_for(aggregate.node).api.stats(aggregate.container_id, stream=False)
+        cpu_stats, precpu_stats = stats.get("cpu_stats", {}), stats.get("precpu_stats", {})
+        cpu_delta = cpu_stats.get("cpu_usage", {}).get("total_usage", 0) - precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+        system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
+        cpus = cpu_stats.get("online_cpus") or len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+        cpu_percent = (cpu_delta / system_delta) * cpus * 100.0 if system_delta > 0 and cpu_delta >= 0 else None
+
+        memory_stats = stats.get("memory_stats", {})
+        memory = memory_stats.get("usage")
+        if memory is not None:
+            # Same as `docker stats`: page cache that can be reclaimed is not counted
+            memory -= memory_stats.get("stats", {}).get("inactive_file", 0)
+
+        networks = stats.get("networks") or {}
+        network = sum(net.get("rx_bytes", 0) + net.get("tx_bytes", 0) for net in networks.values()) if networks else None
+        return Sample(cpu_percent=cpu_percent, memory_bytes=memory, network_bytes=network)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = (self._cgroup_samples, self._api_samples, self._failures)
+        return {
+            "enabled": self._task is not None,
+            "collecting": self._leader.held,
+            "source": "cgroup_v2" if self.cgroup_v2 else "stats_api",
+            "interval_seconds": self.interval,
+            "tracked_instances": len(self._aggregates),
+            "cgroup_samples": samples[0],
+            "api_samples": samples[1],
+            "failures": samples[2],
+            "last_collection_ms": round(self._last_duration * 1000, 2),
+        }
+
+
+def _read_keyed(path: Path) -> Dict[str, str]:
+    """Parse a cgroup "key value" file (cpu.stat, memory.stat)"""
+    values = {}
+    for line in path.read_text().splitlines():
+        key, _, value = line.partition(" ")
+        values[key] = value
+    return values
+
+
+def _network_bytes(cgroup_path: Path) -> Optional[int]:
+    """rx + tx bytes of a container's interfaces, read through the network namespace of one of its
+    processes. None if /proc does not show the host's processes (e.g. backend in its own PID namespace)."""
+    try:
+        pid = (cgroup_path / "cgroup.procs").read_text().split()[0]
+        lines = Path(f"/proc/{pid}/net/dev").read_text().splitlines()[2:]
+    except (OSError, IndexError):
+        return None
+    total = 0
+    for line in lines:
+        name, _, counters = line.partition(":")
+        if name.strip() == "lo":
+            continue
+        fields = counters.split()
+        if len(fields) >= 9:
+            total += int(fields[0]) + int(fields[8])
+    return total
+
+
+# Create container metrics collector instance
+container_metrics = ContainerMetricsCollector(instance_orchestrator)
@@ -0,0 +1,329 @@
+"""
+XploitRUM CTF Platform - Instance Orchestrator
+
+Container deploys and stops are slow, blocking Docker SDK calls. Request
+handlers only validate and record the Instance row; the actual container work
+is queued here and executed by a bounded pool of worker threads, each with its
+own database session. Clients poll the instance to see it move from STARTING
+to RUNNING (or ERROR).
+
+The queue lives in process memory, so a deploy queued by a worker that exits
+leaves its instance STARTING with nobody to run it. The expiry scheduler
+leader calls recover_stranded() when it takes over and on every full sync to
+re-enqueue STARTING instances older than ORCHESTRATOR_RECOVERY_GRACE_SECONDS
+(past their deadline, the expiry scheduler already tears them down).
+"""
+
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+from sqlalchemy import or_
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.exceptions import DockerError
+from app.models.challenge import Challenge, ChallengeImageStatus, ChallengeStatus
+from app.models.instance import Instance, InstanceStatus
+from app.services.docker_service import DockerService, WarmPoolSpec, warm_pool_size
+from app.services.port_service import port_allocator
+from app.utils.resources import ResourceProfile
+
+
+class InstanceOrchestrator:
+    """Background job queue for container lifecycle operations"""
+
+    def __init__(self, docker_service: DockerService, max_workers: int = settings.ORCHESTRATOR_WORKERS):
+        self.docker_service = docker_service
+        self.max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[int, Future] = {}
+        self._deadline_listeners: List[Callable[[int, datetime], None]] = []
+        self._release_listeners: List[Callable[[int], None]] = []
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="instance-orchestrator"
+                )
+            return self._executor
+
+    def _submit(self, instance_id: int, fn, *args) -> None:
+        executor = self._get_executor()
+        with self._lock:
+            previous = self._pending.get(instance_id)
+            if previous is not None:
+                # Jobs for the same instance run in order (e.g. a stop queued behind its deploy)
+                future = executor.submit(self._run_after, previous, fn, instance_id, *args)
+            else:
+                future = executor.submit(fn, instance_id, *args)
+            self._pending[instance_id] = future
+        future.add_done_callback(lambda f, key=instance_id: self._job_done(key, f))
+
+    @staticmethod
+    def _run_after(previous: Future, fn, *args) -> None:
+        try:
+            previous.result()
+        except Exception:
+            pass
+        fn(*args)
+
+    def _job_done(self, instance_id: int, future: Future) -> None:
+        with self._lock:
+            if self._pending.get(instance_id) is future:
+                del self._pending[instance_id]
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Orchestrator job for instance {instance_id} crashed: {error}")
+
+    def add_deadline_listener(self, listener: Callable[[int, datetime], None]) -> None:
+        """Called with (instance_id, expires_at) whenever an instance starts running"""
+        self._deadline_listeners.append(listener)
+
+    def add_release_listener(self, listener: Callable[[int], None]) -> None:
+        """Called with the instance id whenever an instance stops holding host capacity"""
+        self._release_listeners.append(listener)
+
+    def notify_released(self, instance_id: int) -> None:
+        for listener in self._release_listeners:
+            try:
+                listener(instance_id)
+            except Exception as e:
+                logger.error(f"Release listener failed for instance {instance_id}: {e}")
+
+    def enqueue_deploy(self, instance_id: int) -> None:
+        """Queue container creation for an instance already recorded as STARTING"""
+        self._submit(instance_id, self._run_deploy)
+
+    def enqueue_stop(self, instance_id: int, final_status: InstanceStatus = InstanceStatus.STOPPED) -> None:
+        """Queue container removal; the instance ends in final_status (STOPPED or EXPIRED)"""
+        self._submit(instance_id, self._run_stop, final_status)
+
+    def is_pending(self, instance_id: int) -> bool:
+        with self._lock:
+            return instance_id in self._pending
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {"workers": self.max_workers, "pending_jobs": len(self._pending)}
+        stats["warm_pool"] = self.docker_service.warm_pool.get_metrics()
+        stats["ports"] = port_allocator.get_stats()
+        stats["nodes"] = self.docker_service.cluster.get_stats()
+        return stats
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting jobs; queued-but-unstarted jobs are dropped unless wait is True"""
+        self.docker_service.warm_pool.stop(drain=True)
+        self.docker_service.cluster.stop()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _start_container(self, instance: Instance, challenge: Challenge) -> None:
+        """Create the container and copy its network details onto the instance"""
+        if not self.docker_service.is_available:
+            # SIMULATION MODE: Docker not available, record a mock container
+            instance.container_id = f"mock-{uuid.uuid4().hex[:12]}"
+            instance.container_ip = f"172.20.0.{random.randint(10, 250)}"
+            instance.container_ports = {"80/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(random.randint(8000, 9000))}]}
+            return
+
+        # Admission control picked the node; warm pools only exist on the default one
+        node = self.docker_service.cluster.get(instance.node)
+        instance.node = node.name
+        if not node.healthy:
+            raise DockerError(f"Docker node {node.name} is unhealthy")
+
+        if node.name == self.docker_service.cluster.default:
+            container = self.docker_service.warm_pool.claim(challenge.id, instance.container_name, instance_id=instance.id)
+            if container is not None:
+                instance.container_id = container.id
+                instance.container_ip, instance.container_ports = self.docker_service.get_network_info(container)
+                return
+
+        container = self.docker_service.client_for(node.name).containers.run(
+            image=challenge.docker_image,
+            name=instance.container_name,
+            environment=challenge.docker_environment or {},
+            ports=port_allocator.map_ports(challenge.docker_ports, instance_id=instance.id),
+            volumes=challenge.docker_volumes or {},
+            network=settings.CHALLENGE_NETWORK,
+            detach=True,
+            labels={
+                "challenge_id": str(challenge.id),
+                "instance_id": str(instance.id),
+                "user_id": str(instance.user_id) if instance.user_id else "anonymous",
+                "managed_by": "xploitrum"
+            },
+            # Limits match what admission control reserved for the instance
+            **ResourceProfile.for_instance(instance, challenge).docker_limits()
+        )
+        instance.container_id = container.id
+        self.docker_service.wait_for_container_running(container, timeout=settings.CONTAINER_READY_TIMEOUT)
+        container.reload()
+        instance.container_ip, instance.container_ports = self.docker_service.get_network_info(container)
+
+    def load_warm_pool_targets(self) -> List[WarmPoolSpec]:
+        """Desired warm pools: one per active challenge with an image that is not still being pulled,
+        sized from max_instances"""
+        db = SessionLocal()
+        try:
+            challenges = db.query(Challenge).filter(
+                Challenge.status == ChallengeStatus.ACTIVE,
+                Challenge.docker_image.isnot(None),
+                or_(Challenge.image_status.is_(None), Challenge.image_status == ChallengeImageStatus.READY)
+            ).all()
+            return [
+                WarmPoolSpec(
+                    challenge_id=challenge.id,
+                    image=challenge.docker_image,
+                    size=warm_pool_size(challenge.max_instances),
+                    environment=challenge.docker_environment or {},
+                    ports=challenge.docker_ports or {},
+                    volumes=challenge.docker_volumes or {},
+                    resources=ResourceProfile.for_challenge(challenge)
+                )
+                for challenge in challenges
+            ]
+        finally:
+            db.close()
+
+    def start_node_health(self) -> None:
+        """Start health checks of the Docker nodes (reconnects nodes that were down at startup)"""
+        self.docker_service.cluster.start()
+
+    def start_warm_pool(self) -> None:
+        if settings.WARM_POOL_ENABLED:
+            self.docker_service.warm_pool.start(self.load_warm_pool_targets)
+
+    def recover_stranded(self) -> List[int]:
+        """Re-enqueue deploys of STARTING instances whose job died with another process.
+        Returns the re-enqueued instance ids."""
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=settings.ORCHESTRATOR_RECOVERY_GRACE_SECONDS)
+        recovered: List[int] = []
+        db = SessionLocal()
+        try:
+            rows = db.query(Instance.id, Instance.started_at).filter(
+                Instance.status == InstanceStatus.STARTING,
+                Instance.started_at < cutoff,
+                Instance.expires_at > now
+            ).all()
+            for instance_id, started_at in rows:
+                if self.is_pending(instance_id):
+                    continue
+                # Claim by restarting the grace period, so concurrent recoveries enqueue it once
+                claimed = db.query(Instance).filter(
+                    Instance.id == instance_id,
+                    Instance.status == InstanceStatus.STARTING,
+                    Instance.started_at == started_at
+                ).update({"started_at": now}, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    recovered.append(instance_id)
+        finally:
+            db.close()
+
+        for instance_id in recovered:
+            self._submit(instance_id, self._run_redeploy)
+        if recovered:
+            logger.warning(f"Re-enqueued {len(recovered)} stranded deploy(s): {recovered}")
+        return recovered
+
+    def reconcile_ports(self) -> Dict[str, int]:
+        """Sync port reservations with running containers (call before any deploys)"""
+        return port_allocator.reconcile(self.docker_service)
+
+    def _run_deploy(self, instance_id: int) -> None:
+        db = SessionLocal()
+        try:
+            instance = db.query(Instance).filter(Instance.id == instance_id).first()
+            if instance is None or instance.status != InstanceStatus.STARTING:
+                return
+            challenge = db.query(Challenge).filter(Challenge.id == instance.challenge_id).first()
+
+            try:
+                if challenge is None:
+                    raise ValueError("Challenge no longer exists")
+                self._start_container(instance, challenge)
+                now = datetime.utcnow()
+                instance.status = InstanceStatus.RUNNING
+                instance.started_at = now
+                instance.expires_at = now + timedelta(seconds=challenge.instance_timeout)
+                instance.error_message = None
+                logger.info(f"Instance {instance_id} running in container {instance.container_id}")
+            except Exception as e:
+                logger.error(f"Failed to deploy instance {instance_id}: {e}")
+                if instance.container_id and self.docker_service.is_available:
+                    try:
+                        self.docker_service.remove_container(instance.container_id, node=instance.node)
+                    except Exception:
+                        pass
+                port_allocator.release_instance(instance_id)
+                instance.status = InstanceStatus.ERROR
+                instance.error_message = str(e)
+                instance.stopped_at = datetime.utcnow()
+
+            db.commit()
+            if instance.status == InstanceStatus.RUNNING:
+                for listener in self._deadline_listeners:
+                    listener(instance.id, instance.expires_at)
+            else:
+                self.notify_released(instance_id)
+        finally:
+            db.close()
+
+    def _run_redeploy(self, instance_id: int) -> None:
+        """Remove whatever the interrupted deploy left behind, then deploy again"""
+        if self.docker_service.is_available:
+            db = SessionLocal()
+            try:
+                row = db.query(Instance.container_id, Instance.container_name, Instance.node).filter(
+                    Instance.id == instance_id
+                ).first()
+            finally:
+                db.close()
+            container_id, container_name, node = row or (None, None, None)
+            leftover = container_id or container_name
+            if leftover:
+                try:
+                    self.docker_service.remove_container(leftover, node=node)
+                except Exception as e:
+                    logger.warning(f"Could not remove leftover container of instance {instance_id}: {e}")
+        port_allocator.release_instance(instance_id)
+        self._run_deploy(instance_id)
+
+    def _run_stop(self, instance_id: int, final_status: InstanceStatus) -> None:
+        db = SessionLocal()
+        try:
+            instance = db.query(Instance).filter(Instance.id == instance_id).first()
+            if instance is None or instance.status not in (InstanceStatus.RUNNING, InstanceStatus.STARTING):
+                return
+
+            try:
+                if instance.container_id and self.docker_service.is_available:
+                    self.docker_service.remove_container(instance.container_id, node=instance.node)
+                port_allocator.release_instance(instance_id)
+                instance.status = final_status
+                instance.stopped_at = datetime.utcnow()
+            except Exception as e:
+                logger.error(f"Failed to stop instance {instance_id}: {e}")
+                instance.cleanup_attempts = (instance.cleanup_attempts or 0) + 1
+                instance.error_message = str(e)
+
+            db.commit()
+            if instance.status == final_status:
+                self.notify_released(instance_id)
+        finally:
+            db.close()
+
+
+# Create orchestrator instance
+instance_orchestrator = InstanceOrchestrator(DockerService())
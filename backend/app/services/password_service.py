@@ -0,0 +1,117 @@
+"""
+XploitRUM CTF Platform - Password Hashing Service
+
+bcrypt is deliberately slow (hundreds of milliseconds at cost 12), so hashes
+and verifies run on a dedicated, bounded thread pool instead of the request
+path: async handlers await them without blocking the event loop, and bursts
+of logins queue up behind PASSWORD_HASH_WORKERS instead of saturating every
+CPU. bcrypt releases the GIL while hashing, so threads give real parallelism.
+
+The work factor comes from BCRYPT_ROUNDS. Hashes made with any other cost are
+reported by verify_and_update so callers can store a rehash after a
+successful login.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+
+class PasswordService:
+    """Bounded worker pool for bcrypt hashing and verification"""
+
+    def __init__(self, rounds: int = settings.BCRYPT_ROUNDS, max_workers: int = settings.PASSWORD_HASH_WORKERS,
+                 max_queue: int = settings.PASSWORD_HASH_MAX_QUEUE):
+        # min == max == default: any hash with a different cost needs an update
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server is busy, please try again"
+                )
+            self._queued += 1
+        return self._executor.submit(self._timed, time.perf_counter(), fn, *args)
+
+    def _timed(self, submitted_at: float, fn: Callable, *args):
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += started - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_total += time.perf_counter() - started
+
+    # Blocking API for sync handlers and services (they already run in a threadpool)
+
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self._submit(self.context.verify, password, hashed_password).result()
+
+    def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(valid, new_hash); new_hash is set when the stored hash uses an outdated cost"""
+        return self._submit(self.context.verify_and_update, password, hashed_password).result()
+
+    # Async API for async def handlers
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self._submit(self.context.verify, password, hashed_password))
+
+    async def verify_and_update_async(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await asyncio.wrap_future(self._submit(self.context.verify_and_update, password, hashed_password))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.max_workers,
+                "rounds": settings.BCRYPT_ROUNDS,
+                "queue_depth": self._queued,
+                "in_flight": self._running,
+                "completed": completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_total / completed * 1000, 2) if completed else 0.0,
+                "avg_hash_ms": round(self._run_total / completed * 1000, 2) if completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Create password service instance
+password_service = PasswordService()
@@ -0,0 +1,134 @@
+"""
+XploitRUM CTF Platform - Pico Challenge Registry
+
+Caches all pico challenges in memory with their flag matchers compiled once.
+Matchers are keyed by flag pattern, so a row only recompiles after its
+pattern is edited (updated_at has one-second resolution on SQLite and cannot
+tell an edit from the row's creation). Admin writes invalidate the registry; other workers pick up changes
+on the next periodic reload.
+"""
+
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+from sqlalchemy.orm import Session
+
+from app.models.pico_challenge import PicoChallenge, PicoSubmission, PicoCategory, PicoDifficulty
+
+
+def flag_pattern_to_regex(pattern: str) -> re.Pattern:
+    """Convert flag pattern with * (alphanumeric) to regex. Case-sensitive match."""
+    escaped = re.escape(pattern)
+    regex_str = escaped.replace(r"\*", r"[a-zA-Z0-9]+")
+    return re.compile("^" + regex_str + "$")
+
+
+@dataclass(frozen=True)
+class PicoChallengeEntry:
+    """Immutable snapshot of a pico challenge with its compiled matcher"""
+    id: int
+    title: str
+    category: PicoCategory
+    difficulty: PicoDifficulty
+    points: int
+    display_order: int
+    matcher: Optional[re.Pattern]
+
+    def check_flag(self, submitted: str) -> bool:
+        submitted = (submitted or "").strip()
+        if not submitted or self.matcher is None:
+            return False
+        return self.matcher.match(submitted) is not None
+
+
+class PicoRegistry:
+    """In-memory registry of pico challenges"""
+
+    # Rows are re-read at most this often so other workers' admin edits show up
+    RELOAD_INTERVAL_SECONDS = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, PicoChallengeEntry] = {}
+        self._ordered: List[PicoChallengeEntry] = []
+        self._matchers: Dict[str, Optional[re.Pattern]] = {}
+        self._loaded_at: Optional[float] = None
+
+    def invalidate(self) -> None:
+        """Force a reload on next access (called after admin create/update/delete)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self, db: Session) -> None:
+        challenges = (
+            db.query(PicoChallenge)
+            .order_by(PicoChallenge.display_order, PicoChallenge.id)
+            .all()
+        )
+        matchers = {}
+        ordered = []
+        for c in challenges:
+            key = c.flag_pattern
+            if key in self._matchers:
+                matcher = self._matchers[key]
+            else:
+                try:
+                    matcher = flag_pattern_to_regex(c.flag_pattern)
+                except re.error:
+                    matcher = None
+            matchers[key] = matcher
+            ordered.append(
+                PicoChallengeEntry(
+                    id=c.id,
+                    title=c.title,
+                    category=c.category,
+                    difficulty=c.difficulty,
+                    points=c.points,
+                    display_order=c.display_order,
+                    matcher=matcher,
+                )
+            )
+        self._matchers = matchers
+        self._ordered = ordered
+        self._entries = {entry.id: entry for entry in ordered}
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, db: Session) -> None:
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.RELOAD_INTERVAL_SECONDS:
+                self._load(db)
+
+    def list_challenges(
+        self,
+        db: Session,
+        category: Optional[PicoCategory] = None,
+        difficulty: Optional[PicoDifficulty] = None,
+    ) -> List[PicoChallengeEntry]:
+        """All challenges in display order, optionally filtered"""
+        self._ensure_loaded(db)
+        return [
+            entry
+            for entry in self._ordered
+            if (category is None or entry.category == category)
+            and (difficulty is None or entry.difficulty == difficulty)
+        ]
+
+    def get_challenge(self, db: Session, challenge_id: int) -> Optional[PicoChallengeEntry]:
+        self._ensure_loaded(db)
+        return self._entries.get(challenge_id)
+
+    @staticmethod
+    def get_solved_ids(db: Session, user_id: int) -> Set[int]:
+        """IDs of pico challenges the user has solved, in one query"""
+        rows = (
+            db.query(PicoSubmission.pico_challenge_id)
+            .filter(PicoSubmission.user_id == user_id, PicoSubmission.correct == 1)
+            .distinct()
+        )
+        return {challenge_id for (challenge_id,) in rows}
+
+
+# Create pico registry instance
+pico_registry = PicoRegistry()
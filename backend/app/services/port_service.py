@@ -0,0 +1,265 @@
+"""
+XploitRUM CTF Platform - Host Port Allocator
+
+Hands out host ports for challenge containers from CHALLENGE_PORT_RANGE.
+Each worker keeps a bitmap of ports known to be taken and a FIFO free-list,
+so picking a port is O(1) and needs no socket probing. The port_reservations
+table is the source of truth: its primary key guarantees that two workers
+never hand out the same port, and it is reconciled against running
+containers at startup. Every worker calls reconcile on start, so it runs under
+an advisory lock (one worker reconciles, the others skip), and reservations
+younger than PORT_RECONCILE_GRACE_SECONDS are never released: they may belong
+to a deploy or warm container another worker is still starting.
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.leader_lock import LeaderLock
+from app.models.instance import Instance, InstanceStatus
+from app.models.port_reservation import PortReservation
+
+
+def parse_port_range(value: str) -> Tuple[int, int]:
+    """Parse "low-high" (inclusive) into a tuple"""
+    low, _, high = value.partition("-")
+    low_port, high_port = int(low), int(high or low)
+    if not 1 <= low_port <= high_port <= 65535:
+        raise ValueError(f"Invalid port range: {value}")
+    return low_port, high_port
+
+
+def ports_from_mapping(container_ports: Optional[Dict[str, Any]]) -> List[int]:
+    """Host ports in a Docker port mapping ({"80/tcp": [{"HostPort": "10001"}]} or {"80/tcp": 10001})"""
+    ports = []
+    for binding in (container_ports or {}).values():
+        entries = binding if isinstance(binding, list) else [binding]
+        for entry in entries:
+            host_port = entry.get("HostPort") if isinstance(entry, dict) else entry
+            if host_port and str(host_port).isdigit():
+                ports.append(int(host_port))
+    return ports
+
+
+class PortAllocator:
+    """O(1) host port allocation backed by persisted reservations"""
+
+    MAX_COLLISIONS = 64
+    # Arbitrary, stable advisory lock id for reconcile
+    RECONCILE_LOCK_KEY = 0x58525052
+
+    def __init__(self, port_range: str = settings.CHALLENGE_PORT_RANGE):
+        self.low, self.high = parse_port_range(port_range)
+        self._lock = threading.Lock()
+        self._used = bytearray(self.high - self.low + 1)
+        self._free: deque = deque(range(self.low, self.high + 1))
+        self._loaded = False
+
+    def _in_range(self, port: int) -> bool:
+        return self.low <= port <= self.high
+
+    def _mark_used(self, port: int) -> None:
+        if self._in_range(port):
+            self._used[port - self.low] = 1
+
+    def _mark_free(self, port: int) -> None:
+        if self._in_range(port) and self._used[port - self.low]:
+            self._used[port - self.low] = 0
+            self._free.append(port)
+
+    def _pop_free(self) -> Optional[int]:
+        # Free-list entries can be stale (taken via reconcile); skip them lazily
+        while self._free:
+            port = self._free.popleft()
+            if not self._used[port - self.low]:
+                self._used[port - self.low] = 1
+                return port
+        return None
+
+    def _load(self) -> None:
+        """Rebuild the bitmap from the reservations table"""
+        db = SessionLocal()
+        try:
+            taken = {port for (port,) in db.query(PortReservation.port)}
+        finally:
+            db.close()
+        self._used = bytearray(self.high - self.low + 1)
+        for port in taken:
+            self._mark_used(port)
+        self._free = deque(port for port in range(self.low, self.high + 1) if not self._used[port - self.low])
+        self._loaded = True
+
+    def reserve(self, count: int, instance_id: Optional[int] = None, container_id: Optional[str] = None) -> List[int]:
+        """Reserve `count` host ports. Raises RuntimeError if the range is exhausted."""
+        reserved: List[int] = []
+        collisions = 0
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            while len(reserved) < count:
+                port = self._pop_free()
+                if port is None:
+                    # Other workers may have released ports since our last load
+                    self._load()
+                    port = self._pop_free()
+                    if port is None:
+                        self._release_locked(reserved)
+                        raise RuntimeError("No free host ports left in CHALLENGE_PORT_RANGE")
+                if self._persist(port, instance_id, container_id):
+                    reserved.append(port)
+                    continue
+                # Another worker holds it: keep it marked used and try the next one
+                collisions += 1
+                if collisions > self.MAX_COLLISIONS:
+                    self._load()
+                    collisions = 0
+        return reserved
+
+    def _persist(self, port: int, instance_id: Optional[int], container_id: Optional[str]) -> bool:
+        db = SessionLocal()
+        try:
+            db.add(PortReservation(port=port, instance_id=instance_id, container_id=container_id))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def map_ports(self, port_spec: Optional[Dict[str, Any]], instance_id: Optional[int] = None,
+                  container_id: Optional[str] = None) -> Dict[str, int]:
+        """Assign a reserved host port to every container port in a challenge's docker_ports"""
+        container_ports = list((port_spec or {}).keys())
+        host_ports = self.reserve(len(container_ports), instance_id=instance_id, container_id=container_id)
+        return dict(zip(container_ports, host_ports))
+
+    def assign(self, ports: Iterable[int], instance_id: Optional[int] = None, container_id: Optional[str] = None) -> None:
+        """Re-point existing reservations (e.g. a warm container claimed by an instance)"""
+        ports = list(ports)
+        if not ports:
+            return
+        db = SessionLocal()
+        try:
+            values = {}
+            if instance_id is not None:
+                values["instance_id"] = instance_id
+            if container_id is not None:
+                values["container_id"] = container_id
+            if values:
+                db.query(PortReservation).filter(PortReservation.port.in_(ports)).update(
+                    values, synchronize_session=False
+                )
+                db.commit()
+        finally:
+            db.close()
+
+    def release(self, ports: Iterable[int]) -> None:
+        with self._lock:
+            self._release_locked(list(ports))
+
+    def _release_locked(self, ports: List[int]) -> None:
+        if not ports:
+            return
+        db = SessionLocal()
+        try:
+            db.query(PortReservation).filter(PortReservation.port.in_(ports)).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        for port in ports:
+            self._mark_free(port)
+
+    def release_instance(self, instance_id: int) -> None:
+        """Free every port reserved for an instance (stop, expiry, failed deploy)"""
+        db = SessionLocal()
+        try:
+            ports = [port for (port,) in db.query(PortReservation.port).filter(PortReservation.instance_id == instance_id)]
+        finally:
+            db.close()
+        self.release(ports)
+
+    def reconcile(self, docker_service) -> Dict[str, int]:
+        """Make reservations match reality: ports published by our containers or recorded on
+        active instances are reserved, everything else older than the grace period is released.
+        Skipped while another worker is reconciling."""
+        lock = LeaderLock(self.RECONCILE_LOCK_KEY)
+        if not lock.try_acquire():
+            logger.info("Port reconcile running on another worker, skipped")
+            return {"added": 0, "released": 0}
+        try:
+            return self._reconcile(docker_service)
+        finally:
+            lock.release()
+
+    def _reconcile(self, docker_service) -> Dict[str, int]:
+        live: Dict[int, str] = {}
+        if docker_service.is_available:
+            containers = []
+            try:
+                # Ports are allocated platform-wide, so every node's containers count
+                for node in docker_service.cluster.connected():
+                    containers.extend(node.client.containers.list(filters={"label": "managed_by=xploitrum"}))
+            except Exception as e:
+                logger.warning(f"Port reconcile skipped, cannot list containers: {e}")
+                return {"added": 0, "released": 0}
+            for container in containers:
+                ports = container.attrs.get("NetworkSettings", {}).get("Ports", {})
+                for port in ports_from_mapping(ports):
+                    if self._in_range(port):
+                        live[port] = container.id
+
+        db = SessionLocal()
+        try:
+            active = db.query(Instance.id, Instance.container_id, Instance.container_ports).filter(
+                Instance.status.in_([InstanceStatus.STARTING, InstanceStatus.RUNNING])
+            ).all()
+            instance_by_container = {container_id: instance_id for instance_id, container_id, _ in active if container_id}
+            wanted: Dict[int, Tuple[Optional[int], Optional[str]]] = {}
+            for instance_id, container_id, container_ports in active:
+                for port in ports_from_mapping(container_ports):
+                    if self._in_range(port):
+                        wanted[port] = (instance_id, container_id)
+            for port, container_id in live.items():
+                wanted.setdefault(port, (instance_by_container.get(container_id), container_id))
+
+            existing = {row.port: row for row in db.query(PortReservation).all()}
+            # Reservations for STARTING instances are kept even before their ports are recorded,
+            # and recent ones may be a deploy or warm container still starting on another worker
+            active_ids = {instance_id for instance_id, _, _ in active}
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.PORT_RECONCILE_GRACE_SECONDS)
+            recent = {port for (port,) in db.query(PortReservation.port).filter(PortReservation.reserved_at >= cutoff)}
+            stale = [
+                port for port, row in existing.items()
+                if port not in wanted and row.instance_id not in active_ids and port not in recent
+            ]
+            missing = [port for port in wanted if port not in existing]
+            if stale:
+                db.query(PortReservation).filter(PortReservation.port.in_(stale)).delete(synchronize_session=False)
+            for port in missing:
+                instance_id, container_id = wanted[port]
+                db.add(PortReservation(port=port, instance_id=instance_id, container_id=container_id))
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self._load()
+        if stale or missing:
+            logger.info(f"Port reservations reconciled: {len(missing)} added, {len(stale)} released")
+        return {"added": len(missing), "released": len(stale)}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            used = sum(self._used)
+            return {"range": f"{self.low}-{self.high}", "reserved": used, "free": len(self._used) - used}
+
+
+# Create port allocator instance
+port_allocator = PortAllocator()
@@ -0,0 +1,170 @@
+"""
+XploitRUM CTF Platform - Runtime Settings Service
+
+Admin toggles that change at runtime (registration open/closed) live in one
+JSON file shared by every worker. Readers get an in-memory copy; the file is
+only re-parsed when its mtime, size or inode changed, and that check itself
+runs at most every RUNTIME_SETTINGS_CHECK_SECONDS, so hot endpoints such as
+/stats/registration-status never touch the disk. A worker writing a change
+updates its own copy at once; the others pick it up on their next check.
+
+Writes hold an exclusive lock file while they read, modify and replace the
+file. The new content goes to a temp file in the same directory and is
+renamed over the old one, so readers never see a half-written file.
+
+New toggles only need an entry in DEFAULTS.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from loguru import logger
+
+from app.core.config import settings
+from app.core.exceptions import ValidationError
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, a single process is assumed
+    fcntl = None
+
+# Runtime toggles and their values when the file does not set them
+DEFAULTS: Dict[str, Any] = {
+    "registration_enabled": True,
+}
+
+# backend/settings.json
+DEFAULT_PATH = Path(__file__).resolve().parent.parent.parent / "settings.json"
+
+
+class RuntimeSettingsService:
+    """Cached, file-backed store for runtime toggles"""
+
+    def __init__(self, path: Optional[str] = settings.RUNTIME_SETTINGS_FILE,
+                 check_seconds: float = settings.RUNTIME_SETTINGS_CHECK_SECONDS):
+        self.path = Path(path) if path else DEFAULT_PATH
+        self.check_seconds = max(0.0, check_seconds)
+        self._lock = threading.Lock()
+        self._values: Dict[str, Any] = dict(DEFAULTS)
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._checked_at = float("-inf")
+
+    # Reading
+
+    def get(self, name: str) -> Any:
+        if name not in DEFAULTS:
+            raise KeyError(name)
+        return self._current()[name]
+
+    def get_all(self) -> Dict[str, Any]:
+        return dict(self._current())
+
+    def _current(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_seconds:
+                return self._values
+            self._checked_at = now
+            signature = self._stat()
+            if signature != self._signature:
+                self._values = self._load()
+                self._signature = signature
+            return self._values
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read_file(self) -> Dict[str, Any]:
+        """Raw file content; {} if it is missing"""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if not isinstance(data, dict):
+            raise ValueError("settings file must hold a JSON object")
+        return data
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            data = self._read_file()
+        except (ValueError, OSError) as e:
+            # Keep serving the last good values rather than flipping toggles back to defaults
+            logger.warning(f"Ignoring unreadable runtime settings file {self.path}: {e}")
+            return self._values
+        return {name: data.get(name, default) for name, default in DEFAULTS.items()}
+
+    # Writing
+
+    def update(self, **values: Any) -> Dict[str, Any]:
+        """Change one or more toggles and persist them; returns all current values"""
+        for name, value in values.items():
+            if name not in DEFAULTS:
+                raise ValidationError(f"Unknown runtime setting: {name}")
+            if not isinstance(value, type(DEFAULTS[name])):
+                raise ValidationError(f"Invalid value for runtime setting {name}")
+
+        with self._file_lock():
+            try:
+                data = self._read_file()
+            except (ValueError, OSError):
+                data = {}
+            # Unknown keys in the file are kept as they are
+            data.update(values)
+            self._write_atomic(data)
+            signature = self._stat()
+
+        with self._lock:
+            self._values = {name: data.get(name, default) for name, default in DEFAULTS.items()}
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            return dict(self._values)
+
+    def _write_atomic(self, data: Dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates the file private to the owner
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize writers across workers so concurrent updates do not drop each other's keys"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def invalidate(self) -> None:
+        """Force a re-check of the file on the next read"""
+        with self._lock:
+            self._checked_at = float("-inf")
+
+
+# Create runtime settings service instance
+runtime_settings = RuntimeSettingsService()
@@ -0,0 +1,461 @@
+"""
+XploitRUM CTF Platform - Scoreboard Index Service
+
+Keeps an in-memory ranked index of every user that appears on the public
+leaderboards (active, non-admin). Rank lookups, top-N pages and "users around
+me" queries are answered from the index without touching the database; it is
+only read to build the index at startup and to keep it in sync.
+
+Every worker keeps its own index. Changes made on a worker are applied to its
+copy at once; a background task picks up changes made by the others every
+SCOREBOARD_SYNC_SECONDS by re-reading the users created or updated since its
+last sync. Deleted users show up as a row count mismatch and trigger a full
+rebuild, as does SCOREBOARD_REBUILD_SECONDS passing.
+
+Rank is never stored on write: it is derived at read time, from the index
+when it is built and otherwise with a RANK() OVER window query.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Dict, Any, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.user import User, UserStatus, UserRole
+
+
+# Sort key: score desc, solves desc, then earliest account wins the tie
+ScoreKey = Tuple[int, int, float, int]
+
+
+class _Node:
+    __slots__ = ("key", "priority", "left", "right", "size")
+
+    def __init__(self, key: ScoreKey):
+        self.key = key
+        self.priority = random.random()
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+        self.size = 1
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node else 0
+
+
+def _update(node: _Node) -> None:
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+class _OrderStatisticTree:
+    """Treap augmented with subtree sizes: O(log n) insert, delete, rank and select."""
+
+    def __init__(self):
+        self.root: Optional[_Node] = None
+
+    def __len__(self) -> int:
+        return _size(self.root)
+
+    def _split(self, node: Optional[_Node], key: ScoreKey) -> Tuple[Optional[_Node], Optional[_Node]]:
+        """Split into (< key, >= key)"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            left, right = self._split(node.right, key)
+            node.right = left
+            _update(node)
+            return node, right
+        left, right = self._split(node.left, key)
+        node.left = right
+        _update(node)
+        return left, node
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            _update(left)
+            return left
+        right.left = self._merge(left, right.left)
+        _update(right)
+        return right
+
+    def insert(self, key: ScoreKey) -> None:
+        left, right = self._split(self.root, key)
+        self.root = self._merge(self._merge(left, _Node(key)), right)
+
+    def delete(self, key: ScoreKey) -> None:
+        self.root = self._delete(self.root, key)
+
+    def _delete(self, node: Optional[_Node], key: ScoreKey) -> Optional[_Node]:
+        if node is None:
+            return None
+        if key == node.key:
+            return self._merge(node.left, node.right)
+        if key < node.key:
+            node.left = self._delete(node.left, key)
+        else:
+            node.right = self._delete(node.right, key)
+        _update(node)
+        return node
+
+    def rank(self, key: ScoreKey) -> int:
+        """Number of keys strictly smaller than key (0-based position)"""
+        node, count = self.root, 0
+        while node is not None:
+            if key <= node.key:
+                node = node.left
+            else:
+                count += _size(node.left) + 1
+                node = node.right
+        return count
+
+    def count_through(self, key: ScoreKey) -> int:
+        """Number of keys smaller than or equal to key (0-based position right after it)"""
+        node, count = self.root, 0
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            else:
+                count += _size(node.left) + 1
+                node = node.right
+        return count
+
+    def select(self, index: int) -> Optional[ScoreKey]:
+        """Key at 0-based position index"""
+        node = self.root
+        while node is not None:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.key
+            else:
+                index -= left_size + 1
+                node = node.right
+        return None
+
+
+@dataclass
+class _Entry:
+    user_id: int
+    key: ScoreKey
+    username: str
+    full_name: Optional[str]
+    score: int
+    total_solves: int
+    university: Optional[str]
+    country: Optional[str]
+    avatar_url: Optional[str]
+
+
+class ScoreboardService:
+    """Ranked scoreboard index updated incrementally when points are awarded.
+
+    Each worker process keeps its own copy, built from the database at startup
+    and synced with the users table in the background.
+    """
+
+    # updated_at is the writing transaction's start time on PostgreSQL, so a row can
+    # commit with a timestamp older than the last sync; changes are re-read this far back
+    SYNC_OVERLAP_SECONDS = 60
+
+    def __init__(self, sync_seconds: float = settings.SCOREBOARD_SYNC_SECONDS,
+                 rebuild_seconds: float = settings.SCOREBOARD_REBUILD_SECONDS):
+        self.sync_seconds = max(0.0, sync_seconds)
+        self.rebuild_seconds = max(self.sync_seconds, rebuild_seconds)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._tree = _OrderStatisticTree()
+        self._entries: Dict[int, _Entry] = {}
+        self._user_ids: Set[int] = set()  # Every user (ranked or not) as of the last sync
+        self._watermark: Optional[datetime] = None  # Newest created_at/updated_at seen
+        self._positive_count = 0
+        self._positive_score_total = 0
+        self._built = False
+        self._rebuilt_at = float("-inf")
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _is_ranked(user: User) -> bool:
+        return user.status == UserStatus.ACTIVE and user.role != UserRole.ADMIN
+
+    @staticmethod
+    def _make_key(score: int, total_solves: int, tiebreak: float, user_id: int) -> ScoreKey:
+        return (-score, -total_solves, tiebreak, user_id)
+
+    @staticmethod
+    def _newest(users: Iterable[User], watermark: Optional[datetime]) -> Optional[datetime]:
+        for user in users:
+            for value in (user.created_at, user.updated_at):
+                if value is not None and (watermark is None or value > watermark):
+                    watermark = value
+        return watermark
+
+    def rebuild(self, db: Session) -> int:
+        """Rebuild the index from the users table. Returns the number of ranked users."""
+        started = time.monotonic()
+        users = db.query(User).all()
+
+        with self._lock:
+            self._tree = _OrderStatisticTree()
+            self._entries = {}
+            self._user_ids = {user.id for user in users}
+            self._positive_count = 0
+            self._positive_score_total = 0
+            for user in users:
+                if self._is_ranked(user):
+                    self._insert(user, tiebreak=None)
+            self._watermark = self._newest(users, None)
+            self._built = True
+            self._rebuilt_at = started
+            ranked = len(self._entries)
+
+        logger.info(f"Scoreboard index built with {ranked} users")
+        return ranked
+
+    def sync(self, db: Session) -> int:
+        """Apply users created or changed since the last sync (by any worker). Returns how many were re-read."""
+        since = self._watermark - timedelta(seconds=self.SYNC_OVERLAP_SECONDS) if self._watermark else None
+        total = db.query(func.count(User.id)).scalar()
+        query = db.query(User)
+        if since is not None:
+            query = query.filter(or_(User.created_at >= since, User.updated_at >= since))
+        changed = query.all()
+
+        with self._lock:
+            for user in changed:
+                self._user_ids.add(user.id)
+                self._apply(user)
+            self._watermark = self._newest(changed, self._watermark)
+            deleted = len(self._user_ids) != total
+        if deleted:
+            self.rebuild(db)
+        return len(changed)
+
+    def refresh(self) -> None:
+        """Build the index if it is missing or due a rebuild, else sync it. Called by the
+        background task; an overlapping call returns at once instead of waiting."""
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            db = SessionLocal()
+            try:
+                if not self._built or time.monotonic() - self._rebuilt_at >= self.rebuild_seconds:
+                    self.rebuild(db)
+                else:
+                    self.sync(db)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Scoreboard index sync failed: {e}")
+        finally:
+            self._sync_lock.release()
+
+    def start(self) -> None:
+        """Start syncing the index in the background on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="scoreboard-sync")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.sync_seconds, 0.5))
+            await asyncio.to_thread(self.refresh)
+
+    def _insert(self, user: User, tiebreak: Optional[float]) -> None:
+        if tiebreak is None:
+            tiebreak = user.created_at.timestamp() if user.created_at else 0.0
+        score = user.score or 0
+        total_solves = user.total_solves or 0
+        entry = _Entry(
+            user_id=user.id,
+            key=self._make_key(score, total_solves, tiebreak, user.id),
+            username=user.username,
+            full_name=user.full_name,
+            score=score,
+            total_solves=total_solves,
+            university=user.university,
+            country=user.country,
+            avatar_url=user.avatar_url,
+        )
+        self._entries[user.id] = entry
+        self._tree.insert(entry.key)
+        if score > 0:
+            self._positive_count += 1
+            self._positive_score_total += score
+
+    def _remove(self, user_id: int) -> Optional[_Entry]:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return None
+        self._tree.delete(entry.key)
+        if entry.score > 0:
+            self._positive_count -= 1
+            self._positive_score_total -= entry.score
+        return entry
+
+    def _apply(self, user: User) -> None:
+        previous = self._remove(user.id)
+        if self._is_ranked(user):
+            self._insert(user, tiebreak=previous.key[2] if previous else None)
+
+    def upsert(self, user: User) -> None:
+        """Insert or move a user after their score, solves, status or role changed"""
+        if not self._built or user is None or user.id is None:
+            return
+        with self._lock:
+            self._user_ids.add(user.id)
+            self._apply(user)
+
+    def remove(self, user_id: int) -> None:
+        """Drop a user from the index (deleted account)"""
+        if not self._built:
+            return
+        with self._lock:
+            self._user_ids.discard(user_id)
+            self._remove(user_id)
+
+    def _entry_at(self, position: int) -> Optional[_Entry]:
+        key = self._tree.select(position)
+        return self._entries.get(key[3]) if key else None
+
+    @staticmethod
+    def _serialize(entry: _Entry, rank: int) -> Dict[str, Any]:
+        return {
+            "rank": rank,
+            "user_id": entry.user_id,
+            "username": entry.username,
+            "full_name": entry.full_name,
+            "score": entry.score,
+            "total_solves": entry.total_solves,
+            "university": entry.university,
+            "country": entry.country,
+            "avatar_url": entry.avatar_url,
+        }
+
+    def get_top(self, db: Optional[Session] = None, limit: int = 100, offset: int = 0, min_score: int = 0) -> List[Dict[str, Any]]:
+        """Leaderboard page ordered by rank, optionally hiding users below min_score"""
+        result = []
+        with self._lock:
+            end = min(offset + limit, len(self._tree))
+            for position in range(offset, end):
+                entry = self._entry_at(position)
+                if entry is None or entry.score < min_score:
+                    break
+                result.append(self._serialize(entry, position + 1))
+        return result
+
+    def get_page(self, db: Optional[Session] = None, limit: int = 100, after: Optional[ScoreKey] = None,
+                 offset: int = 0) -> Tuple[List[Dict[str, Any]], Optional[ScoreKey]]:
+        """Leaderboard page starting right after the `after` key (or at offset), plus the key
+        to continue from. Keys are stable, so moving users do not shift later pages."""
+        with self._lock:
+            start = self._tree.count_through(tuple(after)) if after is not None else offset
+            end = min(start + limit, len(self._tree))
+            result = []
+            for position in range(start, end):
+                entry = self._entry_at(position)
+                if entry is None:
+                    break
+                result.append(self._serialize(entry, position + 1))
+            next_key = self._tree.select(end - 1) if result and end < len(self._tree) else None
+        return result, next_key
+
+    def get_rank(self, db: Optional[Session], user_id: int) -> Optional[int]:
+        """1-based rank of a user, or None if they are not on the scoreboard. Until the index
+        is built, ranks come from the database when a session is given."""
+        if not self._built:
+            return self.get_ranks(db, [user_id]).get(user_id) if db is not None else None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return self._tree.rank(entry.key) + 1
+
+    def get_ranks(self, db: Optional[Session], user_ids: List[int]) -> Dict[int, int]:
+        """Ranks for several users at once; users not on the scoreboard are omitted"""
+        if not user_ids:
+            return {}
+        if self._built:
+            with self._lock:
+                return {
+                    user_id: self._tree.rank(self._entries[user_id].key) + 1
+                    for user_id in user_ids
+                    if user_id in self._entries
+                }
+        if db is None:
+            return {}
+        return self._compute_ranks(db, user_ids)
+
+    @staticmethod
+    def _compute_ranks(db: Session, user_ids: List[int]) -> Dict[int, int]:
+        """Derive ranks in the database with a window function (same ordering as the index)"""
+        ranked = select(
+            User.id.label("user_id"),
+            func.rank().over(
+                order_by=(
+                    User.score.desc(),
+                    User.total_solves.desc(),
+                    User.created_at.asc(),
+                    User.id.asc()
+                )
+            ).label("rank")
+        ).where(
+            User.status == UserStatus.ACTIVE,
+            User.role != UserRole.ADMIN
+        ).subquery()
+
+        rows = db.execute(
+            select(ranked.c.user_id, ranked.c.rank).where(ranked.c.user_id.in_(user_ids))
+        ).all()
+        return {user_id: rank for user_id, rank in rows}
+
+    def get_around(self, db: Optional[Session], user_id: int, radius: int = 5) -> List[Dict[str, Any]]:
+        """The user plus up to `radius` neighbours above and below"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return []
+            position = self._tree.rank(entry.key)
+            start = max(0, position - radius)
+            end = min(len(self._tree), position + radius + 1)
+            result = []
+            for pos in range(start, end):
+                neighbour = self._entry_at(pos)
+                if neighbour is not None:
+                    result.append(self._serialize(neighbour, pos + 1))
+            return result
+
+    def get_summary(self, db: Optional[Session] = None) -> Dict[str, Any]:
+        """Ranked user count and average score of users with points"""
+        with self._lock:
+            average = self._positive_score_total / self._positive_count if self._positive_count else 0
+            return {
+                "ranked_users": len(self._tree),
+                "scoring_users": self._positive_count,
+                "average_score": round(average, 2),
+            }
+
+
+# Create scoreboard service instance
+scoreboard_service = ScoreboardService()
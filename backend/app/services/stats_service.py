@@ -0,0 +1,306 @@
+"""
+XploitRUM CTF Platform - Public Statistics Service
+
+Every /stats/* endpoint serves from one snapshot. The platform and event
+counters come from a single round trip: table-wide totals are read from the
+event-driven platform counters, the rest are single-row aggregates using
+conditional counts (COUNT(*) FILTER (WHERE ...)), all cross-joined into one
+SELECT. The challenge breakdown, the five most solved challenges and the
+in-memory leaderboard summary complete the snapshot.
+
+The snapshot is fresh for STATS_CACHE_TTL_SECONDS. For another
+STATS_CACHE_STALE_SECONDS it is still served while one background refresh
+runs (stale-while-revalidate), so a traffic spike costs at most one refresh.
+With STATS_CACHE_SHARED the snapshot is also kept in Redis, so workers share
+it and only one of them recomputes; without Redis every worker keeps its own.
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import func, select, true
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.challenge import Challenge, ChallengeStatus
+from app.models.event import Event, EventRegistration
+from app.models.submission import Submission, SubmissionStatus
+from app.models.user import User
+from app.services.counter_service import platform_counters, Metric
+from app.services.scoreboard_service import scoreboard_service
+
+try:
+    import redis
+except ImportError:  # Shared cache is optional
+    redis = None
+
+
+class StatsService:
+    """Cached snapshot of the public platform statistics"""
+
+    SNAPSHOT_KEY = "xploitrum:stats:snapshot"
+    REFRESH_LOCK_KEY = "xploitrum:stats:refresh"
+    # Seconds before retrying Redis after a failure
+    REDIS_RETRY_SECONDS = 30
+
+    def __init__(self, ttl_seconds: float = settings.STATS_CACHE_TTL_SECONDS,
+                 stale_seconds: float = settings.STATS_CACHE_STALE_SECONDS,
+                 shared: bool = settings.STATS_CACHE_SHARED):
+        self.ttl = max(0.0, ttl_seconds)
+        self.stale = max(0.0, stale_seconds)
+        self.shared = shared and redis is not None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self._refreshes = 0
+        self._background_refreshes = 0
+
+    # Snapshot computation
+
+    def compute(self) -> Dict[str, Any]:
+        """Build a new snapshot from the database"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            counters = self._count_all(db, now)
+            by_category: Dict[str, int] = {}
+            by_difficulty: Dict[str, int] = {}
+            for category, difficulty, count in db.execute(
+                select(Challenge.category, Challenge.difficulty, func.count())
+                .where(Challenge.status == ChallengeStatus.ACTIVE)
+                .group_by(Challenge.category, Challenge.difficulty)
+            ):
+                by_category[category.value] = by_category.get(category.value, 0) + count
+                by_difficulty[difficulty.value] = by_difficulty.get(difficulty.value, 0) + count
+            popular = db.execute(
+                select(Challenge.title, Challenge.total_solves)
+                .where(Challenge.status == ChallengeStatus.ACTIVE)
+                .order_by(Challenge.total_solves.desc())
+                .limit(5)
+            ).all()
+            top_users = scoreboard_service.get_top(db, limit=10, min_score=1)
+            summary = scoreboard_service.get_summary(db)
+        finally:
+            db.close()
+
+        return {
+            "computed_at": time.time(),
+            "platform": {
+                "total_challenges": counters["total_challenges"],
+                "total_members": counters["total_members"],
+                "total_events": counters["upcoming_events"],
+                "total_flags": counters["total_flags"],
+                "active_instances": counters["active_instances"],
+                "recent_solves": counters["recent_solves"],
+                "users_online": counters["users_online"],
+                "last_updated": now.isoformat(),
+            },
+            "challenges": {
+                "by_category": by_category,
+                "by_difficulty": by_difficulty,
+                "popular_challenges": [{"title": title, "solves": solves} for title, solves in popular],
+            },
+            "events": {
+                "upcoming_events": counters["upcoming_events"],
+                "past_events": counters["past_events"],
+                "total_registrations": counters["total_registrations"],
+            },
+            "leaderboard": {
+                "top_users": [
+                    {"username": entry["username"], "score": entry["score"], "solves": entry["total_solves"]}
+                    for entry in top_users
+                ],
+                "average_score": summary["average_score"],
+            },
+        }
+
+    @staticmethod
+    def _count_all(db, now: datetime) -> Dict[str, int]:
+        """All public counters in one SELECT of cross-joined single-row aggregates.
+        Totals come from platform counters; only small tables and time windows are counted."""
+        aggregates = [
+            select(
+                platform_counters.value_of(Metric.USERS_ACTIVE).label("total_members"),
+                platform_counters.value_of(Metric.FLAGS_CAPTURED).label("total_flags"),
+                platform_counters.value_of(Metric.INSTANCES_RUNNING).label("active_instances"),
+            ).subquery(),
+            select(func.count().label("total_challenges"))
+            .where(Challenge.status == ChallengeStatus.ACTIVE).subquery(),
+            select(func.count().label("users_online"))
+            .where(User.last_login >= now - timedelta(minutes=30)).subquery(),
+            select(
+                func.count().filter(Event.start_date >= now).label("upcoming_events"),
+                func.count().filter(Event.start_date < now).label("past_events"),
+            ).subquery(),
+            select(func.count().label("recent_solves")).where(
+                Submission.status == SubmissionStatus.CORRECT,
+                Submission.submitted_at >= now - timedelta(days=1)
+            ).subquery(),
+            select(func.count().label("total_registrations")).select_from(EventRegistration).subquery(),
+        ]
+        joined = aggregates[0]
+        for aggregate in aggregates[1:]:
+            joined = joined.join(aggregate, true())
+        row = db.execute(select(joined)).mappings().one()
+        return {name: int(value or 0) for name, value in row.items()}
+
+    # Cache
+
+    def get_section(self, name: str) -> Dict[str, Any]:
+        """One section of the current snapshot: platform, challenges, events or leaderboard"""
+        return self.get_snapshot()[name]
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        snapshot, age = self._local()
+        if snapshot is None or age >= self.ttl:
+            shared = self._read_shared()
+            if shared is not None and (snapshot is None or shared["computed_at"] > snapshot["computed_at"]):
+                self._store_local(shared)
+                snapshot, age = shared, time.time() - shared["computed_at"]
+        if snapshot is not None:
+            if age < self.ttl:
+                return snapshot
+            if age < self.ttl + self.stale:
+                self._refresh_in_background()
+                return snapshot
+        return self.refresh()
+
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """Recompute the snapshot (single flight per worker, and across workers with Redis)"""
+        with self._refresh_lock:
+            snapshot, age = self._local()
+            if snapshot is not None and age < self.ttl and not force:
+                # Another thread refreshed while we waited
+                return snapshot
+            owns_lock = self._acquire_shared_lock()
+            if not owns_lock and snapshot is not None and not force:
+                # Another worker is recomputing; keep serving what we have
+                return snapshot
+            try:
+                snapshot = self.compute()
+                self._store_local(snapshot)
+                self._write_shared(snapshot)
+                with self._lock:
+                    self._refreshes += 1
+            finally:
+                if owns_lock:
+                    self._release_shared_lock()
+        return snapshot
+
+    def _refresh_in_background(self) -> None:
+        if self._refresh_lock.locked():
+            return
+        with self._lock:
+            self._background_refreshes += 1
+        threading.Thread(target=self._background_refresh, name="stats-refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Stats snapshot refresh failed: {e}")
+
+    def _local(self) -> Tuple[Optional[Dict[str, Any]], float]:
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            return None, float("inf")
+        return snapshot, time.time() - snapshot["computed_at"]
+
+    def _store_local(self, snapshot: Dict[str, Any]) -> None:
+        with self._lock:
+            self._snapshot = snapshot
+
+    def invalidate(self) -> None:
+        """Drop the local snapshot; the next request recomputes or picks up a newer shared one"""
+        with self._lock:
+            self._snapshot = None
+
+    # Shared (Redis) copy
+
+    def _client(self):
+        if not self.shared or time.monotonic() < self._redis_retry_at:
+            return None
+        if self._redis is None:
+            options = {"socket_timeout": 0.5, "socket_connect_timeout": 0.5}
+            if settings.REDIS_PASSWORD:
+                options["password"] = settings.REDIS_PASSWORD
+            try:
+                self._redis = redis.from_url(settings.REDIS_URL, **options)
+            except Exception as e:
+                self._redis_failed(e)
+                return None
+        return self._redis
+
+    def _redis_failed(self, error: Exception) -> None:
+        if self._redis_retry_at == 0.0:
+            logger.warning(f"Stats cache falling back to per-worker snapshots, Redis unavailable: {error}")
+        self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_SECONDS
+
+    def _read_shared(self) -> Optional[Dict[str, Any]]:
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = client.get(self.SNAPSHOT_KEY)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        self._redis_retry_at = 0.0
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _write_shared(self, snapshot: Dict[str, Any]) -> None:
+        client = self._client()
+        if client is None:
+            return
+        try:
+            # Keep it as long as it may be served stale
+            expiry = max(1, int(self.ttl + self.stale))
+            client.set(self.SNAPSHOT_KEY, json.dumps(snapshot), ex=expiry)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def _acquire_shared_lock(self) -> bool:
+        client = self._client()
+        if client is None:
+            return True
+        try:
+            return bool(client.set(self.REFRESH_LOCK_KEY, "1", nx=True, ex=30))
+        except Exception as e:
+            self._redis_failed(e)
+            return True
+
+    def _release_shared_lock(self) -> None:
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.delete(self.REFRESH_LOCK_KEY)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        snapshot, age = self._local()
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl,
+                "stale_seconds": self.stale,
+                "shared": self.shared and self._redis_retry_at == 0.0,
+                "age_seconds": round(age, 2) if snapshot is not None else None,
+                "refreshes": self._refreshes,
+                "background_refreshes": self._background_refreshes,
+            }
+
+
+# Create stats service instance
+stats_service = StatsService()
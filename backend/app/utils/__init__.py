@@ -3,6 +3,8 @@ Utility functions for the application
 """
 
 from .slug import slugify
+from .pagination import encode_cursor, decode_cursor, paginate_keyset, split_page, set_next_cursor
+from .resources import ResourceProfile
 
-__all__ = ['slugify']
+__all__ = ['slugify', 'encode_cursor', 'decode_cursor', 'paginate_keyset', 'split_page', 'set_next_cursor', 'ResourceProfile']
 
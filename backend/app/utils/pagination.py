@@ -0,0 +1,143 @@
+"""
+Keyset (cursor) pagination helpers
+
+A cursor is an opaque, URL-safe token holding the sort key values of the
+last row of a page, always ending with the row id as a tie-breaker. The next
+page continues strictly after that row, so it costs the same however deep it
+is and rows inserted meanwhile do not shift pages.
+
+SQLite stores datetimes as text, with microseconds when written from Python
+and without when they come from CURRENT_TIMESTAMP, so datetime keys are sorted
+and compared there through one strftime() expression. A plain
+(..., created_at, id) index cannot serve that expression; every keyset index
+therefore has a SQLite twin on the same expression (sqlite_keyset_index), and
+cursor conditions add a plain bound on their first key so SQLite seeks the
+index instead of scanning it.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, Index, String, and_, func, literal, literal_column, tuple_
+
+from app.core.database import is_sqlite
+from app.core.exceptions import ValidationError
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if hasattr(value, "value") and hasattr(value, "name"):  # Enum members
+        return value.value
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Opaque cursor for the given sort key values"""
+    raw = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Sort key values of a cursor. Raises ValidationError for malformed or foreign cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValidationError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValidationError("Invalid cursor")
+    try:
+        return [_decode_value(value) for value in values]
+    except (ValueError, TypeError):
+        raise ValidationError("Invalid cursor")
+
+
+def _is_datetime(column) -> bool:
+    return isinstance(getattr(column, "type", None), DateTime)
+
+
+def _sqlite_datetime(expression):
+    # The format is inlined, not bound: SQLite only matches an index on an identical expression
+    return func.strftime(literal_column("'%Y-%m-%d %H:%M:%f'"), expression, type_=String)
+
+
+def _sort_expression(expression):
+    """SQLite keeps datetimes as text with or without microseconds; normalise them so
+    ordering and cursor comparisons agree. Other databases compare natively."""
+    if is_sqlite:
+        return _sqlite_datetime(expression)
+    return expression
+
+
+def _key(column):
+    return _sort_expression(column) if _is_datetime(column) else column
+
+
+def sqlite_keyset_index(name: str, *columns) -> Index:
+    """Index on the keys SQLite sorts `columns` by, for a model's __table_args__ next to
+    the plain index; created on SQLite only"""
+    keys = [_sqlite_datetime(column) if _is_datetime(column) else column for column in columns]
+    return Index(name, *keys).ddl_if(dialect="sqlite")
+
+
+def after_cursor(columns: Sequence[Any], values: Sequence[Any], descending: bool = True):
+    """WHERE clause selecting the rows that come after `values` in (columns...) order"""
+    keys = [_key(column) for column in columns]
+    bounds = [
+        _sort_expression(literal(value, column.type)) if _is_datetime(column) else literal(value, column.type)
+        for column, value in zip(columns, values)
+    ]
+    left, right = tuple_(*keys), tuple_(*bounds)
+    condition = left < right if descending else left > right
+    if is_sqlite:
+        # Redundant, but SQLite only seeks an index for a row-value comparison with a bound on its first key
+        first = keys[0] <= bounds[0] if descending else keys[0] >= bounds[0]
+        condition = and_(first, condition)
+    return condition
+
+
+def order_by_keys(columns: Sequence[Any], descending: bool = True) -> List[Any]:
+    return [_key(column).desc() if descending else _key(column).asc() for column in columns]
+
+
+def paginate_keyset(query, columns: Sequence[Any], limit: int, cursor: Optional[str] = None,
+                    descending: bool = True, offset: int = 0):
+    """Apply cursor filter, ordering and limit (+1 to detect a next page) to a select/query.
+    `offset` is only honoured without a cursor, for clients that still page by offset."""
+    if cursor:
+        query = query.where(after_cursor(columns, decode_cursor(cursor, len(columns)), descending))
+    elif offset:
+        query = query.offset(offset)
+    return query.order_by(*order_by_keys(columns, descending)).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int, key: Callable[[Any], Sequence[Any]]) -> Tuple[List[Any], Optional[str]]:
+    """(rows of this page, next_cursor) from a result fetched with limit + 1"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def set_next_cursor(response, cursor: Optional[str]) -> None:
+    """Expose next_cursor on list endpoints whose body stays a plain JSON array"""
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
@@ -0,0 +1,52 @@
+"""
+Per-challenge container resource profiles
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    """CPU (millicores), memory (MB) and process limits of one challenge container"""
+    cpu_millicores: int
+    memory_mb: int
+    pids: int
+
+    @classmethod
+    def default(cls) -> "ResourceProfile":
+        return cls(
+            cpu_millicores=settings.CHALLENGE_DEFAULT_CPU_MILLICORES,
+            memory_mb=settings.CHALLENGE_DEFAULT_MEMORY_MB,
+            pids=settings.CHALLENGE_DEFAULT_PIDS_LIMIT,
+        )
+
+    @classmethod
+    def for_challenge(cls, challenge) -> "ResourceProfile":
+        """The challenge's own limits, with platform defaults for the ones it does not set"""
+        default = cls.default()
+        return cls(
+            cpu_millicores=challenge.cpu_millicores or default.cpu_millicores,
+            memory_mb=challenge.memory_limit_mb or default.memory_mb,
+            pids=challenge.pids_limit or default.pids,
+        )
+
+    @classmethod
+    def for_instance(cls, instance, challenge) -> "ResourceProfile":
+        """What was reserved for an instance at admission (the challenge may have changed since)"""
+        profile = cls.for_challenge(challenge)
+        return cls(
+            cpu_millicores=instance.reserved_cpu_millicores or profile.cpu_millicores,
+            memory_mb=instance.reserved_memory_mb or profile.memory_mb,
+            pids=profile.pids,
+        )
+
+    def docker_limits(self) -> Dict[str, Any]:
+        """Keyword arguments for containers.run()"""
+        return {
+            "nano_cpus": self.cpu_millicores * 1_000_000,
+            "mem_limit": f"{self.memory_mb}m",
+            "pids_limit": self.pids,
+        }
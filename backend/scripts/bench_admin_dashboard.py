@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Benchmark the admin dashboard aggregates: the per-metric COUNT queries with
+lazy-loaded recent activity it used to run ("before") against
+AdminService._compute_dashboard_stats ("after").
+
+Seeds a throwaway SQLite database, then reports SQL statements per call and
+median / p95 wall time over --runs calls (the per-worker cache is bypassed).
+
+Run from backend directory:
+  python scripts/bench_admin_dashboard.py
+  python scripts/bench_admin_dashboard.py --users 5000 --submissions 200000 --runs 30
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Add parent so app is importable; settings are read on first import, so point them at a scratch database first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp(prefix="xploitrum-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/bench.db"
+os.environ["RUNTIME_SETTINGS_FILE"] = os.path.join(_tmp, "settings.json")
+
+from sqlalchemy import desc, event, func, insert  # noqa: E402
+
+from app.core.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import user, session, challenge, instance, port_reservation, warm_pool_owner, submission, log, event as event_model, platform_stats, member_request, pico_challenge  # noqa: E402,F401
+from app.models.challenge import Challenge, ChallengeCategory, ChallengeDifficulty, ChallengeStatus  # noqa: E402
+from app.models.instance import Instance, InstanceStatus  # noqa: E402
+from app.models.submission import Submission, SubmissionStatus  # noqa: E402
+from app.models.user import User, UserRole, UserStatus  # noqa: E402
+from app.services.admin_service import admin_service  # noqa: E402
+from app.services.scoreboard_service import scoreboard_service  # noqa: E402
+
+
+def seed(users: int, challenges: int, submissions: int, instances: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    statuses = [UserStatus.ACTIVE] * 8 + [UserStatus.INACTIVE, UserStatus.BANNED]
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x",
+             "role": UserRole.ADMIN if i < 5 else UserRole.USER, "status": rng.choice(statuses),
+             "score": rng.randint(0, 5000), "created_at": now - timedelta(days=rng.randint(0, 365))}
+            for i in range(users)
+        ])
+        conn.execute(insert(Challenge.__table__), [
+            {"title": f"challenge {i}", "description": "bench", "category": rng.choice(list(ChallengeCategory)),
+             "difficulty": ChallengeDifficulty.EASY, "points": 100, "flag": "x", "author": "bench",
+             "status": ChallengeStatus.ACTIVE if i % 5 else ChallengeStatus.DRAFT}
+            for i in range(challenges)
+        ])
+        rows, solved = [], set()
+        for _ in range(submissions):
+            pair = (rng.randint(1, users), rng.randint(1, challenges))
+            # One correct submission per user and challenge (partial unique index)
+            correct = rng.random() < 0.2 and pair not in solved
+            if correct:
+                solved.add(pair)
+            rows.append({"user_id": pair[0], "challenge_id": pair[1], "flag": "x",
+                         "status": SubmissionStatus.CORRECT if correct else SubmissionStatus.INCORRECT,
+                         "submitted_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))})
+        conn.execute(insert(Submission.__table__), rows)
+        conn.execute(insert(Instance.__table__), [
+            {"user_id": rng.randint(1, users), "challenge_id": rng.randint(1, challenges),
+             "container_name": f"bench-{i}", "status": rng.choice(list(InstanceStatus)),
+             "started_at": now, "expires_at": now + timedelta(hours=1)}
+            for i in range(instances)
+        ])
+
+
+def dashboard_before(db):
+    """The dashboard as it was: one COUNT per figure and lazy loads in recent activity"""
+    stats = {
+        "users": {
+            "total": db.query(User).count(),
+            "active": db.query(User).filter(User.status == UserStatus.ACTIVE).count(),
+            "new_today": db.query(User).filter(func.date(User.created_at) == func.current_date()).count(),
+            "admins": db.query(User).filter(User.role == UserRole.ADMIN).count(),
+        },
+        "challenges": {
+            "total": db.query(Challenge).count(),
+            "active": db.query(Challenge).filter(Challenge.status == ChallengeStatus.ACTIVE).count(),
+            "draft": db.query(Challenge).filter(Challenge.status == ChallengeStatus.DRAFT).count(),
+            "by_category": {
+                category.value: count
+                for category, count in db.query(Challenge.category, func.count(Challenge.id)).group_by(Challenge.category)
+            },
+        },
+        "instances": {
+            "total": db.query(Instance).count(),
+            "running": db.query(Instance).filter(Instance.status == InstanceStatus.RUNNING).count(),
+            "stopped": db.query(Instance).filter(Instance.status == InstanceStatus.STOPPED).count(),
+            "expired": db.query(Instance).filter(Instance.status == InstanceStatus.EXPIRED).count(),
+        },
+        "submissions": {
+            "total": db.query(Submission).count(),
+            "correct": db.query(Submission).filter(Submission.status == SubmissionStatus.CORRECT).count(),
+            "incorrect": db.query(Submission).filter(Submission.status == SubmissionStatus.INCORRECT).count(),
+            "today": db.query(Submission).filter(func.date(Submission.submitted_at) == func.current_date()).count(),
+        },
+    }
+    top_users = db.query(User).filter(User.status == UserStatus.ACTIVE, User.score > 0).order_by(desc(User.score)).limit(10).all()
+    ranks = scoreboard_service.get_ranks(db, [u.id for u in top_users])
+    stats["top_users"] = [{"username": u.username, "score": u.score, "rank": ranks.get(u.id)} for u in top_users]
+    recent = db.query(Submission).order_by(desc(Submission.submitted_at)).limit(10).all()
+    stats["recent_activity"] = [
+        {"id": sub.id, "username": sub.user.username, "challenge_title": sub.challenge.title} for sub in recent
+    ]
+    return stats
+
+
+def measure(name: str, fn, runs: int) -> None:
+    statements = []
+    timings = []
+    counter = {"n": 0}
+
+    def count(*args):
+        counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(runs):
+            db = SessionLocal()
+            try:
+                counter["n"] = 0
+                started = time.perf_counter()
+                fn(db)
+                timings.append(time.perf_counter() - started)
+                statements.append(counter["n"])
+            finally:
+                db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<8} statements/call={statistics.median(statements):>4.0f}  "
+          f"median={statistics.median(timings) * 1000:8.2f} ms  p95={p95 * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--challenges", type=int, default=60)
+    parser.add_argument("--submissions", type=int, default=50000)
+    parser.add_argument("--instances", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.users} users, {args.challenges} challenges, {args.submissions} submissions, "
+          f"{args.instances} instances in {_tmp}")
+    seed(args.users, args.challenges, args.submissions, args.instances)
+    db = SessionLocal()
+    try:
+        scoreboard_service.rebuild(db)
+    finally:
+        db.close()
+
+    measure("before", dashboard_before, args.runs)
+    measure("after", admin_service._compute_dashboard_stats, args.runs)
+
+
+if __name__ == "__main__":
+    main()
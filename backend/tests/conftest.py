@@ -0,0 +1,78 @@
+"""
+Test configuration: every test runs against a fresh SQLite database file.
+
+Settings are read when app.core.config is first imported, so the environment
+is prepared here before anything from app is imported.
+"""
+
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="xploitrum-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["RUNTIME_SETTINGS_FILE"] = os.path.join(_tmp, "settings.json")
+os.environ.setdefault("DEBUG", "False")
+
+import pytest
+import pytest_asyncio
+
+from app.core.database import Base, SessionLocal, async_engine, engine
+from app.core.security import compute_flag_digest, encrypt_flag, hash_password
+from app.models import user, session, challenge, instance, port_reservation, warm_pool_owner, submission, log, event, platform_stats, member_request, pico_challenge  # noqa: F401
+from app.models.challenge import Challenge, ChallengeCategory, ChallengeDifficulty, ChallengeStatus
+from app.models.user import User
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """Empty tables for every test"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def async_engine_per_test():
+    """Async connections belong to one event loop; drop them before the test's loop closes"""
+    yield async_engine
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def db():
+    db_session = SessionLocal()
+    try:
+        yield db_session
+    finally:
+        db_session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    hashed = hash_password("password123")
+
+    def make(username: str, score: int = 0, **fields) -> User:
+        created_user = User(username=username, email=f"{username}@example.com", password_hash=hashed, score=score, **fields)
+        db.add(created_user)
+        db.commit()
+        db.refresh(created_user)
+        return created_user
+
+    return make
+
+
+@pytest.fixture
+def make_challenge(db):
+    def make(title: str = "challenge", points: int = 100, flag: str = "XR{flag}", **fields) -> Challenge:
+        fields.setdefault("status", ChallengeStatus.ACTIVE)
+        item = Challenge(
+            title=title, description=title, category=ChallengeCategory.WEB, difficulty=ChallengeDifficulty.EASY,
+            points=points, flag=encrypt_flag(flag), flag_digest=compute_flag_digest(flag), author="tests", **fields
+        )
+        db.add(item)
+        db.commit()
+        db.refresh(item)
+        return item
+
+    return make
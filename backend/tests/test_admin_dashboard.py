@@ -0,0 +1,44 @@
+"""
+Admin dashboard: a fixed number of grouped queries, however much data there is
+"""
+
+from sqlalchemy import event
+
+from app.models.submission import Submission, SubmissionStatus
+from app.services.admin_service import admin_service
+
+
+def _statements(db) -> int:
+    count = {"n": 0}
+
+    def on_execute(*args):
+        count["n"] += 1
+
+    # Statements of this session only (lazy loads included); the scoreboard index syncs on its own session
+    event.listen(db, "do_orm_execute", on_execute)
+    try:
+        stats = admin_service._compute_dashboard_stats(db)
+    finally:
+        event.remove(db, "do_orm_execute", on_execute)
+    return count["n"], stats
+
+
+def test_dashboard_query_count_does_not_grow_with_activity(db, make_user, make_challenge):
+    users = [make_user(f"user{i}", score=i * 10) for i in range(12)]
+    challenges = [make_challenge(title=f"challenge {i}") for i in range(3)]
+    baseline, _ = _statements(db)
+
+    for user in users:
+        for challenge in challenges:
+            db.add(Submission(user_id=user.id, challenge_id=challenge.id, flag="x", status=SubmissionStatus.INCORRECT))
+    db.add(Submission(user_id=users[0].id, challenge_id=challenges[0].id, flag="x", status=SubmissionStatus.CORRECT))
+    db.commit()
+    db.expire_all()
+
+    statements, stats = _statements(db)
+    # Recent activity is joined-loaded: no query per submission, user or challenge
+    assert statements == baseline <= 10
+    assert len(stats["recent_activity"]) == 10
+    assert stats["submissions"]["total"] == 37
+    assert stats["submissions"]["correct"] == 1
+    assert stats["users"]["new_today"] == 12
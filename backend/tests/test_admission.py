@@ -0,0 +1,142 @@
+"""
+Admission control: first-come-first-served queue, per-challenge limits, timeout and cancel
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.instance import Instance, InstanceStatus
+from app.services.admission_service import AdmissionController
+from app.services.cluster_service import DockerCluster
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    """Admission over one fake node with 2000 millicores and 2048 MB; deploys are recorded, not run"""
+    monkeypatch.setattr(settings, "HOST_MEMORY_RESERVED_MB", 0)
+    cluster = DockerCluster([("a", "fake://?cpus=2&memory=2048")])
+    deployed = []
+    orchestrator = SimpleNamespace(
+        docker_service=SimpleNamespace(cluster=cluster),
+        add_release_listener=lambda listener: None,
+        enqueue_deploy=deployed.append,
+    )
+    controller = AdmissionController(orchestrator)
+    controller.deployed = deployed
+    return controller
+
+
+@pytest.fixture
+def deploy(db, controller, make_user):
+    """Request an instance the way ctf_service does, without the immediate drain"""
+    users = iter(range(1000))
+
+    def request(challenge) -> Instance:
+        user = make_user(f"player{next(users)}")
+        now = datetime.utcnow()
+        instance = Instance(user_id=user.id, challenge_id=challenge.id, container_name=f"instance-{user.id}",
+                            started_at=now, expires_at=now + timedelta(seconds=challenge.instance_timeout))
+        with controller.serialized(db):
+            controller.try_admit(db, instance, challenge)
+            db.add(instance)
+            db.commit()
+        db.refresh(instance)
+        return instance
+
+    return request
+
+
+def _stop(db, instance: Instance) -> None:
+    instance.status = InstanceStatus.STOPPED
+    db.commit()
+
+
+def _statuses(db, *instances):
+    db.expire_all()
+    return [db.get(Instance, instance.id).status for instance in instances]
+
+
+def test_queue_is_first_come_first_served(db, controller, deploy, make_challenge):
+    small = make_challenge("small", memory_limit_mb=512, cpu_millicores=500)
+    big = make_challenge("big", memory_limit_mb=2048, cpu_millicores=1000)
+
+    running = deploy(small)
+    assert running.status == InstanceStatus.STARTING
+    waiting_big = deploy(big)
+    # Fits right now, but may not overtake the big deploy ahead of it
+    waiting_small = deploy(small)
+    assert _statuses(db, waiting_big, waiting_small) == [InstanceStatus.QUEUED, InstanceStatus.QUEUED]
+    assert controller.queue_position(db, waiting_big.id) == 1
+    assert controller.queue_position(db, waiting_small.id) == 2
+
+    # Nothing has left: the head still does not fit, and blocks everything behind it
+    assert controller.drain_queue() == []
+
+    _stop(db, running)
+    assert controller.drain_queue() == [waiting_big.id]
+    assert _statuses(db, waiting_big, waiting_small) == [InstanceStatus.STARTING, InstanceStatus.QUEUED]
+    assert controller.queue_position(db, waiting_small.id) == 1
+
+    _stop(db, db.get(Instance, waiting_big.id))
+    assert controller.drain_queue() == [waiting_small.id]
+    assert controller.deployed == [waiting_big.id, waiting_small.id]
+
+
+def test_challenge_limit_only_holds_up_its_own_challenge(db, controller, deploy, make_challenge):
+    limited = make_challenge("limited", max_instances=1, memory_limit_mb=256)
+    other = make_challenge("other", memory_limit_mb=256)
+
+    running = deploy(limited)
+    blocked = deploy(limited)
+    assert blocked.status == InstanceStatus.QUEUED
+    # Queued behind the blocked entry on arrival ...
+    behind = deploy(other)
+    assert behind.status == InstanceStatus.QUEUED
+
+    # ... but admitted past it, since only the limited challenge is full
+    assert controller.drain_queue() == [behind.id]
+    assert _statuses(db, blocked, behind) == [InstanceStatus.QUEUED, InstanceStatus.STARTING]
+
+    _stop(db, running)
+    assert controller.drain_queue() == [blocked.id]
+
+
+def test_queued_deploys_time_out(db, controller, deploy, make_challenge):
+    big = make_challenge("big", memory_limit_mb=2048)
+    running = deploy(big)
+    stale = deploy(big)
+    fresh = deploy(big)
+    db.get(Instance, stale.id).started_at = datetime.utcnow() - timedelta(seconds=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS + 1)
+    db.commit()
+
+    _stop(db, running)
+    # The stale head is dropped rather than admitted, and the next entry takes the space
+    assert controller.drain_queue() == [fresh.id]
+    db.expire_all()
+    expired = db.get(Instance, stale.id)
+    assert expired.status == InstanceStatus.EXPIRED
+    assert expired.stopped_at is not None
+    assert expired.error_message == "Timed out waiting for host capacity"
+    assert controller.get_stats(db)["timed_out"] == 1
+
+
+def test_cancel_withdraws_only_queued_instances(db, controller, deploy, make_challenge):
+    big = make_challenge("big", memory_limit_mb=2048)
+    running = deploy(big)
+    waiting = deploy(big)
+    behind = deploy(big)
+
+    assert controller.cancel(db, waiting) is True
+    assert _statuses(db, waiting) == [InstanceStatus.STOPPED]
+    assert controller.queue_position(db, waiting.id) is None
+    assert controller.queue_position(db, behind.id) == 1
+    # Already withdrawn, or admitted: nothing to cancel
+    assert controller.cancel(db, waiting) is False
+    assert controller.cancel(db, running) is False
+    assert _statuses(db, running) == [InstanceStatus.STARTING]
+
+    _stop(db, running)
+    assert controller.drain_queue() == [behind.id]
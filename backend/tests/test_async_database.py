@@ -0,0 +1,103 @@
+"""
+Async database layer: a slow database does not stall the event loop
+"""
+
+import asyncio
+import gc
+import time
+from contextlib import contextmanager
+
+import pytest
+from fastapi import Response
+from sqlalchemy import event
+
+from app.api.v1.endpoints.submissions import get_user_submissions
+from app.api.v1.endpoints.users import get_user_profile
+from app.core.database import AsyncSessionLocal, engine
+from app.core.principal_cache import Principal
+from app.models.submission import Submission, SubmissionStatus
+from app.services.scoreboard_service import scoreboard_service
+
+# Added to every statement, as a slow database server would
+QUERY_DELAY = 0.2
+CONCURRENCY = 10
+
+
+@contextmanager
+def _slow_database(async_engine):
+    """Delay statements on both engines: async ones in aiosqlite's worker thread, sync ones in
+    whichever thread runs them, so sync I/O on the event loop would show up as a stall"""
+    def slow(*args):
+        time.sleep(QUERY_DELAY)
+
+    def on_connect(dbapi_connection, connection_record):
+        # The trace callback fires in aiosqlite's thread for each statement
+        dbapi_connection.await_(dbapi_connection._connection.set_trace_callback(slow))
+
+    event.listen(async_engine.sync_engine, "connect", on_connect)
+    event.listen(engine, "before_cursor_execute", slow)
+    try:
+        yield
+    finally:
+        event.remove(async_engine.sync_engine, "connect", on_connect)
+        event.remove(engine, "before_cursor_execute", slow)
+
+
+async def _list_submissions(principal: Principal):
+    async with AsyncSessionLocal() as db:
+        result = await get_user_submissions(
+            response=Response(), limit=50, offset=0, cursor=None, current_user=principal, db=db
+        )
+        assert len(result) == 5
+
+
+async def _get_profile(principal: Principal):
+    async with AsyncSessionLocal() as db:
+        result = await get_user_profile(principal=principal, db=db)
+        assert result.username == principal.username
+
+
+async def _watch_loop(stop: asyncio.Event, lags: list, interval: float = 0.01):
+    """Record how late the loop wakes a timer; a blocked loop shows up as a long lag"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("handler", [_list_submissions, _get_profile], ids=["submissions", "profile"])
+async def test_event_loop_stays_responsive_under_slow_database(db, make_user, make_challenge,
+                                                               async_engine_per_test, handler, monkeypatch):
+    user = make_user("alice")
+    challenge = make_challenge()
+    db.add_all([
+        Submission(user_id=user.id, challenge_id=challenge.id, flag="XR{wrong}", status=SubmissionStatus.INCORRECT)
+        for _ in range(5)
+    ])
+    db.commit()
+    principal = Principal.from_user(user)
+    # Every rank read is due a scoreboard sync: none may run on the event loop
+    monkeypatch.setattr(scoreboard_service, "sync_seconds", 0)
+    await async_engine_per_test.dispose()
+
+    with _slow_database(async_engine_per_test):
+        started = time.perf_counter()
+        await handler(principal)
+        single = time.perf_counter() - started
+        assert single >= QUERY_DELAY
+
+        # Garbage left by earlier tests would otherwise be collected mid-measurement
+        gc.collect()
+        stop, lags = asyncio.Event(), []
+        watcher = asyncio.create_task(_watch_loop(stop, lags))
+        started = time.perf_counter()
+        await asyncio.gather(*[handler(principal) for _ in range(CONCURRENCY)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await watcher
+
+    # Requests wait on the database side by side rather than one after another
+    assert elapsed < single * CONCURRENCY / 2
+    # ... and the loop keeps serving timers meanwhile: no wake-up is held up by a query
+    assert lags and max(lags) < QUERY_DELAY / 2
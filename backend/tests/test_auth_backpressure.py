@@ -0,0 +1,43 @@
+"""
+Auth: a full password hashing queue surfaces as 503, not as a failed login or a 500
+"""
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app.api.v1.endpoints.auth import UserRegister, login, register
+from app.core.auth import authenticate_user
+from app.models.user import User
+from app.services.password_service import password_service
+
+
+@pytest.fixture
+def hashing_queue_full(monkeypatch):
+    monkeypatch.setattr(password_service, "max_queue", 1)
+    monkeypatch.setattr(password_service, "_queued", 1)
+
+
+def test_authenticate_user_reraises_busy(db, make_user, hashing_queue_full):
+    make_user("alice")
+    with pytest.raises(HTTPException) as busy:
+        authenticate_user(db, "alice", "password123")
+    assert busy.value.status_code == 503
+    # A busy server is not a failed attempt
+    db.expire_all()
+    assert db.query(User).filter(User.username == "alice").one().failed_login_attempts == 0
+
+
+def test_login_returns_503_when_hashing_is_busy(db, make_user, hashing_queue_full):
+    make_user("alice")
+    with pytest.raises(HTTPException) as busy:
+        login(OAuth2PasswordRequestForm(username="alice", password="password123"), db)
+    assert busy.value.status_code == 503
+
+
+def test_register_returns_503_when_hashing_is_busy(db, hashing_queue_full):
+    user_data = UserRegister(username="bob", email="bob@example.com", password="password123")
+    with pytest.raises(HTTPException) as busy:
+        register(user_data, db)
+    assert busy.value.status_code == 503
+    assert db.query(User).count() == 0
@@ -0,0 +1,90 @@
+"""
+Docker cluster: placement strategies, fit checks and node health tracking on fake:// nodes
+"""
+
+import pytest
+
+from app.core.config import settings
+from app.services.cluster_service import DockerCluster
+
+
+@pytest.fixture(autouse=True)
+def whole_nodes(monkeypatch):
+    """Node capacity is exactly what its fake:// URL says"""
+    monkeypatch.setattr(settings, "HOST_MEMORY_RESERVED_MB", 0)
+    monkeypatch.setattr(settings, "HOST_CPU_OVERCOMMIT", 1.0)
+
+
+def _cluster(**kwargs) -> DockerCluster:
+    return DockerCluster([
+        ("a", "fake://?cpus=4&memory=8192"),
+        ("b", "fake://?cpus=4&memory=8192"),
+        ("small", "fake://?cpus=1&memory=1024"),
+    ], **kwargs)
+
+
+def test_binpack_fills_the_tightest_node_that_fits(monkeypatch):
+    monkeypatch.setattr(settings, "DOCKER_PLACEMENT_STRATEGY", "binpack")
+    cluster = _cluster()
+    committed = {"a": (2000, 4096)}
+
+    assert cluster.place(committed, 500, 512) == "small"
+    assert cluster.place(committed, 1000, 2048) == "a"
+    # Does not fit what is left on a
+    assert cluster.place(committed, 1000, 6144) == "b"
+    assert cluster.place(committed, 1000, 8193) is None
+
+
+def test_spread_picks_the_node_with_most_room(monkeypatch):
+    monkeypatch.setattr(settings, "DOCKER_PLACEMENT_STRATEGY", "spread")
+    cluster = _cluster()
+
+    assert cluster.place({"a": (2000, 4096)}, 500, 512) == "b"
+    assert cluster.place({"a": (2000, 4096), "b": (3000, 6144)}, 500, 512) == "a"
+    # Equal room: ties go to the node name
+    assert cluster.place({}, 500, 512) == "a"
+
+
+def test_fits_any_checks_empty_node_capacity():
+    cluster = _cluster()
+
+    assert cluster.fits_any(4000, 8192)
+    assert not cluster.fits_any(4001, 1024)
+    assert not cluster.fits_any(1000, 8193)
+    # An unhealthy node may come back, so its size still counts
+    cluster.nodes["a"].healthy = False
+    cluster.nodes["b"].healthy = False
+    assert cluster.fits_any(4000, 8192)
+
+
+def test_node_is_unscheduled_after_failure_threshold_and_recovers(monkeypatch):
+    monkeypatch.setattr(settings, "DOCKER_PLACEMENT_STRATEGY", "spread")
+    monkeypatch.setattr(settings, "DOCKER_NODE_FAILURE_THRESHOLD", 3)
+    connected = []
+    cluster = _cluster(on_connect=lambda node: connected.append(node.name))
+    assert connected == ["a", "b", "small"]
+    node = cluster.nodes["a"]
+    node.client.set_down(True)
+
+    # A blip is tolerated: still healthy below the threshold
+    for failures in (1, 2):
+        cluster.check_all()
+        assert node.failures == failures
+        assert node.healthy
+        assert cluster.place({}, 500, 512) == "a"
+
+    cluster.check_all()
+    assert not node.healthy
+    assert "down" in node.last_error
+    assert cluster.place({}, 500, 512) == "b"
+    assert [n.name for n in cluster.schedulable()] == ["b", "small"]
+    assert cluster.total_capacity().memory_mb == 8192 + 1024
+
+    node.client.set_down(False)
+    cluster.check_all()
+    assert node.healthy
+    assert node.failures == 0
+    assert node.last_error is None
+    assert cluster.place({}, 500, 512) == "a"
+    # Recovery re-runs the node's preparation
+    assert connected == ["a", "b", "small", "a"]
@@ -0,0 +1,113 @@
+"""
+Platform counters: request transactions append deltas, the leader folds them
+"""
+
+import threading
+from types import SimpleNamespace
+
+from sqlalchemy import func, select
+
+from app.core.database import SessionLocal
+
+from app.models.platform_stats import PlatformCounter, PlatformCounterDelta
+from app.models.submission import Submission, SubmissionStatus
+from app.models.user import User
+from app.services.counter_service import Metric, TOTAL, platform_counters
+
+METRICS = [Metric.USERS, Metric.USERS_ACTIVE, Metric.SUBMISSIONS, Metric.FLAGS_CAPTURED]
+
+
+def _submit(db, user, challenge, correct: bool) -> None:
+    db.add(Submission(
+        user_id=user.id, challenge_id=challenge.id, flag="XR{x}",
+        status=SubmissionStatus.CORRECT if correct else SubmissionStatus.INCORRECT
+    ))
+    db.commit()
+
+
+def _stored(db):
+    return dict(db.execute(
+        select(PlatformCounter.metric, PlatformCounter.value).where(PlatformCounter.period == TOTAL)
+    ).all())
+
+
+def test_requests_only_append_deltas_and_reads_include_them(db, make_user, make_challenge):
+    alice, bob = make_user("alice"), make_user("bob")
+    challenge = make_challenge()
+    _submit(db, alice, challenge, correct=False)
+    _submit(db, alice, challenge, correct=True)
+    _submit(db, bob, challenge, correct=True)
+
+    # No shared counter row was written by the request transactions
+    assert _stored(db) == {}
+    expected = {"users": 2, "users_active": 2, "submissions": 3, "flags_captured": 2}
+    assert platform_counters.read(db, METRICS) == expected
+    assert db.execute(select(platform_counters.value_of(Metric.FLAGS_CAPTURED))).scalar() == 2
+
+    pending = db.query(func.count(PlatformCounterDelta.id)).scalar()
+    db.commit()
+    assert platform_counters.fold() == pending > 0
+    db.expire_all()
+    assert db.query(PlatformCounterDelta).count() == 0
+    assert _stored(db) == expected
+    assert platform_counters.read(db, METRICS) == expected
+    assert db.execute(select(platform_counters.value_of(Metric.FLAGS_CAPTURED))).scalar() == 2
+
+
+def test_rolled_back_changes_leave_no_delta(db, make_user):
+    db.add(User(username="carol", email="carol@example.com", password_hash="x"))
+    db.flush()
+    db.rollback()
+
+    assert db.query(PlatformCounterDelta).count() == 0
+    assert platform_counters.read(db, [Metric.USERS]) == {"users": 0}
+
+
+def test_reconcile_repairs_drift_and_then_is_stable(db, make_user, make_challenge):
+    alice = make_user("alice")
+    challenge = make_challenge()
+    _submit(db, alice, challenge, correct=True)
+    platform_counters.fold()
+    # Drift from a bulk update the ORM never saw, plus a delta that is still pending
+    db.query(PlatformCounter).filter(PlatformCounter.metric == Metric.SUBMISSIONS.value).update({"value": 40})
+    db.commit()
+    _submit(db, alice, challenge, correct=False)
+
+    assert platform_counters.reconcile()["corrected"] > 0
+    assert platform_counters.read(db, [Metric.SUBMISSIONS, Metric.FLAGS_CAPTURED]) == {"submissions": 2, "flags_captured": 1}
+    # Day rows are bucketed the same way by emit and by the rebuild, so nothing is "corrected" again
+    assert platform_counters.reconcile() == {"corrected": 0, "removed": 0}
+
+
+def test_reconcile_does_not_miss_a_delta_committed_mid_reconcile(db, make_user, make_challenge, monkeypatch):
+    alice = make_user("alice")
+    challenge = make_challenge()
+    _submit(db, alice, challenge, correct=False)
+    platform_counters.fold()
+    ids = SimpleNamespace(user=SimpleNamespace(id=alice.id), challenge=SimpleNamespace(id=challenge.id))
+
+    def submit_elsewhere():
+        other = SessionLocal()
+        try:
+            _submit(other, ids.user, ids.challenge, correct=False)
+        finally:
+            other.close()
+
+    writer = threading.Thread(target=submit_elsewhere)
+    compute = platform_counters.compute_from_source
+
+    def compute_then_race(session):
+        expected = compute(session)
+        writer.start()
+        # Committed by now, unless the reconcile's snapshot holds it off
+        writer.join(timeout=0.5)
+        return expected
+
+    monkeypatch.setattr(platform_counters, "compute_from_source", compute_then_race)
+    platform_counters.reconcile()
+    writer.join()
+    monkeypatch.undo()
+
+    db.expire_all()
+    assert platform_counters.read(db, [Metric.SUBMISSIONS]) == {"submissions": 2}
+    assert platform_counters.reconcile() == {"corrected": 0, "removed": 0}
@@ -0,0 +1,65 @@
+"""
+Expiry scheduler: leadership takeover and picking up new deadlines
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.instance import Instance, InstanceStatus
+from app.services.expiry_service import ExpiryScheduler
+
+
+def _scheduler() -> ExpiryScheduler:
+    return ExpiryScheduler(SimpleNamespace(add_deadline_listener=lambda listener: None))
+
+
+@pytest.mark.asyncio
+async def test_follower_retries_leadership_every_poll_interval(monkeypatch):
+    scheduler = _scheduler()
+    scheduler.poll_interval = 0.05
+    attempts = []
+    monkeypatch.setattr(scheduler._leader, "try_acquire", lambda: attempts.append(1) or False)
+
+    scheduler.start()
+    await asyncio.sleep(0.5)
+    await scheduler.stop()
+
+    # Not once per full_sync_interval (an hour by default): a dead leader is replaced quickly
+    assert scheduler.full_sync_interval >= 60
+    assert len(attempts) >= 3
+
+
+def _instance(db, challenge, status: InstanceStatus) -> Instance:
+    now = datetime.utcnow()
+    instance = Instance(challenge_id=challenge.id, container_name=f"expiry-{status.value}", status=status,
+                        started_at=now, expires_at=now + timedelta(hours=1))
+    db.add(instance)
+    db.commit()
+    return instance
+
+
+def test_poll_picks_up_a_deploy_admitted_from_the_queue(db, make_challenge):
+    challenge = make_challenge()
+    queued = _instance(db, challenge, InstanceStatus.QUEUED)
+    running = _instance(db, challenge, InstanceStatus.RUNNING)
+    scheduler = _scheduler()
+
+    assert scheduler._load() == 1
+    # The window stays just below the queued deploy
+    assert scheduler._last_seen_id == queued.id - 1
+
+    # Admitted on a worker that is not the expiry leader: no schedule() call reaches us
+    now = datetime.utcnow()
+    queued.status = InstanceStatus.STARTING
+    queued.started_at, queued.expires_at = now, now + timedelta(minutes=30)
+    db.commit()
+
+    assert scheduler._load(scheduler._last_seen_id) == 1
+    assert scheduler._deadlines[queued.id] == queued.expires_at
+    assert running.id in scheduler._deadlines
+    # Re-reading the row above the queued one did not duplicate its heap entry
+    assert len(scheduler._heap) == 2
+    assert scheduler._last_seen_id == running.id
@@ -0,0 +1,127 @@
+"""
+Flag submission: one transaction per submission, safe under concurrency
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func
+
+from app.api.v1.endpoints.submissions import SubmissionCreate, submit_flag
+from app.core.database import AsyncSessionLocal, SessionLocal
+from app.core.principal_cache import Principal
+from app.models.challenge import Challenge
+from app.models.submission import Submission, SubmissionStatus
+from app.models.user import User
+from app.services.ctf_service import ctf_service
+
+FLAG = "XR{flag}"
+
+
+def _submit_sync(user_id: int, challenge_id: int, flag: str, barrier: threading.Barrier):
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        # Hand the connection back so waiting threads don't pin the pool
+        db.commit()
+        barrier.wait()
+        return ctf_service.submit_flag(db, user, challenge_id, flag)
+    except HTTPException as e:
+        return e.detail
+    finally:
+        db.close()
+
+
+async def _submit_async(user: User, challenge_id: int, flag: str):
+    async with AsyncSessionLocal() as db:
+        try:
+            return await submit_flag(SubmissionCreate(challenge_id=challenge_id, flag=flag), Principal.from_user(user), db)
+        except HTTPException as e:
+            return e.detail
+
+
+def _counts(db, challenge_id: int, user_id: int = None):
+    query = db.query(Submission.status, func.count()).filter(Submission.challenge_id == challenge_id)
+    if user_id is not None:
+        query = query.filter(Submission.user_id == user_id)
+    return dict(query.group_by(Submission.status).all())
+
+
+def test_parallel_submissions_by_one_user_solve_once(db, make_user, make_challenge):
+    user = make_user("alice")
+    challenge = make_challenge(points=100, flag=FLAG)
+    flags = [FLAG] * 10 + ["XR{wrong}"] * 10
+    barrier = threading.Barrier(len(flags))
+
+    with ThreadPoolExecutor(max_workers=len(flags)) as pool:
+        results = list(pool.map(lambda flag: _submit_sync(user.id, challenge.id, flag, barrier), flags))
+
+    solves = [r for r in results if isinstance(r, dict) and r["correct"]]
+    assert len(solves) == 1
+    # Every other correct flag is rejected, never recorded as an attempt
+    assert results[:10].count("You have already solved this challenge") == 9
+
+    db.expire_all()
+    counts = _counts(db, challenge.id)
+    attempts = sum(counts.values())
+    assert counts[SubmissionStatus.CORRECT] == 1
+    user, challenge = db.get(User, user.id), db.get(Challenge, challenge.id)
+    assert (user.score, user.total_solves, user.total_attempts) == (100, 1, attempts)
+    assert (challenge.total_solves, challenge.total_attempts) == (1, attempts)
+    assert challenge.solve_percentage == pytest.approx(100 / attempts)
+
+
+def test_wrong_flag_after_solving_is_not_recorded(db, make_user, make_challenge):
+    user = make_user("alice")
+    challenge = make_challenge(flag=FLAG)
+    assert ctf_service.submit_flag(db, user, challenge.id, FLAG)["correct"]
+
+    with pytest.raises(HTTPException) as rejected:
+        ctf_service.submit_flag(db, user, challenge.id, "XR{wrong}")
+    assert rejected.value.detail == "You have already solved this challenge"
+
+    db.expire_all()
+    assert db.get(User, user.id).total_attempts == 1
+    assert db.get(Challenge, challenge.id).total_attempts == 1
+    assert _counts(db, challenge.id) == {SubmissionStatus.CORRECT: 1}
+
+
+@pytest.mark.asyncio
+async def test_parallel_solves_through_the_async_endpoint(db, make_user, make_challenge, async_engine_per_test):
+    users = [make_user(f"user{i}") for i in range(12)]
+    challenge = make_challenge(points=50, flag=FLAG)
+
+    results = await asyncio.gather(*(
+        _submit_async(user, challenge.id, flag)
+        for user in users for flag in (FLAG, FLAG, "XR{wrong}")
+    ))
+
+    assert sum(1 for r in results if not isinstance(r, str) and r.status == SubmissionStatus.CORRECT) == 12
+    db.expire_all()
+    counts = _counts(db, challenge.id)
+    attempts = sum(counts.values())
+    assert counts[SubmissionStatus.CORRECT] == 12
+    challenge = db.get(Challenge, challenge.id)
+    assert (challenge.total_solves, challenge.total_attempts) == (12, attempts)
+    assert challenge.solve_percentage == pytest.approx(12 * 100 / attempts)
+    for user in users:
+        db.refresh(user)
+        assert (user.score, user.total_solves) == (50, 1)
+        assert user.total_attempts == sum(_counts(db, challenge.id, user.id).values())
+
+
+@pytest.mark.asyncio
+async def test_max_solves_is_never_exceeded(db, make_user, make_challenge, async_engine_per_test):
+    users = [make_user(f"user{i}") for i in range(10)]
+    challenge = make_challenge(flag=FLAG, max_solves=4)
+
+    results = await asyncio.gather(*(_submit_async(user, challenge.id, FLAG) for user in users))
+
+    assert results.count("Challenge has reached maximum solves") == 6
+    db.expire_all()
+    challenge = db.get(Challenge, challenge.id)
+    assert challenge.total_solves == 4
+    assert _counts(db, challenge.id) == {SubmissionStatus.CORRECT: 4}
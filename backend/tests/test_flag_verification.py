@@ -0,0 +1,46 @@
+"""
+Flag storage and verification: both submit paths and the digest backfill
+"""
+
+from sqlalchemy import text
+
+from add_flag_digest_column import add_column
+from app.core.security import compute_flag_digest, decrypt_flag, encrypt_flag, verify_flag
+from app.models.challenge import Challenge
+from app.services.ctf_service import ctf_service
+
+
+def test_flag_without_digest_is_checked_by_decrypting(db, make_user, make_challenge):
+    user = make_user("alice")
+    challenge = make_challenge(flag="XR{secret}")
+    challenge.flag_digest = None
+    db.commit()
+
+    assert ctf_service.submit_flag(db, user, challenge.id, "XR{wrong}")["correct"] is False
+    assert ctf_service.submit_flag(db, user, challenge.id, " XR{secret} ")["correct"] is True
+
+
+def test_backfill_encrypts_plaintext_flags_and_adds_digests(db, make_challenge):
+    encrypted = make_challenge(title="encrypted", flag="XR{one}")
+    plaintext = make_challenge(title="plaintext", flag="XR{two}")
+    lost_key = make_challenge(title="lost key", flag="XR{three}")
+    db.execute(text("UPDATE challenges SET flag_digest = NULL"))
+    db.execute(text("UPDATE challenges SET flag = 'XR{two}' WHERE id = :id"), {"id": plaintext.id})
+    db.execute(text("UPDATE challenges SET flag = 'gAAAAABnotarealtoken' WHERE id = :id"), {"id": lost_key.id})
+    db.commit()
+
+    add_column()
+
+    db.expire_all()
+    for item, flag in ((encrypted, "XR{one}"), (plaintext, "XR{two}")):
+        row = db.get(Challenge, item.id)
+        assert row.flag_digest == compute_flag_digest(flag)
+        assert decrypt_flag(row.flag) == flag
+        assert verify_flag(flag, row.flag, row.flag_digest)
+    assert db.get(Challenge, lost_key.id).flag_digest is None
+
+
+def test_digest_ignores_surrounding_whitespace():
+    stored = encrypt_flag("XR{flag}")
+    assert verify_flag("  XR{flag}\n", stored, compute_flag_digest("XR{flag}"))
+    assert verify_flag("  XR{flag}\n", stored)
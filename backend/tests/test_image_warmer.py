@@ -0,0 +1,80 @@
+"""
+Image warmer garbage collection on fake:// nodes
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.challenge import Challenge, ChallengeImageStatus, ChallengeStatus
+from app.services.cluster_service import DockerCluster
+from app.services.image_warmer_service import ImageWarmer
+
+
+@pytest.fixture
+def cluster():
+    return DockerCluster([("a", "fake://"), ("b", "fake://")])
+
+
+@pytest.fixture
+def warmer(cluster, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_GC_ENABLED", True)
+    return ImageWarmer(SimpleNamespace(docker_service=SimpleNamespace(cluster=cluster)))
+
+
+@pytest.fixture
+def pulled(db, cluster, make_challenge):
+    """A challenge whose image the warmer pulled onto every node, last changed `age` ago"""
+    def make(title: str, image: str, status: ChallengeStatus, age: timedelta) -> Challenge:
+        for node in cluster.nodes.values():
+            node.client.images.pull(image)
+        return make_challenge(title, docker_image=image, status=status, image_status=ChallengeImageStatus.READY,
+                              updated_at=datetime.utcnow() - age)
+
+    return make
+
+
+def _on_nodes(cluster, image: str):
+    return {name for name, node in cluster.nodes.items() if node.client.images.list(image.split(":")[0])}
+
+
+def test_images_of_long_inactive_challenges_are_removed(db, cluster, warmer, pulled):
+    grace = timedelta(hours=settings.IMAGE_GC_GRACE_HOURS)
+    retired = pulled("retired", "retired:1", ChallengeStatus.INACTIVE, grace + timedelta(hours=1))
+    recent = pulled("recent", "recent:1", ChallengeStatus.INACTIVE, grace - timedelta(hours=1))
+
+    warmer.resync()
+
+    assert _on_nodes(cluster, "retired:1") == set()
+    assert _on_nodes(cluster, "recent:1") == {"a", "b"}
+    db.expire_all()
+    assert db.get(Challenge, retired.id).image_status is None
+    assert db.get(Challenge, recent.id).image_status == ChallengeImageStatus.READY
+    assert warmer.get_stats(db)["removed"] == 2
+
+
+def test_images_still_needed_are_kept(db, cluster, warmer, pulled):
+    old = timedelta(hours=settings.IMAGE_GC_GRACE_HOURS + 1)
+    shared = pulled("retired", "shared:1", ChallengeStatus.DISABLED, old)
+    pulled("live", "shared:1", ChallengeStatus.ACTIVE, old)
+    running = pulled("running", "running:1", ChallengeStatus.INACTIVE, old)
+    # A leftover container on one node still uses the image
+    cluster.nodes["b"].client.containers.run(image="running:1", name="leftover")
+
+    warmer.resync()
+
+    # Used by an active challenge
+    assert _on_nodes(cluster, "shared:1") == {"a", "b"}
+    # Removed where unused, kept (and still tracked) where a container needs it
+    assert _on_nodes(cluster, "running:1") == {"b"}
+    db.expire_all()
+    assert db.get(Challenge, shared.id).image_status == ChallengeImageStatus.READY
+    assert db.get(Challenge, running.id).image_status == ChallengeImageStatus.READY
+
+    cluster.nodes["b"].client.containers.get("leftover").remove(force=True)
+    warmer.resync()
+    assert _on_nodes(cluster, "running:1") == set()
+    db.expire_all()
+    assert db.get(Challenge, running.id).image_status is None
@@ -0,0 +1,61 @@
+"""
+Orchestrator: deploys stranded by an exited worker are picked up again
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models.instance import Instance, InstanceStatus
+from app.services.orchestrator_service import instance_orchestrator
+
+
+def _instance(db, challenge, started_ago: int, expires_in: int, **fields) -> Instance:
+    now = datetime.utcnow()
+    instance = Instance(
+        challenge_id=challenge.id, container_name=f"recovery-{started_ago}-{expires_in}",
+        started_at=now - timedelta(seconds=started_ago), expires_at=now + timedelta(seconds=expires_in), **fields
+    )
+    db.add(instance)
+    db.commit()
+    return instance
+
+
+def _wait_idle(instance_ids, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while any(instance_orchestrator.is_pending(i) for i in instance_ids):
+        assert time.monotonic() < deadline, "orchestrator jobs did not finish"
+        time.sleep(0.05)
+
+
+def test_stale_starting_instances_are_redeployed(db, make_challenge):
+    challenge = make_challenge()
+    stale = settings.ORCHESTRATOR_RECOVERY_GRACE_SECONDS + 60
+    stranded = _instance(db, challenge, started_ago=stale, expires_in=3600, status=InstanceStatus.STARTING)
+    fresh = _instance(db, challenge, started_ago=5, expires_in=3600, status=InstanceStatus.STARTING)
+    expired = _instance(db, challenge, started_ago=stale, expires_in=-10, status=InstanceStatus.STARTING)
+    queued = _instance(db, challenge, started_ago=stale, expires_in=3600, status=InstanceStatus.QUEUED)
+
+    assert instance_orchestrator.recover_stranded() == [stranded.id]
+    _wait_idle([stranded.id])
+
+    db.expire_all()
+    assert db.get(Instance, stranded.id).status == InstanceStatus.RUNNING
+    # Fresh deploys may still be queued on a live worker; expired ones belong to the expiry scheduler
+    for untouched, status in ((fresh, InstanceStatus.STARTING), (expired, InstanceStatus.STARTING),
+                              (queued, InstanceStatus.QUEUED)):
+        assert db.get(Instance, untouched.id).status == status
+
+
+def test_recovery_claims_each_instance_once(db, make_challenge):
+    challenge = make_challenge()
+    stale = settings.ORCHESTRATOR_RECOVERY_GRACE_SECONDS + 60
+    stranded = _instance(db, challenge, started_ago=stale, expires_in=3600, status=InstanceStatus.STARTING)
+
+    first = instance_orchestrator.recover_stranded()
+    second = instance_orchestrator.recover_stranded()
+    _wait_idle(first)
+
+    # The claim restarts the grace period, so a second sweep (any worker) leaves it alone
+    assert first == [stranded.id]
+    assert second == []
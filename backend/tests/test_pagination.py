@@ -0,0 +1,58 @@
+"""
+Keyset pagination on SQLite: mixed timestamp formats and index use
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, text
+
+from app.models.log import Log, LogEventType, LogLevel
+from app.utils.pagination import paginate_keyset, split_page
+
+
+def _seed(db, count: int = 30):
+    base = datetime(2026, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(count):
+        rows.append({"event_type": LogEventType.SYSTEM_EVENT, "level": LogLevel.INFO, "message": f"log {i}",
+                     "user_id": 1, "created_at": base + timedelta(seconds=i // 3, microseconds=(i % 3) * 1000)})
+    db.execute(insert(Log.__table__), rows)
+    # As written by server_default=CURRENT_TIMESTAMP: same instants, no fractional part
+    for i in range(count, count + 5):
+        db.execute(text("INSERT INTO logs (event_type, level, message, user_id, created_at) "
+                        "VALUES ('SYSTEM_EVENT', 'INFO', :message, 1, :at)"),
+                   {"message": f"log {i}", "at": (base + timedelta(seconds=i % 4)).strftime("%Y-%m-%d %H:%M:%S")})
+    db.commit()
+
+
+def _page_query(cursor=None, limit=7):
+    return paginate_keyset(select(Log).where(Log.user_id == 1), [Log.created_at, Log.id], limit, cursor)
+
+
+def test_pages_cover_mixed_timestamp_formats_once(db):
+    _seed(db)
+
+    seen, cursor = [], None
+    while True:
+        query = _page_query(cursor)
+        rows, cursor = split_page(db.scalars(query).all(), 7, lambda log: (log.created_at, log.id))
+        seen.extend(log.id for log in rows)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == list(range(1, 36))
+    assert len(seen) == len(set(seen))
+
+
+def test_cursor_page_seeks_the_sqlite_index(db):
+    _seed(db)
+    _, cursor = split_page(db.scalars(_page_query()).all(), 7, lambda log: (log.created_at, log.id))
+
+    compiled = _page_query(cursor).compile(db.get_bind())
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    details = " | ".join(row[-1] for row in plan)
+
+    assert "ix_logs_user_created_id_sqlite" in details
+    assert "SEARCH" in details
+    assert "TEMP B-TREE" not in details
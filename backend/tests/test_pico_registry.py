@@ -0,0 +1,57 @@
+"""
+Pico registry: flag matchers are rebuilt when a challenge's pattern is edited, and only then
+"""
+
+import pytest
+
+from app.models.pico_challenge import PicoCategory, PicoChallenge, PicoDifficulty
+from app.services.pico_service import PicoRegistry
+
+
+@pytest.fixture
+def make_pico(db):
+    def make(title: str, flag_pattern: str) -> PicoChallenge:
+        challenge = PicoChallenge(title=title, category=PicoCategory.WEB_EXPLOITATION,
+                                  difficulty=PicoDifficulty.EASY, flag_pattern=flag_pattern)
+        db.add(challenge)
+        db.commit()
+        db.refresh(challenge)
+        return challenge
+
+    return make
+
+
+def test_edit_rebuilds_only_the_edited_matcher(db, make_pico):
+    edited = make_pico("edited", "picoCTF{old_*}")
+    untouched = make_pico("untouched", "picoCTF{same_*}")
+    registry = PicoRegistry()
+    assert registry.get_challenge(db, edited.id).check_flag("picoCTF{old_abc}")
+    untouched_matcher = registry.get_challenge(db, untouched.id).matcher
+
+    edited.flag_pattern = "picoCTF{new_*}"
+    db.commit()
+    db.refresh(edited)
+    assert edited.updated_at is not None
+    registry.invalidate()
+
+    entry = registry.get_challenge(db, edited.id)
+    assert entry.check_flag("picoCTF{new_abc}")
+    assert not entry.check_flag("picoCTF{old_abc}")
+    # Pattern unchanged: the compiled matcher is reused
+    assert registry.get_challenge(db, untouched.id).matcher is untouched_matcher
+
+
+def test_edits_from_another_worker_show_up_after_the_reload_interval(db, make_pico, monkeypatch):
+    challenge = make_pico("challenge", "picoCTF{old_*}")
+    registry = PicoRegistry()
+    registry.get_challenge(db, challenge.id)
+
+    # Edited elsewhere: this registry is not invalidated
+    challenge.flag_pattern = "picoCTF{new_*}"
+    db.commit()
+    assert registry.get_challenge(db, challenge.id).check_flag("picoCTF{old_abc}")
+
+    monkeypatch.setattr(PicoRegistry, "RELOAD_INTERVAL_SECONDS", -1)
+    entry = registry.get_challenge(db, challenge.id)
+    assert entry.check_flag("picoCTF{new_abc}")
+    assert not entry.check_flag("picoCTF{old_abc}")
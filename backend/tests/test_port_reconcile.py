@@ -0,0 +1,50 @@
+"""
+Port allocator: startup reconcile is single-worker and spares fresh reservations
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.core.leader_lock import LeaderLock
+from app.models.port_reservation import PortReservation
+from app.services.port_service import PortAllocator
+
+NO_DOCKER = SimpleNamespace(is_available=False)
+
+
+def _reserve(db, port: int, age: int, **fields) -> None:
+    db.add(PortReservation(port=port, reserved_at=datetime.utcnow() - timedelta(seconds=age), **fields))
+    db.commit()
+
+
+def _ports(db):
+    db.expire_all()
+    return {port for (port,) in db.query(PortReservation.port)}
+
+
+def test_reconcile_releases_only_old_orphans(db):
+    allocator = PortAllocator("30000-30010")
+    grace = settings.PORT_RECONCILE_GRACE_SECONDS
+    _reserve(db, 30000, age=grace + 60)
+    _reserve(db, 30001, age=grace + 60, container_id="gone")
+    # A warm container another worker is starting: no instance, no container id yet
+    _reserve(db, 30002, age=5)
+
+    assert allocator.reconcile(NO_DOCKER) == {"added": 0, "released": 2}
+    assert _ports(db) == {30002}
+    assert allocator.get_stats()["reserved"] == 1
+
+
+def test_reconcile_is_skipped_while_another_worker_runs_it(db):
+    allocator = PortAllocator("30000-30010")
+    _reserve(db, 30000, age=settings.PORT_RECONCILE_GRACE_SECONDS + 60)
+    other_worker = LeaderLock(PortAllocator.RECONCILE_LOCK_KEY)
+    assert other_worker.try_acquire()
+    try:
+        assert allocator.reconcile(NO_DOCKER) == {"added": 0, "released": 0}
+        assert _ports(db) == {30000}
+    finally:
+        other_worker.release()
+
+    assert allocator.reconcile(NO_DOCKER)["released"] == 1
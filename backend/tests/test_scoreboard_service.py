@@ -0,0 +1,87 @@
+"""
+Scoreboard index: ranking and cross-worker sync
+"""
+
+from sqlalchemy import event
+
+from app.models.user import UserRole, UserStatus
+from app.services.scoreboard_service import ScoreboardService
+
+
+def test_ranks_by_score_then_solves(db, make_user):
+    make_user("alice", score=300, total_solves=3)
+    bob = make_user("bob", score=300, total_solves=4)
+    carol = make_user("carol", score=100)
+    make_user("root", score=999, role=UserRole.ADMIN)
+
+    board = ScoreboardService()
+    board.rebuild(db)
+
+    assert [entry["username"] for entry in board.get_top(db)] == ["bob", "alice", "carol"]
+    assert board.get_rank(None, bob.id) == 1
+    assert board.get_rank(None, carol.id) == 3
+
+
+def test_changes_made_by_another_worker_are_picked_up(db, make_user):
+    alice = make_user("alice", score=100)
+    worker_a, worker_b = ScoreboardService(sync_seconds=0), ScoreboardService(sync_seconds=0)
+    worker_a.rebuild(db)
+    worker_b.rebuild(db)
+
+    # Registered and scored through worker A only
+    dave = make_user("dave", score=500)
+    worker_a.upsert(dave)
+    worker_b.refresh()
+
+    assert worker_b.get_rank(None, dave.id) == 1
+    assert [entry["username"] for entry in worker_b.get_around(None, dave.id, radius=1)] == ["dave", "alice"]
+
+    alice.score = 900
+    db.commit()
+    worker_b.refresh()
+    assert worker_b.get_rank(None, alice.id) == 1
+
+
+def test_deleted_and_banned_users_leave_other_workers_index(db, make_user):
+    alice = make_user("alice", score=100)
+    bob = make_user("bob", score=200)
+    board = ScoreboardService(sync_seconds=0)
+    board.rebuild(db)
+
+    bob.status = UserStatus.BANNED
+    db.commit()
+    board.refresh()
+    assert board.get_rank(None, bob.id) is None
+
+    db.delete(alice)
+    db.commit()
+    board.refresh()
+    assert board.get_summary()["ranked_users"] == 0
+
+
+def test_reads_never_touch_the_database(db, make_user, database):
+    alice_id = make_user("alice", score=100).id
+    board = ScoreboardService(sync_seconds=0)
+    # Not built yet: ranks fall back to RANK() OVER only when handed a session
+    assert board.get_rank(None, alice_id) is None
+    assert board.get_rank(db, alice_id) == 1
+    board.rebuild(db)
+    make_user("bob", score=500)
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(database, "before_cursor_execute", record)
+    try:
+        assert board.get_rank(None, alice_id) == 1
+        assert board.get_top(None)[0]["username"] == "alice"
+        assert board.get_around(None, alice_id) and board.get_summary()["ranked_users"] == 1
+    finally:
+        event.remove(database, "before_cursor_execute", record)
+    assert statements == []
+
+    # Other workers' changes arrive with the background refresh
+    board.refresh()
+    assert board.get_rank(None, alice_id) == 2
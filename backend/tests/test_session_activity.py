@@ -0,0 +1,52 @@
+"""
+Session activity: the idle check allows for activity other workers have not written yet
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from app.core.auth import _session_times_expired
+from app.core.config import settings
+from app.core.session_activity import SessionActivityTracker, session_activity
+
+
+def test_stale_local_activity_does_not_hide_newer_stored_activity():
+    tracker = SessionActivityTracker()
+    now = datetime.now(timezone.utc)
+    # This worker served the session long ago; another worker has served it since
+    tracker.touch("sid", stored=None, now=now - timedelta(hours=2))
+    stored = now - timedelta(minutes=30)
+
+    assert tracker.last_activity("sid", stored) == stored + tracker.write_lag
+
+
+def test_local_activity_wins_when_newer_than_the_write_lag():
+    tracker = SessionActivityTracker()
+    now = datetime.now(timezone.utc)
+    tracker.touch("sid", stored=None, now=now)
+
+    assert tracker.last_activity("sid", now - timedelta(hours=1)) == now
+
+
+def test_write_lag_is_threshold_plus_flush_interval():
+    tracker = SessionActivityTracker()
+    expected = settings.SESSION_ACTIVITY_WRITE_THRESHOLD_SECONDS + max(1, settings.SESSION_ACTIVITY_FLUSH_INTERVAL)
+    assert tracker.write_lag == timedelta(seconds=expected)
+    assert tracker.last_activity("unknown", None) is None
+    stored = datetime(2026, 1, 1)
+    assert tracker.last_activity("unknown", stored) == stored.replace(tzinfo=timezone.utc) + tracker.write_lag
+
+
+def test_idle_timeout_is_not_stretched_by_local_activity():
+    now = datetime.now(timezone.utc)
+    idle = timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES)
+    try:
+        # Last request served and written by this worker, just past / just inside the idle window
+        for session_id, last in (("idle", now - idle - timedelta(seconds=5)), ("active", now - idle + timedelta(seconds=5))):
+            session_activity.touch(session_id, stored=last, now=last)
+            assert session_activity.last_activity(session_id, last.replace(tzinfo=None)) == last
+
+        assert _session_times_expired("idle", None, (now - idle - timedelta(seconds=5)).replace(tzinfo=None))
+        assert not _session_times_expired("active", None, (now - idle + timedelta(seconds=5)).replace(tzinfo=None))
+    finally:
+        session_activity.forget("idle")
+        session_activity.forget("active")
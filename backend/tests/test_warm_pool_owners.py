@@ -0,0 +1,62 @@
+"""
+Warm pool: orphaned containers are found through owner heartbeats, not host/pid
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.models.warm_pool_owner import WarmPoolOwner
+from app.services.docker_service import WarmContainerPool
+from app.services.fake_docker import FakeDockerClient
+
+
+def _warm(client: FakeDockerClient, owner: str, name: str):
+    return client.containers.run(
+        image="challenge:latest", name=name,
+        labels={"managed_by": "xploitrum", WarmContainerPool.POOL_LABEL: "true", WarmContainerPool.OWNER_LABEL: owner}
+    )
+
+
+def _names(client: FakeDockerClient):
+    return {container.name for container in client.containers.list(all=True)}
+
+
+def test_reap_keeps_containers_of_live_owners_only(db):
+    client = FakeDockerClient()
+    pool = WarmContainerPool(SimpleNamespace(client=client))
+    other = WarmContainerPool(SimpleNamespace(client=client))
+    pool._heartbeat()
+    other._heartbeat()
+    db.add(WarmPoolOwner(owner_id="gone", heartbeat_at=datetime.utcnow() - timedelta(seconds=settings.WARM_POOL_OWNER_TIMEOUT + 1)))
+    db.commit()
+
+    _warm(client, pool.owner, "warm-1-mine")
+    _warm(client, other.owner, "warm-1-other")
+    _warm(client, "gone", "warm-1-gone")
+    # Pre-heartbeat label format, or a process that never got to write its row
+    _warm(client, "web-7f9c:1", "warm-1-legacy")
+    _warm(client, "gone", "warm-1-claimed").rename("instance-of-alice")
+
+    assert pool._reap_orphans() == 2
+    assert _names(client) == {"warm-1-mine", "warm-1-other", "instance-of-alice"}
+    assert {owner_id for (owner_id,) in db.query(WarmPoolOwner.owner_id)} == {pool.owner, other.owner}
+
+
+def test_owner_ids_are_unique_per_pool():
+    # Every container shares hostname and pid 1, so the owner must not be derived from them
+    owners = {WarmContainerPool(SimpleNamespace(client=None)).owner for _ in range(5)}
+    assert len(owners) == 5
+
+
+def test_retired_pool_is_reaped_by_others(db):
+    client = FakeDockerClient()
+    leaving = WarmContainerPool(SimpleNamespace(client=client))
+    staying = WarmContainerPool(SimpleNamespace(client=client))
+    leaving._heartbeat()
+    _warm(client, leaving.owner, "warm-2-leftover")
+
+    leaving._retire()
+
+    assert staying._reap_orphans() == 1
+    assert _names(client) == set()